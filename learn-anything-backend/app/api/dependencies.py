@@ -1,44 +1,37 @@
-import json
+import hmac
 from datetime import datetime
-from typing import Annotated, Dict
+from typing import Annotated, Optional
 
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException, Depends, Header
 from fastapi.security import OAuth2PasswordBearer
+from bson import ObjectId
 
 from supabase import create_client, Client
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 
-from ..core.config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+from ..core.config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, PROFILE_ADMIN_TOKEN
 from ..db.connection import db
 from ..models.user import User
 from ..models.telemetry import UserTelemetry
-from ..services.logging.logger import logger
+from ..services.logging.logger import logger, bind_log_context
 
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="supabase-auth")
 
 
-async def refresh_credentials(credentials: Dict, user_id: str) -> Credentials:
-    creds = Credentials.from_authorized_user_info(credentials)
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        await db["Tokens"].update_one(
-            {"user_id": user_id},
-            {"$set": {"credentials": json.loads(creds.to_json())}}
-        )
-    elif creds.expired:
-        raise Exception("Token expired and no refresh token available.")
-    return creds
+def get_supabase() -> Client:
+    # a dependency of its own so that load tests can override it with a local fake
+    return supabase
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
+                           auth_client: Annotated[Client, Depends(get_supabase)]):
     try:
-        response = supabase.auth.get_user(token)
+        response = auth_client.auth.get_user(token)
         if not response.user:
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         user = response.user
+        bind_log_context(user_id=user.id)
                 
         # check in redis -> if not exists -> check mongodb -> if not exists -> create
         mongo_user = await db["Users"].find_one({"user_id": user.id})
@@ -79,4 +72,18 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     except Exception as e:
         raise HTTPException(status_code=403, detail=f"Auth token validation failed: {str(e)}")
     
-CurrentUser = Annotated[object, Depends(get_current_user)]
\ No newline at end of file
+CurrentUser = Annotated[object, Depends(get_current_user)]
+
+
+async def require_workspace(user_id: str, workspace_id: str):
+    # vector indexes and ingests are keyed by the workspace id alone, the owner has to be checked before
+    if not ObjectId.is_valid(workspace_id) or not await db["Workspaces"].find_one(
+        {"_id": ObjectId(workspace_id), "user_id": user_id}, {"_id": 1}
+    ):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+
+
+async def require_profile_admin(x_profile_token: Annotated[Optional[str], Header()] = None):
+    # profiles expose internals of other users' requests, they are behind the admin token and off without it
+    if not PROFILE_ADMIN_TOKEN or not x_profile_token or not hmac.compare_digest(x_profile_token, PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiles are only available to admins")
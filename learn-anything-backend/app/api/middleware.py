@@ -0,0 +1,105 @@
+import hmac
+import time
+import uuid
+import random
+import asyncio
+from typing import Optional
+
+from ..core.config import PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_PATHS
+from ..services.logging.logger import logger, log_context
+from ..services.profiling.profiling import PROFILE_STORE, current_profile, new_profile, span
+
+REQUEST_ID_HEADER = b"x-request-id"
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+class RequestContextMiddleware:
+    """
+    Gives every request a request id (the caller's X-Request-ID when it sends one), puts it in the log context
+    of everything logged while the request is served, echoes it back in the response and logs one access line
+    with the status and duration. Plain ASGI so that streaming responses are not buffered.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = log_context.set({"request_id": request_id, "user_id": None})
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            logger.info("request", extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            })
+            log_context.reset(token)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests that ask for it (X-Profile: 1 with the admin X-Profile-Token) and a PROFILE_SAMPLE_RATE
+    share of ingestion requests. The profile id is returned in X-Profile-Id, the profile is written to
+    PROFILE_DIR once the response has been sent.
+    """
+    def __init__(self, app, rng=random.random):
+        self.app = app
+        self.rng = rng
+
+    def trigger(self, scope, headers) -> Optional[str]:
+        if headers.get(PROFILE_HEADER) == b"1":
+            token = headers.get(PROFILE_TOKEN_HEADER, b"").decode("latin-1")
+            if PROFILE_ADMIN_TOKEN and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN):
+                return "header"
+            return None
+        if PROFILE_SAMPLE_RATE > 0 and scope["path"].startswith(PROFILE_SAMPLE_PATHS) and self.rng() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trigger = self.trigger(scope, dict(scope.get("headers") or []))
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        context = log_context.get() or {}
+        profile = new_profile(scope, trigger, context.get("request_id"))
+        token = current_profile.set(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.meta["status"] = message["status"]
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER, profile.id.encode("latin-1"))]
+            await send(message)
+
+        profile.start()
+        try:
+            with span("request"):
+                await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            current_profile.reset(token)
+            profile.meta["user_id"] = context.get("user_id")
+            try:
+                await asyncio.to_thread(PROFILE_STORE.save, profile)
+            except Exception as e:
+                logger.error(f"Failed to save profile {profile.id}: {str(e)}")
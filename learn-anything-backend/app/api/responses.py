@@ -0,0 +1,28 @@
+from typing import Any, Dict
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class APIResponse(JSONResponse):
+    """
+    JSON rendered with orjson. Falls back to str for anything orjson does not know, documents read straight
+    from mongo may still carry ObjectIds.
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def stream_event(event: Dict) -> bytes:
+    return orjson.dumps(event, default=str) + b"\n"
+
+
+def sse_event(event: Dict) -> bytes:
+    return b"event: " + event["event"].encode("utf-8") + b"\ndata: " + orjson.dumps(event, default=str) + b"\n\n"
@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException
+
+from app.api.dependencies import CurrentUser
+from app.core.config import MESSAGES_PAGE_SIZE, CONVERSATION_CONTEXT_MESSAGES
+from app.models.conversation import Conversation, ConversationType, MessageRole
+from app.services.conversation.conversation_store import create_conversation, get_conversation, append_message, \
+    list_messages, load_context, save_summary, is_usage_key
+from app.services.logging.logger import logger
+from app.db.connection import db
+
+router = APIRouter(
+    prefix="/conversations",
+    tags=["conversations"]
+)
+
+
+async def owned_conversation(user: dict, conversation_id: str) -> dict:
+    conversation = await get_conversation(user["id"], conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+
+@router.post("")
+async def start_conversation(user: CurrentUser, conversation: dict):
+    workspace_id = conversation.get("workspace_id")
+    if not workspace_id or not ObjectId.is_valid(workspace_id) or not await db["Workspaces"].find_one(
+        {"_id": ObjectId(workspace_id), "user_id": user["id"]}, {"_id": 1}
+    ):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    try:
+        conversation_type = ConversationType(conversation.get("conversation_type", ConversationType.chat))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid conversation type")
+
+    conversation_id = await create_conversation(Conversation(
+        name=conversation.get("name") or "New conversation",
+        workspace_id=workspace_id,
+        user_id=user["id"],
+        source_ids=conversation.get("source_ids") or [],
+        conversation_type=conversation_type,
+        created_at=datetime.utcnow()
+    ))
+    logger.info(f"Conversation created with id: {conversation_id}")
+    return {"message": "Conversation created successfully", "data": {"conversation_id": conversation_id}}
+
+
+@router.get("/{conversation_id}/messages")
+async def get_messages(user: CurrentUser, conversation_id: str, before: Optional[int] = None, limit: int = MESSAGES_PAGE_SIZE):
+    await owned_conversation(user, conversation_id)
+    page = await list_messages(conversation_id, before, min(max(limit, 1), 200))
+    return {"message": f"Fetched {len(page['messages'])} messages", "data": page}
+
+
+@router.post("/{conversation_id}/messages")
+async def add_message(user: CurrentUser, conversation_id: str, message: dict):
+    await owned_conversation(user, conversation_id)
+    try:
+        role = MessageRole(message.get("role", MessageRole.user))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid message role")
+    if not isinstance(message.get("content"), str):
+        raise HTTPException(status_code=400, detail="Message content must be a string")
+    usage = message.get("usage")
+    if usage is not None and (not isinstance(usage, dict) or not all(is_usage_key(key) for key in usage)):
+        raise HTTPException(status_code=400, detail="Message usage must be an object without '.' or '$' in its keys")
+    saved = await append_message(conversation_id, role, message["content"], message.get("usage"))
+    return {"message": "Message added successfully", "data": saved}
+
+
+@router.get("/{conversation_id}/context")
+async def get_context(user: CurrentUser, conversation_id: str, last_n: int = CONVERSATION_CONTEXT_MESSAGES):
+    conversation = await owned_conversation(user, conversation_id)
+    context = await load_context(conversation, min(max(last_n, 1), 200))
+    return {"message": "Conversation context fetched successfully", "data": context}
+
+
+@router.put("/{conversation_id}/summary")
+async def update_summary(user: CurrentUser, conversation_id: str, checkpoint: dict):
+    await owned_conversation(user, conversation_id)
+    summary, upto_seq = checkpoint.get("summary"), checkpoint.get("upto_seq")
+    if not isinstance(summary, str) or not isinstance(upto_seq, int) or isinstance(upto_seq, bool):
+        raise HTTPException(status_code=400, detail="summary must be a string and upto_seq an integer")
+    if not await save_summary(conversation_id, summary, upto_seq):
+        raise HTTPException(status_code=409, detail="Summary checkpoint is stale or ahead of the conversation")
+    return {"message": "Conversation summary updated successfully"}
@@ -1,24 +1,28 @@
 import json
-from bson import ObjectId
-from io import BytesIO
-from typing import List
+import asyncio
+from typing import List, Optional
 from datetime import datetime
-import mimetypes
 
-from pymongo import InsertOne, UpdateOne
+from bson import ObjectId
 from fastapi import APIRouter, HTTPException, File, UploadFile, Form
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from google_auth_oauthlib.flow import Flow
 
-from app.core.registry import PROCESSOR_REGISTRY, URL_PROCESSOR, GOOGLE_DRIVE_PROCESSOR
 from app.services.discover.discover_sources import discover_additional_web_sources
+from app.services.discover.staging import stage_discovered, promote_staged
 from app.services.logging.logger import logger
-from app.api.dependencies import CurrentUser, refresh_credentials
+from app.services.ingest.ingest import ingest_steps, insert_sources, item_result, with_heartbeats, drive_credentials, \
+    upload_storage_bytes, StorageReservation
+from app.services.drive_sync.drive_sync import sync_drive, SyncInProgress
+from app.services.auth.credential_manager import CREDENTIAL_MANAGER, CredentialError
+from app.services.quota.quota import QUOTAS, QuotaExceeded
+from app.services.profiling.profiling import span
+from app.api.dependencies import CurrentUser, require_workspace
+from app.api.responses import APIResponse, STREAM_MEDIA_TYPES, stream_event, sse_event
 from app.models.workspace import Workspace
-from app.models.source import Source, Subtype
 from app.models.upload_file import FileInput
-from app.core.config import MIME_TYPE_MAP, GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI, \
-    NEXT_REDIRECT_URL
+from app.core.config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI, NEXT_REDIRECT_URL, \
+    UPLOAD_STREAM_HEARTBEAT_SECONDS
 from app.db.connection import db
 
 router = APIRouter(
@@ -114,6 +118,7 @@ async def auth_google_callback(code: str, state: str):
             {"$set": {"credentials": json.loads(credentials_json)}},
             upsert=True
         )
+        CREDENTIAL_MANAGER.store(state, credentials)
         
         # Instead of simple redirect, redirect with success status
         redirect_url = f"{NEXT_REDIRECT_URL}?connection_status=success&state={state}"
@@ -128,162 +133,166 @@ async def auth_google_callback(code: str, state: str):
 
 @router.get("/auth/google/picker-token")
 async def get_picker_token(user: CurrentUser):
-    token_doc = await db["Tokens"].find_one({"user_id": user["id"]})
-    if not token_doc or "credentials" not in token_doc:
-        raise HTTPException(status_code=401, detail="User not authenticated with Google Drive")
-
-    credentials = await refresh_credentials(token_doc["credentials"], user_id=user["id"])
+    try:
+        credentials = await CREDENTIAL_MANAGER.get(user["id"])
+    except CredentialError as e:
+        raise HTTPException(status_code=401, detail=str(e))
     return {"access_token": credentials.token}
 
 
-@router.post("/upload-files")
-async def upload_files(user: CurrentUser,
-                       workspace_id: str = Form(...),
-                       urls: str = Form(default="[]"),
-                       drive_file_ids: str = Form(default="[]"),
-                       files: List[UploadFile] = File(default=[])):
+def quota_exceeded(error: QuotaExceeded) -> HTTPException:
+    headers = {"Retry-After": str(int(error.retry_after) + 1)} if error.retry_after is not None else None
+    return HTTPException(status_code=429, detail=str(error), headers=headers)
+
+
+async def consume_ingest_quota(user_id: str, count: int):
+    try:
+        await QUOTAS.consume(user_id, "ingested_sources", count)
+    except QuotaExceeded as e:
+        raise quota_exceeded(e)
+
+
+async def consume_upload_quotas(user_id: str, files: List[UploadFile], count: int):
+    await consume_ingest_quota(user_id, count)
+    try:
+        await QUOTAS.consume(user_id, "storage_bytes", upload_storage_bytes(files))
+    except QuotaExceeded as e:
+        await QUOTAS.release(user_id, "ingested_sources", count)
+        raise quota_exceeded(e)
+
+
+def parse_upload_form(urls: str, drive_file_ids: str, files: List[UploadFile]):
     try:
         urls = json.loads(urls)
         drive_file_ids_list = json.loads(drive_file_ids)
         if not isinstance(urls, list) or not isinstance(drive_file_ids_list, list):
             raise ValueError("URLs and drive_file_ids must be lists")
-        input_data = FileInput(files=files, urls=urls)
+        return FileInput(files=files, urls=urls), drive_file_ids_list
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+
+@router.post("/upload-files")
+async def upload_files(user: CurrentUser,
+                       workspace_id: str = Form(...),
+                       urls: str = Form(default="[]"),
+                       drive_file_ids: str = Form(default="[]"),
+                       files: List[UploadFile] = File(default=[]),
+                       include: Optional[str] = None):
+    await require_workspace(user["id"], workspace_id)
+    input_data, drive_file_ids_list = parse_upload_form(urls, drive_file_ids, files)
+    include_pages = include == "pages"
+    await consume_upload_quotas(
+        user["id"], input_data.files, len(input_data.files) + len(input_data.urls) + len(drive_file_ids_list)
+    )
+
     results = []
-    # process files in the input
-    file_operations = []
-    for file in input_data.files:
+    for label, items in ingest_steps(user["id"], workspace_id, input_data.files, input_data.urls, drive_file_ids_list):
+        # every kind of source is written with one bulk insert
+        sources = []
         try:
-            # Read file content directly into memory
-            contents = BytesIO()
-            while chunk := await file.read(1024 * 1024):  # 1MB chunks
-                contents.write(chunk)
-            contents.seek(0)  # Reset pointer to start of stream
-            content = contents.getvalue()
-
-            mime_type, _ = mimetypes.guess_type(file.filename)
-            processor = PROCESSOR_REGISTRY.get(mime_type)
-
-            file_size_in_mb = round(file.size / (1024 * 1024), 2)
-            if file_size_in_mb > 20:
-                raise ValueError("File size exceeds 20MB limit")
-
-            file_type = mime_type.split("/")[-1]
-            if file_type in MIME_TYPE_MAP:
-                if file_type == "vnd.ms-excel":
-                    file_type = MIME_TYPE_MAP[file_type][1] if file.filename.endswith(".csv") else MIME_TYPE_MAP[file_type][0]
-                else:
-                    file_type = MIME_TYPE_MAP[file_type][0]
-
-            if not processor:
-                raise ValueError("Unsupported file type")
-            processing_result = await processor.process(content, file.filename)
-
-            source_metadata = Source(
-                user_id=user["id"],
-                workspace_id= workspace_id,
-                name=file.filename,
-                type=file_type,
-                size=file_size_in_mb,
-                page_count=processing_result.get("page_count", 0),
-                pages=processing_result.get("pages", []),
-                created_at=datetime.utcnow()
-            )
-            file_operations.append(
-                InsertOne(source_metadata.model_dump())
-            )
-            results.append({
-                "filename": file.filename,
-                "page_count": processing_result.get("page_count", 0),
-                "processing_result": processing_result
-            })
-        except Exception as e:
-            results.append({"filename": file.filename, "error": f"Processing failed: {str(e)}"})
-        finally:
-            await file.close()
-    if file_operations:
-        logger.info(f"Inserting {len(file_operations)} file sources into the database")
-        await db["Sources"].bulk_write(file_operations)
-
-    # process URLS in the input
-    url_operations = []
-    for url in input_data.urls:
-        # try:
-        url = str(url)
-        processing_result = await URL_PROCESSOR.process(url, url)
-        source_metadata = Source(
-            user_id=user["id"],
-            workspace_id=workspace_id,
-            name=url,
-            type=Subtype.url,
-            size=0,
-            page_count=processing_result.get("page_count", 0),
-            pages=processing_result.get("pages", []),
-            created_at=datetime.utcnow()
-        )
-        url_operations.append(
-            InsertOne(source_metadata.model_dump())
-        )
-        results.append({
-            "filename": url,
-            "page_count": processing_result.get("page_count", 0),
-            "processing_result": processing_result
+            async for item in items:
+                if item[1] is not None:
+                    sources.append(item[1])
+                results.append(item_result(item, include_pages))
+        except asyncio.CancelledError:
+            # a shutting down worker ran out of grace time, keep what was parsed so it is not lost with the request
+            logger.warning(f"Upload cancelled, saving {len(sources)} parsed {label} sources")
+            await asyncio.shield(insert_sources(sources, label))
+            raise
+        with span("persist"):
+            await insert_sources(sources, label)
+
+    # returned as a response object so that page payloads (include=pages) skip fastapi's jsonable_encoder walk
+    with span("render"):
+        return APIResponse({
+            "message": f"{len(input_data.files)} files uploaded successfully",
+            "data": results
         })
-        # except Exception as e:
-        #     logger.info(f"URL processing failed. Reason: {str(e)}")
-        #     results.append({"filename": url, "error": f"Processing failed: {str(e)}"})
-    if url_operations:
-        logger.info(f"Inserting {len(url_operations)} URL sources into the database")
-        await db["Sources"].bulk_write(url_operations)
-
-    if drive_file_ids_list:
+
+
+@router.post("/upload-files/stream")
+async def upload_files_stream(user: CurrentUser,
+                              workspace_id: str = Form(...),
+                              urls: str = Form(default="[]"),
+                              drive_file_ids: str = Form(default="[]"),
+                              files: List[UploadFile] = File(default=[]),
+                              include: Optional[str] = None,
+                              format: str = "ndjson"):
+    """
+    Same input as /upload-files, but every source is persisted and sent as soon as it is parsed. Events are
+    `start`, `source` (the upload result), `progress`, `heartbeat` (while a slow source is being parsed) and
+    `done`, as NDJSON lines or, with format=sse, as server-sent events.
+    """
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+    await require_workspace(user["id"], workspace_id)
+    input_data, drive_file_ids_list = parse_upload_form(urls, drive_file_ids, files)
+    include_pages = include == "pages"
+    total = len(input_data.files) + len(input_data.urls) + len(drive_file_ids_list)
+    await consume_upload_quotas(user["id"], input_data.files, total)
+    encode = stream_event if format == "ndjson" else sse_event
+
+    async def events():
+        done = 0
+        storage = StorageReservation(user["id"], input_data.files)
+        steps = ingest_steps(user["id"], workspace_id, input_data.files, input_data.urls, drive_file_ids_list, storage)
         try:
-            token_doc = await db["Tokens"].find_one({"user_id": user["id"]})
-            if not token_doc or "credentials" not in token_doc:
-                raise ValueError("User not authenticated with Google Drive")
-
-            credentials = token_doc["credentials"]
-            credentials = await refresh_credentials(credentials, user["id"])
-
-            processing_results = await GOOGLE_DRIVE_PROCESSOR.process(drive_file_ids_list, credentials.to_json())
-            drive_operations = []
-            for result in processing_results:
-                if "error" in result:
-                    results.append(result)
-                    continue
-
-                source_metadata = Source(
-                    user_id=user["id"],
-                    workspace_id=workspace_id,
-                    name=result["filename"],
-                    type=Subtype.drive,
-                    size=0,
-                    page_count=result.get("page_count", 0),
-                    pages=result.get("pages", []),
-                    created_at=datetime.utcnow()
-                )
-                drive_operations.append(
-                    InsertOne(source_metadata.model_dump())
-                )
-                results.append({
-                    "filename": result["filename"],
-                    "page_count": result.get("page_count", 0),
-                    "processing_result": result
-                })
-
-            if drive_operations:
-                logger.info(f"Inserting {len(drive_operations)} Google Drive sources into the database")
-                await db["Sources"].bulk_write(drive_operations)
-
-        except Exception as e:
-            results.append({"filename": "google_drive_files", "error": f"Processing failed: {str(e)}"})
+            yield encode({"event": "start", "total": total})
+            for label, items in steps:
+                async for item in with_heartbeats(items, UPLOAD_STREAM_HEARTBEAT_SECONDS):
+                    if item is None:
+                        yield encode({"event": "heartbeat", "done": done, "total": total})
+                        continue
+                    if item[1] is not None:
+                        with span("persist"):
+                            await insert_sources([item[1]], label)
+                    done += 1
+                    yield encode({"event": "source", "data": item_result(item, include_pages)})
+                    yield encode({"event": "progress", "done": done, "total": total})
+            yield encode({"event": "done", "done": done, "total": total})
+        finally:
+            # the client went away mid stream, the sources that were never reached are not charged
+            await QUOTAS.release(user["id"], "ingested_sources", total - done)
+            await storage.release_unsettled()
+
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        # proxies such as nginx would otherwise buffer the stream until it ends
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    return {
-        "message": f"{len(input_data.files)} files uploaded successfully",
-        "data": results
-    }
+
+@router.post("/drive-sync")
+async def drive_sync(user: CurrentUser,
+                     workspace_id: str,
+                     drive_file_ids: List[str],
+                     include: Optional[str] = None):
+    """
+    Imports the picked Drive files and folders into the workspace. Calling it again with the same ids only
+    re-parses what changed in Drive since the last call and removes the sources of deleted files.
+    """
+    await require_workspace(user["id"], workspace_id)
+    try:
+        credentials_json = await drive_credentials(user["id"])
+    except CredentialError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    # a user over the quota is turned away before anything is listed, what the sync costs is only known after it:
+    # a folder holds any number of files and an incremental sync may parse none
+    await consume_ingest_quota(user["id"], 1)
+    try:
+        outcome = await sync_drive(user["id"], workspace_id, drive_file_ids, credentials_json, include == "pages")
+    except SyncInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    finally:
+        await QUOTAS.release(user["id"], "ingested_sources", 1)
+    await QUOTAS.charge(user["id"], "ingested_sources", outcome["parsed"])
+    await QUOTAS.charge(user["id"], "storage_bytes", outcome["storage_bytes"])
+    return APIResponse({
+        "message": f"{outcome['parsed']} Google Drive files synced, {outcome['removed']} removed",
+        "data": outcome
+    })
 
 
 @router.post("/get-storage-capacity")
@@ -291,7 +300,7 @@ async def get_storage_capacity(user: CurrentUser, workspace_id: str):
     # Get the total size of all files in the workspace
     total_size = 0
     total_sources = 0
-    async for file in db["Sources"].find({"user_id": user["id"], "workspace_id": workspace_id}):
+    async for file in db["Sources"].find({"user_id": user["id"], "workspace_id": workspace_id}, {"size": 1}):
         total_sources += 1
         total_size += file.get("size", 0)
 
@@ -305,73 +314,51 @@ async def get_storage_capacity(user: CurrentUser, workspace_id: str):
 
 @router.post("/discover-sources")
 async def discover_web_sources(user: CurrentUser, workspace_id: str, query: str):
+    await require_workspace(user["id"], workspace_id)
     # some guardrails to check if user is not exploiting this functionality
-    user_discover_usage = await db["UserTelemetry"].find_one({"user_id": user["id"]})
-    if user_discover_usage:
-        if user_discover_usage["discover_queries_made"] > 5:
-            raise HTTPException(status_code=403, detail="You have reached the limit of 5 queries per day")
+    try:
+        await QUOTAS.consume(user["id"], "discover_queries")
+    except QuotaExceeded as e:
+        raise quota_exceeded(e)
 
-    # update the discover usage count
+    # lifetime discover usage, the quota above is what limits it
     await db["UserTelemetry"].update_one(
         {"user_id": user["id"]},
         {"$inc": {"discover_queries_made": 1}}
     )
 
     try:
-        discovered_sources_map = []
-        operations = []
         discovered_sources = await discover_additional_web_sources(query)
-        for source in discovered_sources:
-            for result in source["sources"]:
-                curr_discovered_src_id = ObjectId()
-                discovered_sources_map.append({str(curr_discovered_src_id): result["url"]})
-                source_metadata = Source(
-                    user_id=user["id"],
-                    workspace_id=workspace_id,
-                    name=result["title"],
-                    type=Subtype.discovered,
-                    size=0.0,
-                    page_count=1,
-                    pages=[{
-                        "page_number": 1,
-                        "text": result["text"],
-                        "url": result["url"],
-                        "author": result["author"],
-                        "tables": [],
-                        "images": []
-                    }],
-                    usage=source["usage"],
-                    batch_id=source["batch_id"],  # this is only for discovered src to filter them during finalization
-                    created_at=datetime.utcnow()
-                )
-                source_to_insert = {"_id": curr_discovered_src_id, **source_metadata.model_dump()}
-                operations.append(InsertOne(source_to_insert))
-
-        if operations:
-            logger.info(f"Inserting {len(operations)} discovered sources into the database")
-            await db["Sources"].bulk_write(operations)
-
+        batch_id, discovered_sources_map = await stage_discovered(user["id"], workspace_id, discovered_sources)
     except Exception as e:
         logger.error(f"Error in discover sources: {str(e)}")
+        # a failed search does not count against the daily queries
+        await QUOTAS.release(user["id"], "discover_queries", 1)
         raise HTTPException(status_code=500, detail="Error in discovering sources")
 
-
     return {
         "message": f"{len(discovered_sources_map)} Sources discovered successfully",
+        "batch_id": batch_id,
         "data": discovered_sources_map
     }
 
 
-
 @router.post("/finalize-discovered-sources")
 async def finalize_discovered_sources(user: CurrentUser, workspace_id: str, batch_id: str, source_ids: List[str]):
-    removed_sources = await db["Sources"].delete_many(
-        {"user_id": user["id"], "workspace_id": workspace_id, "batch_id": batch_id},
-        {"_id": {"$nin": [ObjectId(src_id) for src_id in source_ids]}}
-    )
-    logger.info(f"Removed {removed_sources.deleted_count} discovered sources from the database")
-    return {"message": "Selected discovered sources finalized successfully"}
+    await require_workspace(user["id"], workspace_id)
+    if not all(ObjectId.is_valid(source_id) for source_id in source_ids):
+        raise HTTPException(status_code=400, detail="source_ids must be ids returned by /discover-sources")
+    promoted = await promote_staged(user["id"], workspace_id, batch_id, source_ids)
+    logger.info("Finalized %d of %d selected discovered sources", len(promoted), len(source_ids))
+    return {
+        "message": "Selected discovered sources finalized successfully",
+        "data": [str(source["_id"]) for source in promoted]
+    }
+
 
+@router.get("/quotas")
+async def get_quotas(user: CurrentUser):
+    return {"message": "Quotas fetched successfully", "data": await QUOTAS.usage_of(user["id"])}
 
 
 @router.get("/sources")
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import FileResponse
+
+from app.api.dependencies import require_profile_admin
+from app.services.profiling.profiling import PROFILE_STORE
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"],
+    dependencies=[Depends(require_profile_admin)]
+)
+
+MEDIA_TYPES = {"json": "application/json", "html": "text/html", "pstats": "application/octet-stream"}
+
+
+@router.get("")
+async def list_profiles():
+    profiles = PROFILE_STORE.list()
+    return {"message": f"Found {len(profiles)} profiles", "data": profiles}
+
+
+@router.get("/{profile_id}/download")
+async def download_profile(profile_id: str, format: str = "json"):
+    """
+    `json` is the span report, `html` the pyinstrument flamegraph view, `pstats` the cProfile dump.
+    """
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be json, html or pstats")
+    path = PROFILE_STORE.path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=MEDIA_TYPES[format], filename=f"profile-{profile_id}.{format}")
@@ -1,9 +1,71 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form
+from typing import List, Optional
 
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Query
+from fastapi.responses import Response
+
+from app.api.dependencies import CurrentUser, require_workspace
+from app.core.config import SEARCH_DEFAULT_LIMIT, RETRIEVAL_DEFAULT_K
+from app.services.search.search_index import search_pages
+from app.services.retrieval.retrieval import retrieve
+from app.services.blobs.blob_store import PDF_IMAGES, IMAGE_VARIANTS, MEDIA_TYPES
 from app.db.connection import db
 from pymongo import InsertOne
 
 router = APIRouter(
     prefix="/workspaces",
     tags=["workspaces"]
-)
\ No newline at end of file
+)
+
+
+@router.get("/{workspace_id}/search")
+async def search_workspace(
+        user: CurrentUser,
+        workspace_id: str,
+        query: str,
+        limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=100)
+):
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Search query cannot be empty")
+    hits = await search_pages(user["id"], workspace_id, query, limit)
+    return {"message": f"Found {len(hits)} matching pages", "data": hits}
+
+
+@router.get("/{workspace_id}/retrieve")
+async def retrieve_chunks(
+        user: CurrentUser,
+        workspace_id: str,
+        query: str,
+        k: int = Query(RETRIEVAL_DEFAULT_K, ge=1, le=50),
+        source_ids: Optional[List[str]] = Query(default=None)
+):
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Retrieval query cannot be empty")
+    await require_workspace(user["id"], workspace_id)
+    chunks = await retrieve(workspace_id, query, k, source_ids)
+    return {"message": f"Retrieved {len(chunks)} chunks", "data": chunks}
+
+
+@router.get("/{workspace_id}/sources/{source_id}/images/{xref}")
+async def source_image(user: CurrentUser, workspace_id: str, source_id: str, xref: int, variant: str = "image"):
+    """
+    An image of a pdf ingested in lazy mode (the `xref` of one of its page images), `variant` is image or
+    thumbnail. Extracted on the first request, served from the cache afterwards.
+    """
+    if variant not in IMAGE_VARIANTS:
+        raise HTTPException(status_code=400, detail="variant must be image or thumbnail")
+    if not ObjectId.is_valid(source_id) or not await db["Sources"].find_one(
+        {"_id": ObjectId(source_id), "workspace_id": workspace_id, "user_id": user["id"], "pages.images.xref": xref},
+        {"_id": 1}
+    ):
+        raise HTTPException(status_code=404, detail="Image not found")
+    image = await PDF_IMAGES.get(source_id, xref, variant)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data, image_format = image
+    # an xref never changes within a stored pdf, the bytes behind the url are immutable
+    return Response(
+        data,
+        media_type=MEDIA_TYPES.get(image_format, "application/octet-stream"),
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
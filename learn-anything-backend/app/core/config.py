@@ -4,8 +4,21 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # system configs
-UVICORN_HOST = "0.0.0.0"
-UVICORN_PORT = 8000
+UVICORN_HOST = os.getenv("HOST", "0.0.0.0")
+UVICORN_PORT = int(os.getenv("PORT", "8000"))
+
+# production serving (python -m app.serve): worker processes, defaulting to one per core, and how long a worker
+# that got SIGTERM may keep serving the requests (ingests) it already accepted
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0")) or os.cpu_count() or 1
+SERVE_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("SERVE_GRACEFUL_TIMEOUT_SECONDS", "120"))
+SERVE_WORKER_TIMEOUT_SECONDS = 300
+SERVE_KEEPALIVE_SECONDS = 5
+READINESS_TIMEOUT_SECONDS = 2
+
+# logging, LOG_LEVELS sets single loggers, e.g. "pymongo=WARNING,httpx=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
 
 # GOOGLE CREDENTIALS
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
@@ -23,13 +36,161 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "LearnDB")
 
 # Eleven labs keys
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_MAX_CONCURRENCY = int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", 4))
+
+# long audio is split into segments near this duration, cutting at the quietest point found close to the boundary
+AUDIO_SEGMENT_SECONDS = 300
+AUDIO_SILENCE_SEARCH_SECONDS = 30
+AUDIO_MIN_SILENCE_MS = 400
+# smaller files are sent as they are without decoding them, about AUDIO_SEGMENT_SECONDS of 128 kbps mp3
+AUDIO_SPLIT_MIN_BYTES = 5 * 1024 * 1024
+
+# plain text (and url) content is chunked on paragraph / sentence boundaries towards this size
+TEXT_CHUNK_CHARS = 4000
+TEXT_CHUNK_OVERLAP_CHARS = 0
+CHARS_PER_TOKEN = 4  # rough estimate used when a chunk target is given in tokens
+
+# docx files are paginated at heading boundaries, a page is closed once it grows past DOCX_PAGE_CHARS
+DOCX_PAGE_CHARS = 500
+DOCX_HEADING_BREAK_MIN_CHARS = 200
+# decks with at least this many slides are split over a process pool, smaller ones are not worth the startup
+PPTX_PARALLEL_MIN_SLIDES = 150
+PPTX_MAX_WORKERS = min(os.cpu_count() or 1, 4)
+# legacy .doc files are converted to .docx with libreoffice before processing
+LIBREOFFICE_BINARY = os.getenv("LIBREOFFICE_BINARY", "soffice")
+DOC_CONVERSION_TIMEOUT_SECONDS = 120
 
 # LLM api keys
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# images are sent to gemini in groups bounded by these limits, oversized ones are downscaled / recompressed first
+IMAGE_BATCH_MAX_BYTES = 8 * 1024 * 1024
+IMAGE_BATCH_MAX_COUNT = 16
+IMAGE_MAX_INLINE_BYTES = 1536 * 1024
+IMAGE_MAX_DIMENSION = 2048
+IMAGE_JPEG_QUALITY = 85
+
+# local ocr (tesseract through pytesseract, optional) reads images before gemini does. Images with fewer than
+# OCR_MIN_WORDS words (photos, diagrams), a mean word confidence below OCR_MIN_CONFIDENCE or at least
+# OCR_TABLE_MIN_ROWS rows of column aligned words are escalated to gemini
+OCR_WORKERS = min(os.cpu_count() or 1, 4)
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_MIN_WORDS = 12
+OCR_MIN_CONFIDENCE = 80
+OCR_TABLE_MIN_ROWS = 3
+OCR_TIMEOUT_SECONDS = 60
+# "lazy" pdf ingest only records where every image is (xref, page, bbox, size) and keeps the original pdf in gridfs,
+# images are extracted and cached the first time they are requested. "eager" extracts and stores them at ingest
+PDF_IMAGE_MODE = os.getenv("PDF_IMAGE_MODE", "lazy")
+# extracted images and recently opened originals kept in process, on top of the gridfs cache
+BLOB_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# pdf pages with less text than this, whose images cover at least PDF_SCAN_MIN_IMAGE_COVERAGE of the page, are
+# treated as scans and rendered for ocr. A logo or an icon on an otherwise empty page is not a scan
+PDF_SCANNED_MAX_CHARS = 20
+PDF_SCAN_MIN_IMAGE_COVERAGE = 0.6
+PDF_SCAN_DPI = 200
+
+# images extracted from documents and web pages are normalised before they are stored
+# smaller than IMAGE_MIN_PIXELS (width * height) is treated as decoration (bullets, spacers, icons) and dropped
+IMAGE_PIPELINE_WORKERS = min(os.cpu_count() or 1, 4)
+IMAGE_MIN_PIXELS = 48 * 48
+IMAGE_STORE_MAX_DIMENSION = 1600
+IMAGE_STORE_FORMAT = os.getenv("IMAGE_STORE_FORMAT", "WEBP")  # "WEBP" or "JPEG"
+IMAGE_STORE_QUALITY = 80
+IMAGE_THUMBNAIL_SIZE = 256
+IMAGE_THUMBNAIL_QUALITY = 60
+
 # Exa api key - for the web search
 EXA_API_KEY = os.getenv("EXA_API_KEY")
 
+# retry, rate limit and circuit breaker settings for every external provider
+# rate is in requests per second, burst is the token bucket size
+# after `failure_threshold` consecutive failures the provider is skipped for `reset_timeout` seconds
+# "web" covers arbitrary websites, its limits apply to every host on its own
+PROVIDER_LIMITS = {
+    "gemini": {"rate": 4, "burst": 8, "max_retries": 3, "failure_threshold": 5, "reset_timeout": 30},
+    "elevenlabs": {"rate": 2, "burst": 4, "max_retries": 2, "failure_threshold": 5, "reset_timeout": 30},
+    "exa": {"rate": 5, "burst": 5, "max_retries": 2, "failure_threshold": 5, "reset_timeout": 60},
+    "google_drive": {"rate": 10, "burst": 20, "max_retries": 3, "failure_threshold": 10, "reset_timeout": 30},
+    "google_oauth": {"rate": 5, "burst": 10, "max_retries": 2, "failure_threshold": 5, "reset_timeout": 30},
+    "web": {"rate": 5, "burst": 10, "max_retries": 2, "failure_threshold": 5, "reset_timeout": 15},
+}
+PER_HOST_PROVIDERS = {"web"}
+HOST_GUARDS_MAX = 1024
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 30
+
+# full text search over the pages of a workspace
+SEARCH_MAX_PAGE_CHARS = 100_000  # text indexed per page, long table dumps are truncated
+SEARCH_SNIPPET_CHARS = 160
+SEARCH_DEFAULT_LIMIT = 20
+
+# near duplicate pages, minhash signatures of word shingles banded into an lsh index per workspace. With 16 bands
+# of 8 rows pages above ~0.7 jaccard similarity become candidates, DEDUP_THRESHOLD decides on the estimate
+DEDUP_NUM_PERMUTATIONS = 128
+DEDUP_BANDS = 16
+DEDUP_SHINGLE_WORDS = 5
+DEDUP_THRESHOLD = 0.8
+DEDUP_MIN_WORDS = 30  # shorter pages (title slides, captions) are too generic to call duplicates
+
+# semantic retrieval, chunks of every page are embedded at ingest into a per workspace vector index
+EMBEDDER = os.getenv("EMBEDDER", "hashing")  # "hashing" (deterministic, no model) or "sentence-transformers"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+HASHING_EMBEDDING_DIMENSION = 384
+EMBEDDING_BATCH_SIZE = 64
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "int8")  # "int8" or "float16"
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "data/vector_index")
+VECTOR_INDEX_CACHE_SIZE = 64  # workspace indexes kept in memory per worker
+RETRIEVAL_CHUNK_TOKENS = 256
+RETRIEVAL_CHUNK_OVERLAP_CHARS = 100
+RETRIEVAL_DEFAULT_K = 8
+# workspaces above this many chunks are partitioned into sqrt(n) ivf lists, queries scan IVF_PROBES of them
+IVF_MIN_VECTORS = 50_000
+IVF_PROBES = 8
+
+# conversations, messages live in their own collection and prompts load the summary plus the latest turns
+MESSAGES_PAGE_SIZE = 50
+CONVERSATION_CONTEXT_MESSAGES = 20
+
+# responses above this size are gzip (or brotli, when brotli-asgi is installed) compressed
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 4
+
+# the streaming upload endpoint sends a heartbeat whenever a source takes longer than this to parse
+UPLOAD_STREAM_HEARTBEAT_SECONDS = 10
+
+# a drive sync holds its workspace for at most this long, a crashed worker's claim expires after it
+DRIVE_SYNC_LOCK_SECONDS = 15 * 60
+
+# google oauth credentials are cached per user and refreshed in the background this long before they expire
+CREDENTIAL_REFRESH_MARGIN_SECONDS = 300
+CREDENTIAL_REFRESH_CHECK_SECONDS = 60
+CREDENTIAL_CACHE_MAX_USERS = 10_000
+
+# discover results wait in a staging collection until the user picks the ones to keep, unpicked batches expire
+DISCOVER_STAGING_TTL_SECONDS = 24 * 60 * 60
+DISCOVER_PROMOTE_CLAIM_SECONDS = 10 * 60  # a finalize that died this long ago no longer holds its sources
+
+# per user quotas, counted atomically in mongo. `limit` is per `window_seconds` (fixed utc aligned windows, no
+# window means a running total), `rate` / `burst` add an in-process token bucket in front of the counter
+QUOTA_LIMITS = {
+    "discover_queries": {"limit": 5, "window_seconds": 24 * 60 * 60},
+    "storage_bytes": {"limit": 1024 * 1024 * 1024},
+    "ingested_sources": {"limit": 300, "window_seconds": 60 * 60, "rate": 1, "burst": 30},
+}
+QUOTA_CACHE_SECONDS = 30  # how long a process trusts its last known usage before asking mongo again
+QUOTA_CACHE_MAX_ENTRIES = 50_000
+
+# profiling, a request is profiled when it sends X-Profile: 1 with X-Profile-Token set to PROFILE_ADMIN_TOKEN,
+# or when it is one of the PROFILE_SAMPLE_RATE share of ingestion requests. Profiles are kept in PROFILE_DIR
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_PATHS = ("/onboarding/upload-files", "/onboarding/drive-sync")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_KEEP = 50
+PROFILE_TRACE_MEMORY = os.getenv("PROFILE_TRACE_MEMORY", "true").lower() == "true"
+
 # this mime type map is to map the actual file-type inside the mongodb document instead of keeping their extensions
 MIME_TYPE_MAP = {
     "vnd.ms-excel": ["xls", "csv"],
@@ -30,14 +30,16 @@ def initialize_registry():
         "text/csv": CSVProcessor(),
         "application/vnd.ms-excel": CSVProcessor(),
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": XLSXProcessor(),
-        "audio/mpeg": AudioProcessor(),
-        "audio/wav": AudioProcessor(),
-        "image/jpeg": ImageProcessor(),
-        "image/png": ImageProcessor(),
+        "audio/mpeg": AUDIO_PROCESSOR,
+        "audio/wav": AUDIO_PROCESSOR,
+        "image/jpeg": IMAGE_PROCESSOR,
+        "image/png": IMAGE_PROCESSOR,
         "video/mp4": VideoProcessor(),
     })
 
 URL_PROCESSOR = URLProcessor()
+IMAGE_PROCESSOR = ImageProcessor()  # one instance for every image mime type so uploads can be batched together
+AUDIO_PROCESSOR = AudioProcessor()  # one instance for every audio mime type so they share the elevenlabs limit
 GOOGLE_DRIVE_PROCESSOR = GoogleDriveProcessor()
 initialize_registry()
 
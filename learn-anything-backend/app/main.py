@@ -1,14 +1,51 @@
 import uvicorn
 import datetime
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from .api.routers.onboarding import router as onboarding_router
-from .core.config import UVICORN_HOST, UVICORN_PORT
+from .api.routers.workspaces import router as workspaces_router
+from .api.routers.conversations import router as conversations_router
+from .api.routers.profiles import router as profiles_router
+from .api.responses import APIResponse
+from .api.middleware import RequestContextMiddleware, ProfilingMiddleware
+from .core.config import UVICORN_HOST, UVICORN_PORT, RESPONSE_COMPRESSION_MIN_BYTES, RESPONSE_GZIP_LEVEL, \
+    RESPONSE_BROTLI_QUALITY
+from .services.resilience.resilience import provider_states
+from .services.search.search_index import ensure_search_indexes
+from .services.conversation.conversation_store import ensure_conversation_indexes
+from .services.drive_sync.drive_sync import ensure_drive_sync_indexes
+from .services.discover.staging import ensure_discover_indexes
+from .services.quota.quota import ensure_quota_indexes
+from .services.dedup.dedup import ensure_dedup_indexes
+from .services.blobs.blob_store import ensure_blob_indexes
+from .services.auth.credential_manager import CREDENTIAL_MANAGER
+from .services.lifecycle.lifecycle import readiness, shutdown_pools
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_search_indexes()
+    await ensure_conversation_indexes()
+    await ensure_drive_sync_indexes()
+    await ensure_discover_indexes()
+    await ensure_quota_indexes()
+    await ensure_dedup_indexes()
+    await ensure_blob_indexes()
+    CREDENTIAL_MANAGER.start()
+    yield
+    await CREDENTIAL_MANAGER.stop()
+    shutdown_pools()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=APIResponse)
 app.include_router(onboarding_router)
+app.include_router(workspaces_router)
+app.include_router(conversations_router)
+app.include_router(profiles_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,11 +57,48 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+try:
+    # brotli is optional, it falls back to gzip for clients that do not accept br
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=RESPONSE_BROTLI_QUALITY,
+        minimum_size=RESPONSE_COMPRESSION_MIN_BYTES,
+        gzip_fallback=True
+    )
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES, compresslevel=RESPONSE_GZIP_LEVEL)
+
+app.add_middleware(ProfilingMiddleware)
+# outermost, so that the access line covers compression and cors as well
+app.add_middleware(RequestContextMiddleware)
+
+
+@app.get("/live")
+async def liveness():
+    # the process and its event loop answer, restart it when this fails
+    return {"status": 200, "message": f"Current Time: {datetime.datetime.now()}. Application is up and running"}
+
 
 @app.get("/smoke")
 async def smoke_test():
-    return {"status": 200, "message": f"Current Time: {datetime.datetime.now()}. Application is up and running"}
+    # readiness, take the worker out of rotation (without restarting it) while this fails
+    ready, checks = await readiness()
+    return APIResponse(
+        {"status": 200 if ready else 503, "message": "Ready" if ready else "Not ready", "data": checks},
+        status_code=200 if ready else 503
+    )
+
+
+@app.get("/provider-status")
+async def provider_status():
+    # circuit state, retry counts and available rate limit tokens of every external provider in this process
+    return {
+        "message": "Provider status fetched successfully",
+        "data": {**provider_states(), "google_credentials": CREDENTIAL_MANAGER.state()}
+    }
 
 
 if __name__ == "__main__":    
-    uvicorn.run(app, host=UVICORN_HOST, port=UVICORN_PORT)
+    # development server, production runs `python -m app.serve`. Requests are logged by RequestContextMiddleware
+    uvicorn.run(app, host=UVICORN_HOST, port=UVICORN_PORT, access_log=False)
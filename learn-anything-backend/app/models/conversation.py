@@ -10,13 +10,30 @@ class ConversationType(str, Enum):
     chat = 'chat'
 
 
+class MessageRole(str, Enum):
+    user = 'user'
+    assistant = 'assistant'
+    system = 'system'
+
+
 class Conversation(BaseModel):
     name: str
     overview: Optional[Union[str, None]] = None
     workspace_id: str
     user_id: str
-    source_ids: List[str] = Field(..., description="List of source IDs associated with this conversation", default_factory=[])
-    history: List[dict] = Field(..., description="Overall conversation history, may or may not be summarized based on length", default_factory=[])
-    usage: dict = Field(..., description="LLM usage stats for this conversation", default_factory={})
-    conversation_type: str = ConversationType
-    created_at: datetime
\ No newline at end of file
+    source_ids: List[str] = Field(description="List of source IDs associated with this conversation", default_factory=list)
+    message_count: int = Field(description="Messages are stored in the Messages collection, this is the seq of the last one", default=0)
+    summary: Optional[str] = Field(description="Rolling summary of every message up to summary_seq", default=None)
+    summary_seq: int = Field(description="Seq of the last message folded into the summary", default=0)
+    usage: dict = Field(description="LLM usage stats for this conversation, incremented with every message", default_factory=dict)
+    conversation_type: ConversationType = ConversationType.chat
+    created_at: datetime
+
+
+class Message(BaseModel):
+    conversation_id: str
+    seq: int = Field(description="1 based position of the message inside its conversation")
+    role: MessageRole
+    content: str
+    usage: dict = Field(description="LLM usage stats of this message only", default_factory=dict)
+    created_at: datetime
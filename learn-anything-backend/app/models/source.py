@@ -2,7 +2,8 @@ from enum import Enum
 from datetime import datetime
 
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Union
+from typing_extensions import TypedDict
 
 
 class Subtype(str, Enum):
@@ -26,6 +27,32 @@ class Subtype(str, Enum):
     png = 'png'
 
 
+# contract of the pages produced by the processors, not validated at runtime (see Source.document)
+class Image(TypedDict, total=False):
+    format: str
+    data: str
+    thumbnail: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    hash: str
+    ref_page: int
+    # lazily ingested pdf images have no data, they are fetched by xref from /workspaces/.../images/{xref}
+    xref: int
+    bbox: List[float]
+    lazy: bool
+
+
+class Page(TypedDict, total=False):
+    page_number: int
+    text: str
+    # pdf / docx / pptx tables are lists of rows, csv / xlsx tables are {"columns": [...], "rows": [{...}]}
+    tables: List[Union[List[List[Any]], Dict[str, Any]]]
+    images: List[Image]
+    notes: str
+    description: str
+    transcript: str
+
+
 class Source(BaseModel):
     user_id: str
     workspace_id: str
@@ -36,5 +63,17 @@ class Source(BaseModel):
     pages: List[Dict]
     usage: Optional[Dict] = {}
     batch_id: Optional[str] = None
+    url: Optional[str] = None  # web and discovered sources, used to skip urls the workspace already has
     created_at: datetime
 
+    @classmethod
+    def document(cls, pages: List[Page], **metadata) -> Dict:
+        """
+        BSON ready source document. The metadata fields are validated by the model, the pages come from the
+        processors and are attached as they are instead of being validated and copied twice.
+        """
+        if not isinstance(pages, list) or not all(isinstance(page, dict) for page in pages):
+            raise ValueError("Source pages must be a list of page dicts")
+        source = cls(pages=[], **metadata).model_dump()
+        source["pages"] = pages
+        return source
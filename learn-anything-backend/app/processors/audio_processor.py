@@ -1,40 +1,180 @@
+import os
+import asyncio
 from io import BytesIO
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 from elevenlabs.client import ElevenLabs
+from pydub import AudioSegment
+from pydub.silence import detect_silence
 
 from .base import FileProcessor
-from ..core.config import ELEVENLABS_API_KEY
+from ..core.config import ELEVENLABS_API_KEY, ELEVENLABS_MAX_CONCURRENCY, AUDIO_SEGMENT_SECONDS, \
+    AUDIO_SILENCE_SEARCH_SECONDS, AUDIO_MIN_SILENCE_MS, AUDIO_SPLIT_MIN_BYTES
+from ..services.logging.logger import logger
+from ..services.resilience.resilience import get_guard
+
+# shared by every upload (and every AudioProcessor) so the provider never sees more than N transcriptions
+# from this process
+TRANSCRIPTION_SLOTS = asyncio.Semaphore(ELEVENLABS_MAX_CONCURRENCY)
 
 
 class AudioProcessor(FileProcessor):
     def __init__(self):
         self.client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
 
-    async def process(self, content: bytes, filename: str, mime_type: str = "audio/mpeg") -> Dict:
-        try:
-            audio_data = BytesIO(content)
-            pages = []
-            page_counter = 1
-
-            transcription = self.client.speech_to_text.convert(
-                file=audio_data,
-                model_id="scribe_v1",
-                tag_audio_events=True,
-                diarize=True
+    @staticmethod
+    def find_boundaries(audio: AudioSegment) -> List[Tuple[int, int]]:
+        """
+        Split the audio into (start_ms, end_ms) ranges of roughly AUDIO_SEGMENT_SECONDS each.
+        Every cut is moved to the middle of the last silence found shortly before the target
+        boundary so that words are not chopped in half.
+        """
+        segment_ms = AUDIO_SEGMENT_SECONDS * 1000
+        search_ms = AUDIO_SILENCE_SEARCH_SECONDS * 1000
+        silence_thresh = audio.dBFS - 16 if audio.dBFS != float("-inf") else -50
+
+        boundaries = []
+        start = 0
+        while len(audio) - start > segment_ms:
+            target = start + segment_ms
+            window_start = max(start, target - search_ms)
+            silences = detect_silence(
+                audio[window_start:target],
+                min_silence_len=AUDIO_MIN_SILENCE_MS,
+                silence_thresh=silence_thresh,
+                seek_step=10
+            )
+            cut = target
+            if silences:
+                silence_start, silence_end = silences[-1]
+                cut = window_start + (silence_start + silence_end) // 2
+            if cut <= start:
+                cut = target
+            boundaries.append((start, cut))
+            start = cut
+        boundaries.append((start, len(audio)))
+        return boundaries
+
+    def split_audio(self, content: bytes, filename: str) -> List[Tuple[int, Optional[int], bytes]]:
+        """
+        (start_ms, end_ms, bytes) per segment. Files too small to run past one segment are not decoded (which
+        needs ffmpeg for most formats) and go out as they are, their end is then unknown until transcribed.
+        """
+        if len(content) < AUDIO_SPLIT_MIN_BYTES:
+            return [(0, None, content)]
+        audio_format = os.path.splitext(filename)[-1].lstrip(".").lower() or None
+        audio = AudioSegment.from_file(BytesIO(content), format=audio_format)
+        boundaries = self.find_boundaries(audio)
+        if len(boundaries) == 1:
+            # nothing to split, send the original bytes instead of re-encoding them
+            return [(0, len(audio), content)]
+
+        segments = []
+        for start_ms, end_ms in boundaries:
+            buffer = BytesIO()
+            audio[start_ms:end_ms].export(buffer, format="mp3")
+            segments.append((start_ms, end_ms, buffer.getvalue()))
+        return segments
+
+    async def transcribe_segment(self, segment: bytes):
+        # retries happen per segment, a failing segment never restarts the whole recording
+        # a fresh buffer is built for every attempt since the previous one may have been read already
+        async with TRANSCRIPTION_SLOTS:
+            return await get_guard("elevenlabs").call(
+                lambda: self.client.speech_to_text.convert(
+                    file=BytesIO(segment),
+                    model_id="scribe_v1",
+                    tag_audio_events=True,
+                    diarize=True
+                )
             )
 
-            pages.append({
-                "page_number": page_counter,
-                "text": transcription.text,
+    @staticmethod
+    def stitch_transcripts(segments: List[Tuple[int, Optional[int], bytes]], transcriptions: List) -> List[Dict]:
+        """
+        Build one page per segment. Word timestamps are shifted by the segment offset and the per-segment
+        speaker ids returned by the diarization are mapped onto ids that never collide across segments.
+        Diarization only tells speakers apart within one segment, so the only link made between segments is that
+        the first speaker of a segment is the one who was talking when the previous segment ended. Anyone else
+        gets a new id in every segment: the same person can appear under several ids in a long recording.
+        """
+        pages = []
+        speaker_count = 0
+        last_speaker = None
+
+        for page_number, ((start_ms, end_ms, _), transcription) in enumerate(zip(segments, transcriptions), 1):
+            offset = start_ms / 1000
+            page = {
+                "page_number": page_number,
+                "start_time": offset,
+                "end_time": end_ms / 1000 if end_ms is not None else None,
+                "text": "",
+                "utterances": [],
                 "tables": [],
                 "images": []
-            })
+            }
+            if isinstance(transcription, Exception):
+                page["error"] = f"Failed to transcribe segment: {str(transcription)}"
+                last_speaker = None
+                pages.append(page)
+                continue
+
+            speaker_map = {}
+            utterances = []
+            for word in transcription.words or []:
+                local_speaker = word.speaker_id
+                if local_speaker is not None and local_speaker not in speaker_map:
+                    if not speaker_map and last_speaker is not None:
+                        speaker_map[local_speaker] = last_speaker
+                    else:
+                        speaker_map[local_speaker] = f"speaker_{speaker_count}"
+                        speaker_count += 1
+                speaker = speaker_map.get(local_speaker)
+                word_start = round((word.start or 0) + offset, 3)
+                word_end = round((word.end or 0) + offset, 3)
+
+                if utterances and utterances[-1]["speaker"] == speaker:
+                    utterances[-1]["text"] += word.text
+                    utterances[-1]["end"] = word_end
+                else:
+                    utterances.append({"speaker": speaker, "start": word_start, "end": word_end, "text": word.text})
+
+            for utterance in utterances:
+                utterance["text"] = utterance["text"].strip()
+            utterances = [utterance for utterance in utterances if utterance["text"]]
+            if utterances:
+                last_speaker = utterances[-1]["speaker"]
+
+            page["text"] = transcription.text
+            page["utterances"] = utterances
+            if page["end_time"] is None:
+                # an unsplit file was never decoded, its last word is as close to the end as we get
+                page["end_time"] = utterances[-1]["end"] if utterances else None
+            pages.append(page)
+        return pages
+
+    async def process(self, content: bytes, filename: str, mime_type: str = "audio/mpeg") -> Dict:
+        try:
+            loop = asyncio.get_running_loop()
+            segments = await loop.run_in_executor(None, self.split_audio, content, filename)
+            logger.info("Transcribing %s in %d segments", filename, len(segments))
+
+            transcriptions = await asyncio.gather(
+                *[self.transcribe_segment(segment) for _, _, segment in segments],
+                return_exceptions=True
+            )
+            pages = self.stitch_transcripts(segments, transcriptions)
+
+            failed_segments = [page["page_number"] for page in pages if "error" in page]
+            if len(failed_segments) == len(pages):
+                return {"filename": filename, "error": f"Failed to process audio: {pages[0]['error']}"}
 
             return {
                 "filename": filename,
                 "pages": pages,
-                "page_count": len(pages)
+                "page_count": len(pages),
+                "duration": pages[-1]["end_time"],
+                "failed_segments": failed_segments
             }
         except Exception as e:
-            return {"filename": filename, "error": f"Failed to process audio: {str(e)}"}
\ No newline at end of file
+            return {"filename": filename, "error": f"Failed to process audio: {str(e)}"}
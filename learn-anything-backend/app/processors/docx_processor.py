@@ -1,56 +1,89 @@
 import io
-import base64
-from typing import Dict, List
+import os
+import asyncio
+import tempfile
+import subprocess
+from typing import Dict, List, Set
 
 from docx import Document
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 
 from .base import FileProcessor
+from ..core.config import DOCX_PAGE_CHARS, DOCX_HEADING_BREAK_MIN_CHARS, LIBREOFFICE_BINARY, \
+    DOC_CONVERSION_TIMEOUT_SECONDS
+from ..utils.text_chunker import TextChunker
+from ..utils.image_pipeline import IMAGE_PIPELINE
+
+# legacy .doc files are OLE2 compound documents
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
 
 
 class DocxProcessor(FileProcessor):
+    def __init__(self):
+        self.chunker = TextChunker(target_chars=DOCX_PAGE_CHARS)
+
+    @staticmethod
+    def convert_doc_to_docx(content: bytes) -> bytes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_path = os.path.join(tmp_dir, "source.doc")
+            with open(source_path, "wb") as source_file:
+                source_file.write(content)
+            # a private profile per conversion, libreoffice refuses to run twice on the same one
+            subprocess.run(
+                [
+                    LIBREOFFICE_BINARY,
+                    f"-env:UserInstallation=file://{tmp_dir}/profile",
+                    "--headless",
+                    "--convert-to", "docx",
+                    "--outdir", tmp_dir,
+                    source_path
+                ],
+                check=True,
+                capture_output=True,
+                timeout=DOC_CONVERSION_TIMEOUT_SECONDS
+            )
+            with open(os.path.join(tmp_dir, "source.docx"), "rb") as converted_file:
+                return converted_file.read()
+
     @staticmethod
-    def extract_images(doc: Document) -> List[Dict]:
+    def extract_images(element, doc: Document) -> List[Dict]:
+        # every picture anchored anywhere below a body element: in a paragraph, a table cell or a content control
         images = []
-        for rel in doc.part.rels.values():
-            if "image" in rel.target_ref:
-                image_data = rel.target_part.blob
-                image_format = rel.target_ref.split('.')[-1]
-                image_b64 = base64.b64encode(image_data).decode("utf-8")
-                images.append({
-                    "format": image_format,
-                    "data": image_b64
-                })
+        related_parts = doc.part.related_parts
+        for blip in element.iter(qn("a:blip")):
+            rel_id = blip.get(qn("r:embed"))
+            if not rel_id or rel_id not in related_parts:
+                continue
+            image_part = related_parts[rel_id]
+            images.append({
+                "format": image_part.partname.ext,
+                "blob": image_part.blob
+            })
         return images
 
-    async def process(self, content: bytes, filename: str) -> Dict:
-        try:
-            doc = Document(io.BytesIO(content))
-            pages = []
-            current_page = {"text": [], "tables": [], "images": []}
-
-            # Process paragraphs
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    current_page["text"].append(para.text)
-                # If total characters exceed 500, creates a new page
-                if sum(len(t) for t in current_page["text"]) > 500:
-                    pages.append({
-                        "page_number": len(pages) + 1,
-                        "text": "\n".join(current_page["text"]),
-                        "tables": current_page["tables"],
-                        "images": current_page["images"]
-                    })
-                    current_page = {"text": [], "tables": [], "images": []}
-
-            # Process tables
-            for table in doc.tables:
-                table_data = [[cell.text for cell in row.cells] for row in table.rows]
-                current_page["tables"].append(table_data)
+    @staticmethod
+    def heading_style_ids(doc: Document) -> Set[str]:
+        # resolved once per document, looking up paragraph.style walks the whole styles part on every call
+        return {
+            style.style_id for style in doc.styles
+            if style.name and (style.name.startswith("Heading") or style.name == "Title")
+        }
 
-            # Process images
-            current_page["images"].extend(self.extract_images(doc))
+    def paginate(self, doc: Document) -> List[Dict]:
+        """
+        Walk the body in document order (paragraphs and tables interleaved) and build pages with a running
+        character count. A page is closed before a heading once it holds DOCX_HEADING_BREAK_MIN_CHARS, and
+        whenever it grows past DOCX_PAGE_CHARS. Images stay on the page of the paragraph or table they are anchored in.
+        """
+        pages = []
+        current_page = {"text": [], "tables": [], "images": []}
+        current_chars = 0
+        heading_styles = self.heading_style_ids(doc)
 
-            # Add remaining content as the last page
+        def close_page():
+            nonlocal current_page, current_chars
             if current_page["text"] or current_page["tables"] or current_page["images"]:
                 pages.append({
                     "page_number": len(pages) + 1,
@@ -58,11 +91,55 @@ class DocxProcessor(FileProcessor):
                     "tables": current_page["tables"],
                     "images": current_page["images"]
                 })
+            current_page = {"text": [], "tables": [], "images": []}
+            current_chars = 0
+
+        for element in doc.element.body.iterchildren():
+            if element.tag == qn("w:p"):
+                paragraph = Paragraph(element, doc)
+                text = paragraph.text
+                if current_chars >= DOCX_HEADING_BREAK_MIN_CHARS and text.strip() and element.style in heading_styles:
+                    close_page()
+                if len(text) > DOCX_PAGE_CHARS:
+                    # a single paragraph longer than a page is spread over several pages at sentence boundaries
+                    for piece in self.chunker.split(text):
+                        if current_chars:
+                            close_page()
+                        current_page["text"].append(piece)
+                        current_chars += len(piece)
+                elif text.strip():
+                    current_page["text"].append(text)
+                    current_chars += len(text)
+
+            elif element.tag == qn("w:tbl"):
+                table = Table(element, doc)
+                table_data = [[cell.text for cell in row.cells] for row in table.rows]
+                current_page["tables"].append(table_data)
+                current_chars += sum(len(cell) for row in table_data for cell in row)
+            current_page["images"].extend(self.extract_images(element, doc))
+
+            if current_chars > DOCX_PAGE_CHARS:
+                close_page()
+
+        # Add remaining content as the last page
+        close_page()
+        return pages
+
+    async def process(self, content: bytes, filename: str) -> Dict:
+        try:
+            if content[:len(OLE_SIGNATURE)] == OLE_SIGNATURE:
+                loop = asyncio.get_running_loop()
+                content = await loop.run_in_executor(None, self.convert_doc_to_docx, content)
+
+            doc = Document(io.BytesIO(content))
+            pages = self.paginate(doc)
+            image_stats = await IMAGE_PIPELINE.process_pages(pages, filename)
 
             return {
                 "filename": filename,
                 "pages": pages,
-                "page_count": len(pages)
+                "page_count": len(pages),
+                "image_stats": image_stats
             }
         except Exception as e:
-            return {"filename": filename, "error": f"Failed to process DOCX: {str(e)}"}
\ No newline at end of file
+            return {"filename": filename, "error": f"Failed to process DOCX: {str(e)}"}
@@ -1,64 +1,96 @@
 import io
 import json
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
 
 from .base import FileProcessor
 from ..core.config import PROCESSOR_REGISTRY
+from ..services.resilience.resilience import get_guard
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# what sync needs to tell an edited file from an unchanged one without downloading it, and the size it is
+# charged to the storage quota with (google docs / sheets have none)
+FILE_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, parents, trashed, size"
+
+
+def build_drive_service(credentials: Credentials):
+    return build('drive', 'v3', credentials=credentials)
 
 
 class GoogleDriveProcessor(FileProcessor):
-    async def process(self, file_ids: List[str], credentials_json: str) -> List[Dict]:
-        try:
-            credentials = Credentials.from_authorized_user_info(json.loads(credentials_json))
-            drive_service = build('drive', 'v3', credentials=credentials)
-            results = []
+    def __init__(self, service_factory: Optional[Callable] = None):
+        # swapped for a fake drive service (app/services/stubs/fake_drive.py) in local runs
+        self.service_factory = service_factory or build_drive_service
 
-            async def process_file(file_id: str):
-                file_metadata = drive_service.files().get(fileId=file_id, fields="id,name,mimeType").execute()
-                file_name = file_metadata['name']
-                file_size = int(file_metadata.get('size', 0))
-                mime_type = file_metadata['mimeType']
+    def build_service(self, credentials_json: str):
+        credentials = Credentials.from_authorized_user_info(json.loads(credentials_json))
+        return self.service_factory(credentials)
 
-                if mime_type == "application/vnd.google-apps.folder":
-                    # Recursively process folder contents
-                    page_token = None
-                    while True:
-                        query = f"'{file_id}' in parents and trashed=false"
-                        folder_results = drive_service.files().list(
-                            q=query,
-                            fields="nextPageToken, files(id, name, mimeType)",
-                            pageToken=page_token
-                        ).execute()
-                        folder_files = folder_results.get('files', [])
-                        for folder_file in folder_files:
-                            await process_file(folder_file['id'])
-                        page_token = folder_results.get('nextPageToken')
-                        if not page_token:
-                            break
-                else:
-                    # Process individual file
-                    request = drive_service.files().get_media(fileId=file_id)
-                    file_io = io.BytesIO()
-                    downloader = MediaIoBaseDownload(file_io, request)
-                    done = False
-                    while not done:
-                        status, done = downloader.next_chunk()
-                    file_content = file_io.getvalue()
-                    processor = PROCESSOR_REGISTRY.get(mime_type)
-                    if not processor:
-                        results.append({"filename": file_name, "error": f"Unsupported file type: {mime_type}"})
-                        return
-                    result = await processor.process(file_content, file_name)
-                    results.append(result)
+    async def list_tree(self, service, file_ids: List[str]) -> Tuple[List[Dict], Dict[str, List[str]]]:
+        """
+        Metadata of every file reachable from `file_ids`, folders are expanded recursively. Also returns the
+        folders that were walked with their parent ids.
+        """
+        drive = get_guard("google_drive")
+        files = []
+        folders = {}
 
-            # Process all provided file/folder IDs
-            for file_id in file_ids:
-                await process_file(file_id)
+        async def walk_folder(folder_id: str, parents: List[str]):
+            folders[folder_id] = parents
+            page_token = None
+            while True:
+                folder_results = await drive.call(
+                    service.files().list(
+                        q=f"'{folder_id}' in parents and trashed=false",
+                        fields=f"nextPageToken, files({FILE_FIELDS})",
+                        pageToken=page_token
+                    ).execute
+                )
+                for folder_file in folder_results.get('files', []):
+                    if folder_file['mimeType'] == FOLDER_MIME_TYPE:
+                        await walk_folder(folder_file['id'], folder_file.get('parents', []))
+                    else:
+                        files.append(folder_file)
+                page_token = folder_results.get('nextPageToken')
+                if not page_token:
+                    break
 
-            return results
+        for file_id in file_ids:
+            file_metadata = await drive.call(service.files().get(fileId=file_id, fields=FILE_FIELDS).execute)
+            if file_metadata['mimeType'] == FOLDER_MIME_TYPE:
+                await walk_folder(file_id, file_metadata.get('parents', []))
+            else:
+                files.append(file_metadata)
+        return files, folders
+
+    async def download(self, service, file_id: str) -> bytes:
+        drive = get_guard("google_drive")
+        request = service.files().get_media(fileId=file_id)
+        if not isinstance(request, HttpRequest):
+            return await drive.call(request.execute)
+        file_io = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_io, request)
+        done = False
+        while not done:
+            status, done = await drive.call(downloader.next_chunk)
+        return file_io.getvalue()
+
+    async def parse_file(self, service, file_metadata: Dict) -> Dict:
+        file_name = file_metadata['name']
+        mime_type = file_metadata['mimeType']
+        processor = PROCESSOR_REGISTRY.get(mime_type)
+        if not processor:
+            return {"filename": file_name, "error": f"Unsupported file type: {mime_type}"}
+        file_content = await self.download(service, file_metadata['id'])
+        return await processor.process(file_content, file_name)
+
+    async def process(self, file_ids: List[str], credentials_json: str) -> List[Dict]:
+        try:
+            drive_service = self.build_service(credentials_json)
+            files, _ = await self.list_tree(drive_service, file_ids)
+            return [await self.parse_file(drive_service, file_metadata) for file_metadata in files]
         except Exception as e:
-            return [{"filename": "google_drive_files", "error": f"Failed to process Google Drive files: {str(e)}"}]
\ No newline at end of file
+            return [{"filename": "google_drive_files", "error": f"Failed to process Google Drive files: {str(e)}"}]
@@ -1,12 +1,20 @@
+import time
 import base64
+import asyncio
 import mimetypes
-from typing import Dict, List
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 
 from google import genai
 from google.genai import types
+from PIL import Image
 
-from ..core.config import GEMINI_API_KEY
+from ..core.config import GEMINI_API_KEY, IMAGE_BATCH_MAX_BYTES, IMAGE_BATCH_MAX_COUNT, IMAGE_MAX_INLINE_BYTES, \
+    IMAGE_MAX_DIMENSION, IMAGE_JPEG_QUALITY
+from ..services.logging.logger import logger
+from ..services.resilience.resilience import get_guard
+from ..utils.ocr import OCR, escalation_reason
 from .base import FileProcessor
 
 
@@ -21,6 +29,29 @@ class ImageResponse(BaseModel):
     description: str
     type: str
 
+class BatchImageResponse(BaseModel):
+    images: List[ImageResponse]
+
+
+IMAGE_PROMPT = (
+    "Analyze this image and extract all relevant information in JSON format. Include: "
+    "1. Any text (via OCR) in a 'text' field. If a table is detected, include it only in the 'tables' field and keep the text empty. "
+    "3. Classify the image as: document, infographic, timetable, invoice, or the category you feel it belongs to. "
+    "4. Any tables, formatted as an array of objects with 'columns' (array of strings) and 'rows' (array of arrays of strings). "
+    "5. A detailed scene description in a 'description' field. "
+    "DO NOT mention the word json in your response."
+)
+
+BATCH_IMAGE_PROMPT = (
+    "You are given {count} images, each one preceded by its label 'Image <n>'. "
+    "Analyze every image separately and return an 'images' array with exactly {count} entries, in the same order as the images. "
+    "For each image include: "
+    "1. Any text (via OCR) in a 'text' field. If a table is detected, include it only in the 'tables' field and keep the text empty. "
+    "2. Classify the image as: document, infographic, timetable, invoice, or the category you feel it belongs to, in a 'type' field. "
+    "3. Any tables, formatted as an array of objects with 'columns' (array of strings) and 'rows' (array of arrays of strings). "
+    "4. A detailed scene description in a 'description' field. "
+    "DO NOT mention the word json in your response."
+)
 
 
 class ImageProcessor(FileProcessor):
@@ -28,58 +59,218 @@ class ImageProcessor(FileProcessor):
     def __init__(self):
         self.client = genai.Client(api_key=GEMINI_API_KEY)
 
+    @staticmethod
+    def prepare_image(content: bytes, mime_type: str) -> Tuple[bytes, str]:
+        """
+        Downscale and recompress images that are too large to be sent inline, everything else is sent as is.
+        """
+        image = Image.open(BytesIO(content))
+        if len(content) <= IMAGE_MAX_INLINE_BYTES and max(image.size) <= IMAGE_MAX_DIMENSION:
+            return content, mime_type
+
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue(), "image/jpeg"
+
+    @staticmethod
+    def group_batches(images: List[Tuple[bytes, str]]) -> List[List[int]]:
+        batches = []
+        current = []
+        current_bytes = 0
+        for idx, (data, _) in enumerate(images):
+            if current and (current_bytes + len(data) > IMAGE_BATCH_MAX_BYTES or len(current) >= IMAGE_BATCH_MAX_COUNT):
+                batches.append(current)
+                current = []
+                current_bytes = 0
+            current.append(idx)
+            current_bytes += len(data)
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def build_result(content: bytes, filename: str, llm_response: ImageResponse, metrics: Dict) -> Dict:
+        # Store image and LLM response
+        pages = [{
+            "page_number": 1,
+            "image": base64.b64encode(content).decode("utf-8"),
+            **llm_response.model_dump(exclude_unset=True)
+        }]
+        return {
+            "filename": filename,
+            "pages": pages,
+            "page_count": 1,
+            "metrics": metrics
+        }
+
+    @staticmethod
+    def ocr_response(ocr_result: Dict) -> ImageResponse:
+        return ImageResponse(text=ocr_result["text"], tables=[], description="", type="document")
+
+    @classmethod
+    def build_ocr_result(cls, content: bytes, filename: str, ocr_result: Dict, latency_ms: float,
+                         **metrics) -> Dict:
+        return cls.build_result(content, filename, cls.ocr_response(ocr_result), {
+            "mode": "ocr", "batch_size": 1, "batch_bytes": len(content), "latency_ms": latency_ms,
+            "latency_per_image_ms": latency_ms, "ocr_confidence": ocr_result["confidence"], **metrics
+        })
+
+    def escalated(self, result: Dict, content: bytes, filename: str, ocr_result: Optional[Dict], reason: str,
+                  ocr_ms: float) -> Dict:
+        # what gemini made of an image local ocr was not sure about. When gemini fails as well, whatever text
+        # ocr did read is better than an error
+        if "error" in result and ocr_result and ocr_result["words"]:
+            logger.warning("Gemini failed for %s, keeping the OCR text: %s", filename, result["error"])
+            return self.build_ocr_result(
+                content, filename, ocr_result, ocr_ms, escalated=reason, gemini_error=result["error"]
+            )
+        if "error" not in result:
+            # images of one gemini batch share their metrics, the reason is per image
+            result["metrics"] = {**result.get("metrics", {}), "escalated": reason}
+        return result
+
+    def analyze_image(self, data: bytes, mime_type: str) -> ImageResponse:
+        response = self.client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=[
+                types.Part.from_bytes(
+                    data=data,
+                    mime_type=mime_type,
+                ),
+                IMAGE_PROMPT
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=ImageResponse
+            )
+        )
+        return response.parsed
+
+    def analyze_batch(self, images: List[Tuple[bytes, str]]) -> List[ImageResponse]:
+        contents = []
+        for idx, (data, mime_type) in enumerate(images, 1):
+            contents.append(f"Image {idx}")
+            contents.append(types.Part.from_bytes(data=data, mime_type=mime_type))
+        contents.append(BATCH_IMAGE_PROMPT.format(count=len(images)))
+
+        response = self.client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=contents,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=BatchImageResponse
+            )
+        )
+        parsed = response.parsed
+        if parsed is None or len(parsed.images) != len(images):
+            raise ValueError(f"Expected {len(images)} image results, got {len(parsed.images) if parsed else 0}")
+        return parsed.images
+
     async def process(self, content: bytes, filename: str) -> Dict:
+        """
+        Local OCR first, gemini only for images OCR does not read well: photos and diagrams, low confidence
+        text and tables.
+        """
+        started = time.perf_counter()
+        ocr_result, = await OCR.recognize([content])
+        ocr_ms = round((time.perf_counter() - started) * 1000, 2)
+        reason = escalation_reason(ocr_result)
+        if reason is None:
+            return self.build_ocr_result(content, filename, ocr_result, ocr_ms)
+        return self.escalated(await self.analyze(content, filename), content, filename, ocr_result, reason, ocr_ms)
+
+    async def analyze(self, content: bytes, filename: str) -> Dict:
         try:
             if not GEMINI_API_KEY:
                 return {"filename": filename, "error": "Google API key is missing"}
 
-            # Encode image as base64
-            image_b64 = base64.b64encode(content).decode("utf-8")
             mime_type, _ = mimetypes.guess_type(filename)
             mime_type = mime_type or "image/jpeg"
-
-            # Prepare prompt for Gemini
-            prompt = (
-                "Analyze this image and extract all relevant information in JSON format. Include: "
-                "1. Any text (via OCR) in a 'text' field. If a table is detected, include it only in the 'tables' field and keep the text empty. "
-                "3. Classify the image as: document, infographic, timetable, invoice, or the category you feel it belongs to. "
-                "4. Any tables, formatted as an array of objects with 'columns' (array of strings) and 'rows' (array of arrays of strings). "
-                "5. A detailed scene description in a 'description' field. "
-                "DO NOT mention the word json in your response."
-            )
+            data, mime_type = self.prepare_image(content, mime_type)
 
             # Process with Gemini
+            started = time.perf_counter()
             try:
-                response = self.client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=[
-                        types.Part.from_bytes(
-                            data=image_b64,
-                            mime_type=mime_type,
-                        ),
-                        prompt
-                    ],
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json",
-                        response_schema=ImageResponse
-                    )
-                )
-
-                llm_response = response.parsed
+                llm_response = await get_guard("gemini").call(self.analyze_image, data, mime_type)
             except Exception as e:
                 return {"filename": filename, "error": f"Gemini processing failed: {str(e)}"}
 
-            # Store image and LLM response
-            pages = [{
-                "page_number": 1,
-                "image": image_b64,
-                **llm_response.model_dump(exclude_unset=True)
-            }]
-
-            return {
-                "filename": filename,
-                "pages": pages,
-                "page_count": 1
-            }
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            metrics = {"mode": "single", "batch_size": 1, "batch_bytes": len(data), "latency_ms": latency_ms,
+                       "latency_per_image_ms": latency_ms}
+            return self.build_result(content, filename, llm_response, metrics)
         except Exception as e:
-            return {"filename": filename, "error": f"Failed to process image: {str(e)}"}
\ No newline at end of file
+            return {"filename": filename, "error": f"Failed to process image: {str(e)}"}
+
+    async def process_batch(self, files: List[Tuple[bytes, str]]) -> List[Dict]:
+        """
+        Read many images with local OCR and analyze the ones it cannot read well with as few Gemini requests as
+        possible. Results are returned in the order of `files`. If a batched request fails or does not match the
+        schema, its images are retried one by one.
+        """
+        results: List[Dict] = [{} for _ in files]
+        started = time.perf_counter()
+        ocr_results = await OCR.recognize([content for content, _ in files])
+        ocr_ms = round((time.perf_counter() - started) * 1000 / max(len(files), 1), 2)
+        escalated = {}
+        for idx, ((content, filename), ocr_result) in enumerate(zip(files, ocr_results)):
+            reason = escalation_reason(ocr_result)
+            if reason is None:
+                results[idx] = self.build_ocr_result(content, filename, ocr_result, ocr_ms)
+            else:
+                escalated[idx] = reason
+        if len(escalated) < len(files):
+            logger.info(
+                "OCR read %d of %d images, %d go to Gemini", len(files) - len(escalated), len(files), len(escalated)
+            )
+
+        prepared = {}
+        for idx in escalated:
+            content, filename = files[idx]
+            if not GEMINI_API_KEY:
+                results[idx] = {"filename": filename, "error": "Google API key is missing"}
+                continue
+            try:
+                mime_type, _ = mimetypes.guess_type(filename)
+                prepared[idx] = self.prepare_image(content, mime_type or "image/jpeg")
+            except Exception as e:
+                results[idx] = {"filename": filename, "error": f"Failed to process image: {str(e)}"}
+
+        indexes = list(prepared.keys())
+        batches = [[indexes[pos] for pos in batch] for batch in self.group_batches([prepared[idx] for idx in indexes])]
+
+        async def run_batch(batch: List[int]):
+            if len(batch) == 1:
+                idx = batch[0]
+                results[idx] = await self.analyze(*files[idx])
+                return
+
+            images = [prepared[idx] for idx in batch]
+            batch_bytes = sum(len(data) for data, _ in images)
+            started = time.perf_counter()
+            try:
+                llm_responses = await get_guard("gemini").call(self.analyze_batch, images)
+            except Exception as e:
+                logger.warning(
+                    "Batched image analysis of %d images failed, falling back to single requests: %s", len(batch), e
+                )
+                for idx in batch:
+                    results[idx] = await self.analyze(*files[idx])
+                    results[idx].setdefault("metrics", {})["mode"] = "fallback"
+                return
+
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            metrics = {"mode": "batch", "batch_size": len(batch), "batch_bytes": batch_bytes, "latency_ms": latency_ms,
+                       "latency_per_image_ms": round(latency_ms / len(batch), 2)}
+            logger.info("Analyzed %d images (%d bytes) in one request: %sms", len(batch), batch_bytes, latency_ms)
+            for idx, llm_response in zip(batch, llm_responses):
+                content, filename = files[idx]
+                results[idx] = self.build_result(content, filename, llm_response, metrics)
+
+        await asyncio.gather(*[run_batch(batch) for batch in batches])
+        for idx, reason in escalated.items():
+            results[idx] = self.escalated(results[idx], *files[idx], ocr_results[idx], reason, ocr_ms)
+        return results
@@ -1,50 +1,145 @@
 import io
-import base64
-from typing import Dict
+import os
+from typing import Dict, List
 
 import fitz  # PyMuPDF
 import pdfplumber
 
 
 from .base import FileProcessor
+from ..core.config import PROCESSOR_REGISTRY, PDF_SCANNED_MAX_CHARS, PDF_SCAN_MIN_IMAGE_COVERAGE, PDF_SCAN_DPI, \
+    PDF_IMAGE_MODE, IMAGE_MIN_PIXELS
+from ..utils.image_pipeline import IMAGE_PIPELINE, output_format
+from ..services.logging.logger import logger
+from ..services.profiling.profiling import span
+
+
+def image_metadata(fitz_page) -> List[Dict]:
+    """
+    Where the images of a page are, without decoding them. Inline images have no xref to extract them by later
+    and images below IMAGE_MIN_PIXELS would be dropped as decoration, neither is recorded.
+    """
+    images = []
+    for info in fitz_page.get_image_info(xrefs=True):
+        if not info.get("xref") or info["width"] * info["height"] < IMAGE_MIN_PIXELS:
+            continue
+        images.append({
+            "xref": info["xref"],
+            "bbox": [round(value, 2) for value in info["bbox"]],
+            "width": info["width"],
+            "height": info["height"],
+            "lazy": True
+        })
+    return images
+
+
+def extract_image(content: bytes, xref: int) -> Dict:
+    # one image of a lazily ingested pdf, normalised the way eagerly extracted images are
+    with fitz.open(stream=content, filetype="pdf") as pdf_doc:
+        base_image = pdf_doc.extract_image(xref)
+    if not base_image:
+        raise ValueError(f"No image with xref {xref}")
+    result = IMAGE_PIPELINE.run(base_image["image"], output_format())
+    if result.get("dropped") or not result.get("format"):
+        return {"image": base_image["image"], "thumbnail": None, "format": base_image["ext"]}
+    return {"image": result["data"], "thumbnail": result["thumbnail"], "format": result["format"]}
 
 
 class PDFProcessor(FileProcessor):
+    def __init__(self, image_mode: str = PDF_IMAGE_MODE):
+        self.image_mode = image_mode
+
+    @staticmethod
+    def image_coverage(fitz_page) -> float:
+        # share of the page under images, scanners sometimes split a page into strips so their areas add up
+        page_rect = fitz_page.rect
+        if page_rect.is_empty:
+            return 0.0
+        covered = sum(abs(fitz.Rect(info["bbox"]) & page_rect) for info in fitz_page.get_image_info())
+        return min(covered / abs(page_rect), 1.0)
+
+    @classmethod
+    def is_scanned(cls, text: str, fitz_page) -> bool:
+        # no text layer to speak of, but a page sized image to read it from
+        if len(text.strip()) >= PDF_SCANNED_MAX_CHARS:
+            return False
+        return cls.image_coverage(fitz_page) >= PDF_SCAN_MIN_IMAGE_COVERAGE
+
+    @staticmethod
+    async def read_scans(pages: List[Dict], scans: Dict[int, bytes], filename: str):
+        """
+        Text of scanned pages, through the image processor: local OCR first, gemini for what OCR cannot read.
+        """
+        stem = os.path.splitext(filename)[0]
+        indexes = list(scans)
+        results = await PROCESSOR_REGISTRY["image/png"].process_batch([
+            (scans[idx], f"{stem}_page_{idx + 1}.png") for idx in indexes
+        ])
+        for idx, result in zip(indexes, results):
+            page = pages[idx]
+            if "error" in result:
+                page["ocr"] = {"error": result["error"]}
+                continue
+            recognized = result["pages"][0]
+            page["text"] = recognized.get("text") or ""
+            page["tables"].extend(recognized.get("tables") or [])
+            if recognized.get("description"):
+                page["description"] = recognized["description"]
+            metrics = result.get("metrics", {})
+            page["ocr"] = {key: metrics[key] for key in ("mode", "ocr_confidence", "escalated") if key in metrics}
+        logger.info("Read %d scanned pages of %s", len(scans), filename)
+
     async def process(self, content: bytes, filename: str) -> Dict:
         try:
             pages = []
+            scans = {}
             with pdfplumber.open(io.BytesIO(content)) as pdf:
                 pdf_doc = fitz.open(stream=content, filetype="pdf")
                 for page_num, (plumber_page, fitz_page) in enumerate(zip(pdf.pages, pdf_doc)):
-                    text = plumber_page.extract_text() or ""
-                    tables = plumber_page.extract_tables()
+                    with span("pdf.text"):
+                        text = plumber_page.extract_text() or ""
+                    with span("pdf.tables"):
+                        tables = plumber_page.extract_tables()
                     formatted_tables = [
                         [[cell or "" for cell in row] for row in table]
                         for table in tables
                     ]
                     images = []
-                    for img in fitz_page.get_images(full=True):
-                        xref = img[0]
-                        base_image = pdf_doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-                        images.append({
-                            "format": base_image["ext"],
-                            "data": image_b64,
-                            "width": base_image["width"],
-                            "height": base_image["height"]
-                        })
+                    with span("pdf.images"):
+                        if self.image_mode == "lazy":
+                            images = image_metadata(fitz_page)
+                        else:
+                            for img in fitz_page.get_images(full=True):
+                                xref = img[0]
+                                base_image = pdf_doc.extract_image(xref)
+                                images.append({
+                                    "format": base_image["ext"],
+                                    "blob": base_image["image"],
+                                    "width": base_image["width"],
+                                    "height": base_image["height"]
+                                })
                     pages.append({
                         "page_number": page_num + 1,
                         "text": text,
                         "tables": formatted_tables,
                         "images": images
                     })
+                    if self.is_scanned(text, fitz_page):
+                        with span("pdf.render"):
+                            scans[page_num] = fitz_page.get_pixmap(dpi=PDF_SCAN_DPI).tobytes("png")
                 pdf_doc.close()
-            return {
+            if scans:
+                await self.read_scans(pages, scans, filename)
+            image_stats = await IMAGE_PIPELINE.process_pages(pages, filename)
+            result = {
                 "filename": filename,
                 "pages": pages,
-                "page_count": len(pages)
+                "page_count": len(pages),
+                "image_stats": image_stats
             }
+            if any(image.get("lazy") for page in pages for image in page["images"]):
+                # stored with the source, the images are extracted from it when they are first requested
+                result["original"] = content
+            return result
         except Exception as e:
             return {"filename": filename, "error": f"Failed to process PDF: {str(e)}"}
@@ -1,49 +1,148 @@
 import io
-import base64
-from typing import Dict
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
 
 from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.shapes.group import GroupShape
+from pptx.shapes.picture import Picture
 
 from .base import FileProcessor
+from ..core.config import PPTX_PARALLEL_MIN_SLIDES, PPTX_MAX_WORKERS
+from ..utils.image_pipeline import IMAGE_PIPELINE
+
+
+def iter_shapes(shapes) -> Iterator:
+    # group shapes are containers, their children are positioned and extracted like any other shape
+    for shape in shapes:
+        if isinstance(shape, GroupShape):
+            yield from iter_shapes(shape.shapes)
+        else:
+            yield shape
+
+
+def extract_slide(slide, slide_num: int, image_pages: Dict[str, int], part_hashes: Dict[str, str]) -> Dict:
+    """
+    One pass over the shapes of a slide. Images are identified by the sha1 of their blob, the first
+    occurrence in the deck carries the image and later ones only reference it by `hash` and `ref_page`.
+    """
+    text = []
+    tables = []
+    images = []
+    for shape in iter_shapes(slide.shapes):
+        if isinstance(shape, Picture):
+            # empty picture placeholders and linked images have no embedded blob
+            rel_id = shape._element.blip_rId
+            if not rel_id:
+                continue
+            image_part = shape.part.related_part(rel_id)
+            # identical images are usually one package part, so the blob is hashed once per part
+            partname = str(image_part.partname)
+            if partname not in part_hashes:
+                part_hashes[partname] = hashlib.sha1(image_part.blob).hexdigest()
+            digest = part_hashes[partname]
+            image = {
+                "format": image_part.partname.ext,
+                "hash": digest,
+                "width": shape.width,
+                "height": shape.height
+            }
+            if digest in image_pages:
+                image["ref_page"] = image_pages[digest]
+            else:
+                image_pages[digest] = slide_num
+                image["blob"] = image_part.blob
+            images.append(image)
+        elif shape.has_text_frame:
+            if shape.text_frame.text:
+                text.append(shape.text_frame.text)
+        elif getattr(shape, "has_table", False):
+            tables.append([[cell.text for cell in row.cells] for row in shape.table.rows])
+
+    notes = ""
+    if slide.has_notes_slide:
+        # resolving the notes placeholder is an xpath search, do it once
+        notes_frame = slide.notes_slide.notes_text_frame
+        notes = notes_frame.text if notes_frame is not None else ""
+    return {
+        "page_number": slide_num,
+        "text": "\n".join(text),
+        "notes": notes,
+        "tables": tables,
+        "images": images
+    }
+
+
+def extract_slides(content: bytes, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+    """
+    Extract slides [start, stop) of a deck. Module level so that process pool workers can run it.
+    """
+    prs = Presentation(io.BytesIO(content))
+    image_pages = {}
+    part_hashes = {}
+    slides = list(prs.slides)[start:stop]
+    return [
+        extract_slide(slide, slide_num, image_pages, part_hashes)
+        for slide_num, slide in enumerate(slides, start + 1)
+    ]
+
+
+def merge_image_refs(slides: List[Dict]) -> List[Dict]:
+    # every worker inlines the first occurrence in its own range, keep only the first one of the deck
+    image_pages = {}
+    for slide in slides:
+        for image in slide["images"]:
+            if image["hash"] in image_pages:
+                if "blob" in image:
+                    del image["blob"]
+                    image["ref_page"] = image_pages[image["hash"]]
+            else:
+                image_pages[image["hash"]] = slide["page_number"]
+    return slides
 
 
 class PptxProcessor(FileProcessor):
+    def __init__(self):
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        # created on the first large deck and reused, spawn keeps the workers clear of the server's threads. A pool
+        # whose worker died is broken for good and replaced
+        if self.pool is None or self.pool._broken:
+            self.pool = ProcessPoolExecutor(PPTX_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    async def extract_parallel(self, content: bytes, slide_count: int) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        pool = self.get_pool()
+        step = -(-slide_count // PPTX_MAX_WORKERS)
+        ranges = await asyncio.gather(*[
+            loop.run_in_executor(pool, extract_slides, content, start, start + step)
+            for start in range(0, slide_count, step)
+        ])
+        return merge_image_refs([slide for slides in ranges for slide in slides])
+
     async def process(self, content: bytes, filename: str) -> Dict:
         try:
             prs = Presentation(io.BytesIO(content))
-            slides = []
-            for slide_num, slide in enumerate(prs.slides, 1):
-                text = []
-                tables = []
-                images = []
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text.append(shape.text)
-                    if shape.shape_type == MSO_SHAPE_TYPE.TABLE:
-                        table_data = [[cell.text for cell in row.cells] for row in shape.table.rows]
-                        tables.append(table_data)
-                for shape in slide.shapes:
-                    if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-                        image = shape.image
-                        img_bytes = image.blob
-                        img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-                        images.append({
-                            "format": image.ext,
-                            "data": img_b64,
-                            "width": shape.width,
-                            "height": shape.height
-                        })
-                slides.append({
-                    "page_number": slide_num,
-                    "text": "\n".join(text),
-                    "tables": tables,
-                    "images": images
-                })
+            slide_count = len(prs.slides)
+            if slide_count >= PPTX_PARALLEL_MIN_SLIDES and PPTX_MAX_WORKERS > 1:
+                slides = await self.extract_parallel(content, slide_count)
+            else:
+                image_pages = {}
+                part_hashes = {}
+                slides = [
+                    extract_slide(slide, slide_num, image_pages, part_hashes)
+                    for slide_num, slide in enumerate(prs.slides, 1)
+                ]
+            image_stats = await IMAGE_PIPELINE.process_pages(slides, filename)
             return {
                 "filename": filename,
                 "pages": slides,
-                "page_count": len(slides)
+                "page_count": len(slides),
+                "image_stats": image_stats
             }
         except Exception as e:
             return {"filename": filename, "error": f"Failed to process PPTX: {str(e)}"}
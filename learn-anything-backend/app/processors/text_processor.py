@@ -1,24 +1,28 @@
 from typing import Dict
 
 from .base import FileProcessor
+from ..utils.text_chunker import TextChunker, iter_decoded, detect_encoding, DETECTION_SAMPLE_BYTES
 
 
 class TextProcessor(FileProcessor):
+    def __init__(self):
+        self.chunker = TextChunker()
+
     async def process(self, content: bytes, filename: str) -> Dict:
         try:
-            text = content.decode("utf-8")
-            # Split text into pages (e.g., every 500 characters)
-            chunk_size = 500
+            encoding = detect_encoding(content[:DETECTION_SAMPLE_BYTES], len(content) <= DETECTION_SAMPLE_BYTES)
+            # Split text into pages on paragraph / sentence boundaries
             pages = []
-            for i in range(0, len(text), chunk_size):
+            for text in self.chunker.iter_chunks(iter_decoded(content, encoding)):
                 pages.append({
                     "page_number": len(pages) + 1,
-                    "text": text[i:i + chunk_size],
+                    "text": text,
                     "tables": [],
                     "images": []
                 })
             return {
                 "filename": filename,
+                "encoding": encoding,
                 "pages": pages,
                 "page_count": len(pages)
             }
@@ -1,63 +1,81 @@
 import aiohttp
-import base64
 from typing import Dict, List
+from urllib.parse import urljoin, urlparse
 
 from bs4 import BeautifulSoup
 
 from .base import FileProcessor
+from ..services.resilience.resilience import get_guard
+from ..utils.text_chunker import TextChunker
+from ..utils.image_pipeline import IMAGE_PIPELINE
+
+
+def web_guard(url: str):
+    # one circuit per host, a flaky site must not fail the uploads of every other site
+    return get_guard(f"web:{urlparse(url).netloc.lower()}")
 
 
 class URLProcessor(FileProcessor):
+    def __init__(self):
+        self.chunker = TextChunker()
+
+    @staticmethod
+    async def fetch(session: aiohttp.ClientSession, url: str, as_text: bool = True):
+        async with session.get(url) as response:
+            # raises ClientResponseError so that 429 / 5xx responses are retried by the guard
+            response.raise_for_status()
+            return await response.text() if as_text else await response.read()
+
     async def process(self, content: str, filename: str) -> Dict:
         try:
             async with aiohttp.ClientSession() as session:
-                async with session.get(content) as response:
-                    if response.status != 200:
-                        raise ValueError(f"Failed to fetch URL: {response.status}")
-                    html_content = await response.text()
-            soup = BeautifulSoup(html_content, "html.parser")
-            for element in soup(["script", "style"]):
-                element.decompose()
-            text = soup.get_text(separator="\n", strip=True)
-            tables = []
-            for table in soup.find_all("table"):
-                table_data = []
-                for row in table.find_all("tr"):
-                    cells = [cell.get_text(strip=True) for cell in row.find_all(["td", "th"])]
-                    if cells:
-                        table_data.append(cells)
-                if table_data:
-                    tables.append(table_data)
-            images = []
-            for img in soup.find_all("img"):
-                src = img.get("src")
-                if src:
-                    if not src.startswith("http"):
-                        from urllib.parse import urljoin
-                        src = urljoin(content, src)
-                    try:
-                        async with session.get(src) as img_response:
-                            if img_response.status == 200:
-                                img_bytes = await img_response.read()
-                                img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-                                images.append({
-                                    "format": src.split(".")[-1].lower() or "unknown",
-                                    "data": img_b64,
-                                    "width": img.get("width", None),
-                                    "height": img.get("height", None)
-                                })
-                    except Exception:
-                        continue
-            pages = [{
-                "page_number": 1,
-                "text": text,
-                "tables": tables,
-                "images": images
-            }]
+                html_content = await web_guard(content).call(self.fetch, session, content)
+                pages = await self.parse(session, html_content, content)
+            image_stats = await IMAGE_PIPELINE.process_pages(pages, filename)
             return {
                 "filename": filename,
                 "pages": pages,
-                "page_count": len(pages)
+                "page_count": len(pages),
+                "image_stats": image_stats
             }
         except Exception as e:
-            return {"filename": filename, "error": f"Failed to process URL: {str(e)}"}
\ No newline at end of file
+            return {"filename": filename, "error": f"Failed to process URL: {str(e)}"}
+
+    async def parse(self, session: aiohttp.ClientSession, html_content: str, content: str) -> List[Dict]:
+        soup = BeautifulSoup(html_content, "html.parser")
+        for element in soup(["script", "style"]):
+            element.decompose()
+        text = soup.get_text(separator="\n", strip=True)
+        tables = []
+        for table in soup.find_all("table"):
+            table_data = []
+            for row in table.find_all("tr"):
+                cells = [cell.get_text(strip=True) for cell in row.find_all(["td", "th"])]
+                if cells:
+                    table_data.append(cells)
+            if table_data:
+                tables.append(table_data)
+        images = []
+        for img in soup.find_all("img"):
+            src = img.get("src")
+            if src:
+                if not src.startswith("http"):
+                    src = urljoin(content, src)
+                try:
+                    img_bytes = await web_guard(src).call(self.fetch, session, src, as_text=False)
+                    images.append({
+                        "format": src.split(".")[-1].lower() or "unknown",
+                        "blob": img_bytes,
+                        "width": img.get("width", None),
+                        "height": img.get("height", None)
+                    })
+                except Exception:
+                    continue
+        # long articles are split into several pages, tables and images stay on the first one
+        pages = [{
+            "page_number": page_number,
+            "text": chunk,
+            "tables": tables if page_number == 1 else [],
+            "images": images if page_number == 1 else []
+        } for page_number, chunk in enumerate(self.chunker.split(text) or [""], 1)]
+        return pages
@@ -7,6 +7,7 @@ from google import genai
 from google.genai import types
 from .base import FileProcessor
 from ..core.config import GEMINI_API_KEY
+from ..services.resilience.resilience import get_guard
 
 
 class VideoResponse(BaseModel):
@@ -38,7 +39,8 @@ class VideoProcessor(FileProcessor):
             )
 
             try:
-                response = self.client.models.generate_content(
+                response = await get_guard("gemini").call(
+                    self.client.models.generate_content,
                     model="gemini-2.0-flash",
                     contents=[
                         types.Part.from_bytes(
@@ -0,0 +1,120 @@
+"""
+Production server: several worker processes behind one socket.
+
+    python -m app.serve                            # SERVE_WORKERS workers, one per core by default
+    python -m app.serve --workers 4 --app benchmarks.serve_app:app
+
+With gunicorn installed the app and its heavy libraries are imported once in the master and the workers are
+forked from it, so the imported code and warmed state are shared copy-on-write instead of loaded once per worker.
+SIGTERM makes every worker stop accepting, finish (or, past the grace time, checkpoint) the requests it is
+serving, and run the lifespan shutdown. Without gunicorn uvicorn's own supervisor is used, which spawns each
+worker from scratch.
+"""
+import gc
+import argparse
+import importlib
+import mimetypes
+
+import uvicorn
+
+from .core.config import UVICORN_HOST, UVICORN_PORT, SERVE_WORKERS, SERVE_GRACEFUL_TIMEOUT_SECONDS, \
+    SERVE_WORKER_TIMEOUT_SECONDS, SERVE_KEEPALIVE_SECONDS
+from .services.logging.logger import logger, LOG_PIPELINE
+
+DEFAULT_APP = "app.main:app"
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class GracefulUvicornWorker(UvicornWorker):
+        # gunicorn's graceful_timeout only bounds the whole worker, uvicorn cancels the open requests itself
+        # once its own timeout runs out, which gives the ingests the chance to save what they parsed
+        CONFIG_KWARGS = {
+            **UvicornWorker.CONFIG_KWARGS,
+            "timeout_graceful_shutdown": SERVE_GRACEFUL_TIMEOUT_SECONDS,
+            "access_log": False
+        }
+
+    class PreloadedApplication(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+except ImportError:
+    BaseApplication = None
+
+
+def load_app(app_path: str):
+    module_name, _, attribute = app_path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def preload(app_path: str):
+    """
+    Import the app and warm what every worker would otherwise build on its first request, then move everything
+    allocated so far out of the garbage collector's reach, so that collections in the workers do not touch (and
+    copy) the shared pages.
+    """
+    app = load_app(app_path)
+    from PIL import Image
+    from .services.retrieval.retrieval import VECTOR_STORE
+    Image.init()
+    mimetypes.init()
+    VECTOR_STORE.get_embedder()
+    gc.freeze()
+    return app
+
+
+def post_fork(server, worker):
+    # the log listener thread stayed in the master
+    LOG_PIPELINE.restart()
+
+
+def serve(app_path: str, workers: int, host: str, port: int):
+    if BaseApplication is None:
+        logger.warning("gunicorn is not installed, serving with uvicorn workers (no preloading)")
+        uvicorn.run(
+            app_path,
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=SERVE_GRACEFUL_TIMEOUT_SECONDS,
+            access_log=False
+        )
+        return
+
+    app = preload(app_path)
+    logger.info(f"Serving {app_path} on {host}:{port} with {workers} preloaded workers")
+    PreloadedApplication(app, {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "app.serve.GracefulUvicornWorker",
+        "preload_app": True,
+        # a little longer than uvicorn's own grace time, so that the cancelled requests can save their work
+        "graceful_timeout": SERVE_GRACEFUL_TIMEOUT_SECONDS + 10,
+        "timeout": SERVE_WORKER_TIMEOUT_SECONDS,
+        "keepalive": SERVE_KEEPALIVE_SECONDS,
+        "post_fork": post_fork,
+    }).run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default=DEFAULT_APP)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default=UVICORN_HOST)
+    parser.add_argument("--port", type=int, default=UVICORN_PORT)
+    args = parser.parse_args()
+    serve(args.app, args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import json
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+
+from ...core.config import CREDENTIAL_REFRESH_MARGIN_SECONDS, CREDENTIAL_REFRESH_CHECK_SECONDS, \
+    CREDENTIAL_CACHE_MAX_USERS
+from ...db.connection import db
+from ..logging.logger import logger
+from ..resilience.resilience import get_guard
+
+
+class CredentialError(Exception):
+    pass
+
+
+def refresh_blocking(credentials: Credentials) -> Credentials:
+    credentials.refresh(Request())
+    return credentials
+
+
+class CredentialManager:
+    """
+    Google credentials of every user that recently used drive, kept in memory. A background task refreshes
+    them `refresh_margin` seconds before they expire so that requests get a valid token without waiting on
+    google. Loads and refreshes are single flight: concurrent requests for one user share one of each.
+    """
+    def __init__(self, refresh_margin: float = CREDENTIAL_REFRESH_MARGIN_SECONDS,
+                 check_interval: float = CREDENTIAL_REFRESH_CHECK_SECONDS,
+                 max_users: int = CREDENTIAL_CACHE_MAX_USERS,
+                 refresher: Callable[[Credentials], Credentials] = refresh_blocking,
+                 clock: Callable[[], datetime] = datetime.utcnow):
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.check_interval = check_interval
+        self.max_users = max_users
+        self.refresher = refresher
+        self.clock = clock
+        self.cache: "OrderedDict[str, Credentials]" = OrderedDict()
+        self.inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "loads": 0, "refreshes": 0, "background_refreshes": 0, "refresh_failures": 0}
+
+    def expires_in(self, credentials: Credentials) -> Optional[timedelta]:
+        # google-auth keeps expiry as a naive utc datetime, None means the token does not expire
+        return credentials.expiry - self.clock() if credentials.expiry else None
+
+    def is_usable(self, credentials: Credentials) -> bool:
+        expires_in = self.expires_in(credentials)
+        return bool(credentials.token) and (expires_in is None or expires_in > timedelta(seconds=10))
+
+    def is_due(self, credentials: Credentials) -> bool:
+        expires_in = self.expires_in(credentials)
+        return bool(credentials.refresh_token) and expires_in is not None and expires_in <= self.refresh_margin
+
+    def remember(self, user_id: str, credentials: Credentials):
+        self.cache[user_id] = credentials
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.max_users:
+            self.cache.popitem(last=False)
+
+    def forget(self, user_id: str):
+        self.cache.pop(user_id, None)
+
+    def single_flight(self, kind: str, user_id: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        key = (kind, user_id)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return task
+
+    async def load(self, user_id: str) -> Credentials:
+        self.stats["loads"] += 1
+        token_doc = await db["Tokens"].find_one({"user_id": user_id})
+        if not token_doc or "credentials" not in token_doc:
+            raise CredentialError("User not authenticated with Google Drive")
+        credentials = Credentials.from_authorized_user_info(token_doc["credentials"])
+        self.remember(user_id, credentials)
+        return credentials
+
+    async def refresh(self, user_id: str, credentials: Credentials) -> Credentials:
+        if not credentials.refresh_token:
+            self.forget(user_id)
+            raise CredentialError("Token expired and no refresh token available.")
+        # refreshed on a copy, requests still holding the cached credentials keep a token that works
+        refreshed = Credentials.from_authorized_user_info(json.loads(credentials.to_json()))
+        try:
+            refreshed = await get_guard("google_oauth").call(self.refresher, refreshed)
+        except Exception as e:
+            self.stats["refresh_failures"] += 1
+            if not self.is_usable(credentials):
+                # revoked or expired refresh token, the next request reads Tokens again
+                self.forget(user_id)
+            raise CredentialError(f"Failed to refresh Google credentials: {str(e)}") from e
+        self.stats["refreshes"] += 1
+        await db["Tokens"].update_one(
+            {"user_id": user_id},
+            {"$set": {"credentials": json.loads(refreshed.to_json())}}
+        )
+        self.remember(user_id, refreshed)
+        return refreshed
+
+    async def get(self, user_id: str) -> Credentials:
+        credentials = self.cache.get(user_id)
+        if credentials is None:
+            credentials = await asyncio.shield(self.single_flight("load", user_id, lambda: self.load(user_id)))
+        else:
+            self.stats["hits"] += 1
+            self.cache.move_to_end(user_id)
+        if not self.is_usable(credentials):
+            return await asyncio.shield(
+                self.single_flight("refresh", user_id, lambda: self.refresh(user_id, credentials))
+            )
+        if self.is_due(credentials):
+            # still valid, the caller goes ahead with it while the refresh runs
+            self.refresh_in_background(user_id, credentials)
+        return credentials
+
+    def store(self, user_id: str, credentials: Credentials):
+        # a fresh grant from the oauth callback replaces whatever was cached
+        self.remember(user_id, credentials)
+
+    def refresh_in_background(self, user_id: str, credentials: Credentials):
+        if ("refresh", user_id) in self.inflight:
+            return
+        self.stats["background_refreshes"] += 1
+        task = self.single_flight("refresh", user_id, lambda: self.refresh(user_id, credentials))
+        task.add_done_callback(lambda done: self.log_failure(user_id, done))
+
+    @staticmethod
+    def log_failure(user_id: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background refresh of Google credentials failed for user {user_id}: {str(task.exception())}")
+
+    def refresh_due(self) -> int:
+        due = [(user_id, credentials) for user_id, credentials in self.cache.items() if self.is_due(credentials)]
+        for user_id, credentials in due:
+            self.refresh_in_background(user_id, credentials)
+        return len(due)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logger.error(f"Credential refresh loop failed: {str(e)}")
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for task in list(self.inflight.values()):
+            task.cancel()
+
+    def state(self) -> Dict:
+        return {"cached_users": len(self.cache), "inflight": len(self.inflight), **self.stats}
+
+
+CREDENTIAL_MANAGER = CredentialManager()
@@ -0,0 +1,152 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from ...core.config import BLOB_CACHE_MAX_BYTES
+from ...db.connection import db
+from ...processors.pdf_processor import extract_image
+from ..logging.logger import logger
+from ..profiling.profiling import span
+
+# original files of sources with lazily extracted images, and the images extracted from them so far. Files are
+# named `<source_id>/original` and `<source_id>/images/<xref>.<variant>` and carry the source id in their metadata
+BLOB_BUCKET = "SourceFiles"
+IMAGE_VARIANTS = ("image", "thumbnail")
+MEDIA_TYPES = {"jpeg": "image/jpeg", "jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+bucket = AsyncIOMotorGridFSBucket(db, bucket_name=BLOB_BUCKET)
+
+
+async def ensure_blob_indexes():
+    await db[f"{BLOB_BUCKET}.files"].create_index([("metadata.source_id", 1)], name="source_id")
+
+
+async def read_blob(name: str) -> Optional[Tuple[bytes, Dict]]:
+    try:
+        stream = await bucket.open_download_stream_by_name(name)
+    except NoFile:
+        return None
+    return await stream.read(), stream.metadata or {}
+
+
+async def write_blob(name: str, data: bytes, metadata: Dict):
+    await bucket.upload_from_stream(name, data, metadata=metadata)
+
+
+async def store_originals(sources: List[Dict]):
+    """
+    Move the `original` file off freshly parsed sources (with their `_id`) into gridfs.
+    """
+    for source in sources:
+        original = source.pop("original", None)
+        if original is not None:
+            source_id = str(source["_id"])
+            await write_blob(f"{source_id}/original", original, {"source_id": source_id, "kind": "original"})
+
+
+async def delete_source_blobs(source_ids: List[str]):
+    if not source_ids:
+        return
+    async for blob in db[f"{BLOB_BUCKET}.files"].find({"metadata.source_id": {"$in": source_ids}}, {"_id": 1}):
+        await bucket.delete(blob["_id"])
+
+
+class BlobCache:
+    """
+    Bytes kept in process, least recently used out first once `max_bytes` is exceeded.
+    """
+    def __init__(self, max_bytes: int = BLOB_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[Tuple, Tuple[bytes, str]]" = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[Tuple[bytes, str]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple, data: bytes, image_format: str):
+        if len(data) > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[0])
+        self.entries[key] = (data, image_format)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class PdfImages:
+    """
+    Images of lazily ingested pdfs. The first request for an image extracts it from the original (and builds its
+    thumbnail) and stores both in gridfs, later requests in any worker read them from there or from the
+    in-process cache. Concurrent requests for one image share a single extraction.
+    """
+    def __init__(self, cache: Optional[BlobCache] = None):
+        self.cache = cache or BlobCache()
+        self.inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.stats = {"hits": 0, "stored": 0, "extracted": 0}
+
+    async def original(self, source_id: str) -> Optional[bytes]:
+        key = (source_id, "original")
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached[0]
+        blob = await read_blob(f"{source_id}/original")
+        if blob is None:
+            return None
+        self.cache.put(key, blob[0], "pdf")
+        return blob[0]
+
+    async def extract(self, source_id: str, xref: int) -> Optional[Dict]:
+        content = await self.original(source_id)
+        if content is None:
+            return None
+        with span("pdf.extract_image"):
+            image = await asyncio.to_thread(extract_image, content, xref)
+        self.stats["extracted"] += 1
+        for variant in IMAGE_VARIANTS:
+            data = image[variant] or image["image"]
+            await write_blob(
+                f"{source_id}/images/{xref}.{variant}",
+                data,
+                {"source_id": source_id, "kind": variant, "xref": xref, "format": image["format"]}
+            )
+            self.cache.put((source_id, xref, variant), data, image["format"])
+        logger.info("Extracted image %s of source %s on first request", xref, source_id)
+        return image
+
+    async def get(self, source_id: str, xref: int, variant: str = "image") -> Optional[Tuple[bytes, str]]:
+        """
+        The image (or its thumbnail) as stored bytes and their format, None when the source has no such image.
+        """
+        cached = self.cache.get((source_id, xref, variant))
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        blob = await read_blob(f"{source_id}/images/{xref}.{variant}")
+        if blob is not None:
+            self.stats["stored"] += 1
+            data, metadata = blob
+            self.cache.put((source_id, xref, variant), data, metadata.get("format"))
+            return data, metadata.get("format")
+
+        key = (source_id, xref)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.extract(source_id, xref))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        image = await asyncio.shield(task)
+        if image is None:
+            return None
+        return image[variant] or image["image"], image["format"]
+
+
+PDF_IMAGES = PdfImages()
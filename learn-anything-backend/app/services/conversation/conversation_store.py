@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, DESCENDING
+from pymongo.errors import BulkWriteError
+
+from ...core.config import MESSAGES_PAGE_SIZE, CONVERSATION_CONTEXT_MESSAGES
+from ...db.connection import db
+from ...models.conversation import Conversation, Message, MessageRole
+
+# one document per message, a turn only ever inserts one small document and bumps counters on the conversation
+MESSAGES_COLLECTION = "Messages"
+CONVERSATIONS_COLLECTION = "Conversations"
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def ensure_conversation_indexes():
+    await db[MESSAGES_COLLECTION].create_index(
+        [("conversation_id", 1), ("seq", 1)],
+        name="conversation_seq",
+        unique=True
+    )
+
+
+def serialize_message(message: Dict) -> Dict:
+    message.pop("_id", None)
+    return message
+
+
+async def create_conversation(conversation: Conversation) -> str:
+    result = await db[CONVERSATIONS_COLLECTION].insert_one(conversation.model_dump())
+    return str(result.inserted_id)
+
+
+async def get_conversation(user_id: str, conversation_id: str) -> Optional[Dict]:
+    if not ObjectId.is_valid(conversation_id):
+        return None
+    conversation = await db[CONVERSATIONS_COLLECTION].find_one({"_id": ObjectId(conversation_id), "user_id": user_id})
+    if conversation and conversation.get("history"):
+        conversation = await migrate_history(conversation)
+    return conversation
+
+
+async def migrate_history(conversation: Dict) -> Dict:
+    """
+    Conversations created before the Messages collection keep their turns in an embedded `history` list.
+    Move them out once, the first time such a conversation is opened. Safe to run concurrently and to rerun
+    after a partial failure: messages already inserted are skipped and only one run drops the history.
+    """
+    conversation_id = str(conversation["_id"])
+    created_at = conversation.get("created_at") or datetime.utcnow()
+    messages = [
+        Message(
+            conversation_id=conversation_id,
+            seq=seq,
+            role=turn.get("role", MessageRole.user),
+            content=turn.get("content", ""),
+            usage=turn.get("usage") or {},
+            created_at=turn.get("created_at") or created_at
+        ).model_dump()
+        for seq, turn in enumerate(conversation["history"], start=1)
+    ]
+    try:
+        await db[MESSAGES_COLLECTION].insert_many(messages, ordered=False)
+    except BulkWriteError as e:
+        # (conversation_id, seq) is unique, duplicates are messages a concurrent or earlier run already moved
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+            raise
+    migrated = await db[CONVERSATIONS_COLLECTION].find_one_and_update(
+        {"_id": conversation["_id"], "history": {"$exists": True}},
+        {"$unset": {"history": ""}, "$set": {"message_count": len(messages)}},
+        return_document=ReturnDocument.AFTER
+    )
+    # another run finished first, its message_count may already have moved on
+    return migrated or await db[CONVERSATIONS_COLLECTION].find_one({"_id": conversation["_id"]})
+
+
+def is_usage_key(key: str) -> bool:
+    # keys become update paths, a dot or a dollar sign would address other fields
+    return isinstance(key, str) and bool(key) and "." not in key and "$" not in key
+
+
+def usage_increments(usage: Dict) -> Dict:
+    return {
+        f"usage.{key}": value for key, value in usage.items()
+        if is_usage_key(key) and isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+async def append_message(conversation_id: str, role: MessageRole, content: str, usage: Optional[Dict] = None) -> Dict:
+    """
+    Reserves the next seq and adds the message usage to the conversation totals in one atomic update, then
+    inserts the message. Cost is independent of how long the conversation already is.
+    """
+    usage = usage or {}
+    conversation = await db[CONVERSATIONS_COLLECTION].find_one_and_update(
+        {"_id": ObjectId(conversation_id)},
+        {"$inc": {"message_count": 1, **usage_increments(usage)}},
+        projection={"message_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if conversation is None:
+        raise ValueError(f"Conversation {conversation_id} does not exist")
+    message = Message(
+        conversation_id=conversation_id,
+        seq=conversation["message_count"],
+        role=role,
+        content=content,
+        usage=usage,
+        created_at=datetime.utcnow()
+    ).model_dump()
+    await db[MESSAGES_COLLECTION].insert_one(message)
+    return serialize_message(message)
+
+
+async def list_messages(conversation_id: str, before: Optional[int] = None, limit: int = MESSAGES_PAGE_SIZE) -> Dict:
+    """
+    Newest first page of messages with seq < `before`, `next_cursor` is the `before` of the following page.
+    """
+    query = {"conversation_id": conversation_id}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    messages = [
+        serialize_message(message) async for message in
+        db[MESSAGES_COLLECTION].find(query).sort("seq", DESCENDING).limit(limit)
+    ]
+    next_cursor = messages[-1]["seq"] if len(messages) == limit and messages[-1]["seq"] > 1 else None
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+async def load_context(conversation: Dict, last_n: int = CONVERSATION_CONTEXT_MESSAGES) -> Dict:
+    """
+    What a prompt needs: the rolling summary plus at most `last_n` messages that are not folded into it yet.
+    """
+    summary_seq = conversation.get("summary_seq", 0)
+    messages = [
+        serialize_message(message) async for message in
+        db[MESSAGES_COLLECTION].find(
+            {"conversation_id": str(conversation["_id"]), "seq": {"$gt": summary_seq}}
+        ).sort("seq", DESCENDING).limit(last_n)
+    ]
+    messages.reverse()
+    return {
+        "summary": conversation.get("summary"),
+        "summary_seq": summary_seq,
+        "messages": messages,
+        # messages after the checkpoint that did not fit, a hint that the summary should be rolled forward
+        "unsummarized": conversation.get("message_count", 0) - summary_seq - len(messages)
+    }
+
+
+async def save_summary(conversation_id: str, summary: str, upto_seq: int) -> bool:
+    """
+    Moves the summary checkpoint forward. An older summary never replaces a newer one.
+    """
+    result = await db[CONVERSATIONS_COLLECTION].update_one(
+        {"_id": ObjectId(conversation_id), "summary_seq": {"$lt": upto_seq}, "message_count": {"$gte": upto_seq}},
+        {"$set": {"summary": summary, "summary_seq": upto_seq}}
+    )
+    return result.modified_count == 1
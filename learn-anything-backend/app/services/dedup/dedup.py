@@ -0,0 +1,202 @@
+import re
+import asyncio
+import hashlib
+from datetime import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+
+from ...core.config import DEDUP_NUM_PERMUTATIONS, DEDUP_BANDS, DEDUP_SHINGLE_WORDS, DEDUP_THRESHOLD, \
+    DEDUP_MIN_WORDS
+from ...db.connection import db
+from ..logging.logger import logger
+from ..search.search_index import page_search_text
+
+# one document per signed page: the minhash signature and its band keys. The multikey index on
+# (workspace_id, bands) is the lsh index, a lookup reads the pages sharing a band instead of the whole workspace
+SIGNATURE_COLLECTION = "PageSignatures"
+WORD = re.compile(r"\w+")
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+# fixed seed, signatures are persisted and only comparable when every process uses the same permutations
+_permutations = np.random.RandomState(1)
+PERMUTATION_A = _permutations.randint(1, MERSENNE_PRIME, size=DEDUP_NUM_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _permutations.randint(0, MERSENNE_PRIME, size=DEDUP_NUM_PERMUTATIONS, dtype=np.uint64)
+BAND_ROWS = DEDUP_NUM_PERMUTATIONS // DEDUP_BANDS
+
+
+async def ensure_dedup_indexes():
+    await db[SIGNATURE_COLLECTION].create_index([("workspace_id", 1), ("bands", 1)], name="workspace_bands")
+    await db[SIGNATURE_COLLECTION].create_index([("source_id", 1)], name="source_id")
+    await db[SIGNATURE_COLLECTION].create_index(
+        [("workspace_id", 1), ("duplicate_of.source_id", 1)],
+        name="workspace_duplicate_of",
+        partialFilterExpression={"duplicate_of": {"$type": "object"}}
+    )
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    words = WORD.findall(text.lower())
+    if len(words) < DEDUP_MIN_WORDS:
+        return None
+    shingles = {
+        " ".join(words[start:start + DEDUP_SHINGLE_WORDS])
+        for start in range(len(words) - DEDUP_SHINGLE_WORDS + 1)
+    }
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+         for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # (a * x + b) mod p per permutation, the multiplication wraps around at 64 bits which keeps it cheap and
+    # is still random enough for estimating jaccard similarity
+    values = (hashes[:, None] * PERMUTATION_A + PERMUTATION_B) % MERSENNE_PRIME & MAX_HASH
+    return values.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    # the band number is part of the key, equal rows in different bands are not a match
+    keys = []
+    for band in range(DEDUP_BANDS):
+        rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    return float(np.mean(first == second))
+
+
+def sign_sources(sources: List[Dict]) -> List[Dict]:
+    signed_at = datetime.utcnow()
+    signatures = []
+    for source in sources:
+        for page in source.get("pages") or []:
+            signature = minhash(page_search_text(page))
+            if signature is None:
+                continue
+            signatures.append({
+                "workspace_id": source["workspace_id"],
+                "source_id": str(source["_id"]),
+                "page_number": page.get("page_number"),
+                "signature": signature,
+                "bands": band_keys(signature),
+                "duplicate_of": None,
+                "signed_at": signed_at,
+                "page": page
+            })
+    return signatures
+
+
+def canonical_of(candidate: Dict) -> Dict:
+    # duplicates always point at the first copy, never at another duplicate
+    return candidate["duplicate_of"] or {"source_id": candidate["source_id"], "page_number": candidate["page_number"]}
+
+
+async def find_duplicates(sources: List[Dict]) -> List[Dict]:
+    """
+    Sign the pages of freshly parsed sources (with their `_id`) and link every page that is a near duplicate of
+    a page already in the workspace, or of an earlier page of the same sources, to its canonical copy by setting
+    `duplicate_of` on the page. Returns the signatures, stored with save_signatures once the sources are.
+    """
+    signatures = await asyncio.to_thread(sign_sources, sources)
+    by_workspace = defaultdict(list)
+    for signature in signatures:
+        by_workspace[signature["workspace_id"]].append(signature)
+
+    linked = 0
+    for workspace_id, workspace_signatures in by_workspace.items():
+        buckets = defaultdict(list)
+        bands = list({band for item in workspace_signatures for band in item["bands"]})
+        # one round trip per workspace for the stored pages sharing a band with any of the new ones
+        async for stored in db[SIGNATURE_COLLECTION].find(
+                {"workspace_id": workspace_id, "bands": {"$in": bands}},
+                {"source_id": 1, "page_number": 1, "signature": 1, "bands": 1, "duplicate_of": 1}
+        ):
+            stored["signature"] = np.frombuffer(stored["signature"], dtype=np.uint32)
+            for band in stored["bands"]:
+                buckets[band].append(stored)
+
+        for item in workspace_signatures:
+            best, best_similarity = None, DEDUP_THRESHOLD
+            seen = set()
+            for band in item["bands"]:
+                for candidate in buckets[band]:
+                    if id(candidate) in seen:
+                        continue
+                    seen.add(id(candidate))
+                    candidate_similarity = similarity(item["signature"], candidate["signature"])
+                    if candidate_similarity >= best_similarity:
+                        best, best_similarity = candidate, candidate_similarity
+            if best is not None:
+                item["duplicate_of"] = {**canonical_of(best), "similarity": round(best_similarity, 3)}
+                item["page"]["duplicate_of"] = item["duplicate_of"]
+                linked += 1
+            for band in item["bands"]:
+                buckets[band].append(item)
+
+    if linked:
+        logger.info("Linked %d of %d pages to near duplicates already in their workspace", linked, len(signatures))
+    return signatures
+
+
+async def save_signatures(signatures: List[Dict]):
+    if signatures:
+        await db[SIGNATURE_COLLECTION].bulk_write([
+            InsertOne({
+                **{key: value for key, value in signature.items() if key != "page"},
+                "signature": signature["signature"].tobytes()
+            })
+            for signature in signatures
+        ], ordered=False)
+
+
+def page_duplicate_update(source_id: str, page_number: int, duplicate_of: Optional[Dict]) -> UpdateOne:
+    page_field = "pages.$[page].duplicate_of"
+    update = {"$set": {page_field: duplicate_of}} if duplicate_of else {"$unset": {page_field: ""}}
+    return UpdateOne({"_id": ObjectId(source_id)}, update, array_filters=[{"page.page_number": page_number}])
+
+
+async def remove_signatures(workspace_id: str, source_ids: List[str]):
+    """
+    Drop the signatures of deleted sources. Pages that pointed at one of their pages are relinked: the oldest
+    copy becomes the new canonical page and the others point at it.
+    """
+    if not source_ids:
+        return
+    await db[SIGNATURE_COLLECTION].delete_many({"source_id": {"$in": source_ids}})
+    orphans = defaultdict(list)
+    async for orphan in db[SIGNATURE_COLLECTION].find(
+            {"workspace_id": workspace_id, "duplicate_of.source_id": {"$in": source_ids}},
+            {"source_id": 1, "page_number": 1, "signature": 1, "duplicate_of": 1}
+    ).sort([("signed_at", 1), ("_id", 1)]):
+        orphans[(orphan["duplicate_of"]["source_id"], orphan["duplicate_of"]["page_number"])].append(orphan)
+
+    signature_updates, source_updates = [], []
+    for copies in orphans.values():
+        canonical, rest = copies[0], copies[1:]
+        signature_updates.append(UpdateOne({"_id": canonical["_id"]}, {"$set": {"duplicate_of": None}}))
+        source_updates.append(page_duplicate_update(canonical["source_id"], canonical["page_number"], None))
+        for copy in rest:
+            duplicate_of = {
+                "source_id": canonical["source_id"],
+                "page_number": canonical["page_number"],
+                "similarity": round(similarity(
+                    np.frombuffer(copy["signature"], dtype=np.uint32),
+                    np.frombuffer(canonical["signature"], dtype=np.uint32)
+                ), 3)
+            }
+            signature_updates.append(UpdateOne({"_id": copy["_id"]}, {"$set": {"duplicate_of": duplicate_of}}))
+            source_updates.append(page_duplicate_update(copy["source_id"], copy["page_number"], duplicate_of))
+    if signature_updates:
+        await db[SIGNATURE_COLLECTION].bulk_write(signature_updates, ordered=False)
+        await db["Sources"].bulk_write(source_updates, ordered=False)
+        logger.info(
+            "Relinked %d near duplicate pages of deleted sources in %s", len(signature_updates), workspace_id
+        )
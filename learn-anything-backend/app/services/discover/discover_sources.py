@@ -1,15 +1,20 @@
-import uuid
-import asyncio
 import datetime
+import dataclasses
 
 from exa_py import Exa
 
 from ...core.config import EXA_API_KEY
+from ..resilience.resilience import get_guard
 
 exa = Exa(EXA_API_KEY)
 
+
+def as_dict(value):
+    # exa returns dataclasses, discovered sources are stored as plain documents
+    return dataclasses.asdict(value) if dataclasses.is_dataclass(value) else value
+
+
 async def discover_additional_web_sources(query):
-    loop = asyncio.get_event_loop()
     final_discovered_sources = []
 
     # pre-process the query and divide it into categories to get sources from
@@ -43,11 +48,10 @@ async def discover_additional_web_sources(query):
             start_published_date=query.get("start_date"),
             end_published_date=query.get("end_date"),
         )
-        results = await loop.run_in_executor(None, search_func)
+        results = await get_guard("exa").call(search_func)
         final_discovered_sources.append({
-            "batch_id": str(uuid.uuid4()),
-            "sources": results.results,
-            "usage": results.cost_dollars
+            "sources": [as_dict(result) for result in results.results],
+            "usage": as_dict(results.cost_dollars) or {}
         })
 
     return final_discovered_sources
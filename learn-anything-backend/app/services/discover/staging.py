@@ -0,0 +1,147 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne
+
+from ...core.config import DISCOVER_STAGING_TTL_SECONDS, DISCOVER_PROMOTE_CLAIM_SECONDS
+from ...db.connection import db
+from ...models.source import Source, Subtype
+from ..ingest.ingest import insert_sources
+from ..logging.logger import logger
+
+# discover results live here, one document per candidate source, until the user finalizes the batch. Mongo's
+# ttl monitor drops batches that are never finalized. A finalize marks the sources it promotes with a `claim`
+STAGING_COLLECTION = "DiscoveredStaging"
+
+
+async def ensure_discover_indexes():
+    await db[STAGING_COLLECTION].create_index(
+        [("staged_at", 1)],
+        name="staged_at_ttl",
+        expireAfterSeconds=DISCOVER_STAGING_TTL_SECONDS
+    )
+    await db[STAGING_COLLECTION].create_index(
+        [("batch_id", 1), ("user_id", 1), ("workspace_id", 1)],
+        name="batch"
+    )
+    await db["Sources"].create_index(
+        [("workspace_id", 1), ("url", 1)],
+        name="workspace_url",
+        partialFilterExpression={"url": {"$type": "string"}}
+    )
+
+
+async def existing_urls(workspace_id: str, urls: List[str]) -> Set[str]:
+    if not urls:
+        return set()
+    existing = set()
+    # url sources from before the url field only carry the url as their name
+    async for source in db["Sources"].find(
+            {"workspace_id": workspace_id, "$or": [
+                {"url": {"$in": urls}},
+                {"type": Subtype.url, "name": {"$in": urls}}
+            ]},
+            {"url": 1, "name": 1}
+    ):
+        existing.add(source.get("url") or source["name"])
+    return existing
+
+
+async def stage_discovered(user_id: str, workspace_id: str, discovered: List[Dict]) -> Tuple[str, List[Dict]]:
+    """
+    Stage the results of one discover call under a single batch id. Urls repeated across the result categories
+    or already in the workspace are skipped. Returns the batch id and the staged {source_id: url} pairs.
+    """
+    batch_id = str(uuid.uuid4())
+    candidates = []
+    seen = set()
+    for category in discovered:
+        for result in category["sources"]:
+            if not result.get("url") or result["url"] in seen:
+                continue
+            seen.add(result["url"])
+            candidates.append((result, category["usage"]))
+    existing = await existing_urls(workspace_id, list(seen))
+
+    staged_at = datetime.utcnow()
+    operations = []
+    staged = []
+    for result, usage in candidates:
+        if result["url"] in existing:
+            continue
+        source_id = ObjectId()
+        source = Source.document(
+            user_id=user_id,
+            workspace_id=workspace_id,
+            name=result.get("title") or result["url"],
+            type=Subtype.discovered,
+            size=0.0,
+            page_count=1,
+            pages=[{
+                "page_number": 1,
+                "text": result.get("text") or "",
+                "url": result["url"],
+                "author": result.get("author"),
+                "tables": [],
+                "images": []
+            }],
+            usage=usage,
+            batch_id=batch_id,
+            url=result["url"],
+            created_at=staged_at
+        )
+        operations.append(InsertOne({**source, "_id": source_id, "staged_at": staged_at}))
+        staged.append({str(source_id): result["url"]})
+    if operations:
+        await db[STAGING_COLLECTION].bulk_write(operations, ordered=False)
+    logger.info(
+        "Staged %d discovered sources in batch %s, skipped %d urls already in workspace %s",
+        len(staged), batch_id, len(existing), workspace_id
+    )
+    return batch_id, staged
+
+
+async def promote_staged(user_id: str, workspace_id: str, batch_id: str, source_ids: List[str]) -> List[Dict]:
+    """
+    Move the selected sources of a batch into Sources (and the search / vector indexes) with one bulk insert
+    and drop the rest of the batch. The selected sources are claimed first, so a batch finalized twice at the
+    same time is only promoted once. A failed promotion gives its claim back so that it can be retried.
+    """
+    batch_filter = {"user_id": user_id, "workspace_id": workspace_id, "batch_id": batch_id}
+    now = datetime.utcnow()
+    claim = {"id": str(ObjectId()), "at": now}
+    await db[STAGING_COLLECTION].update_many(
+        {
+            **batch_filter,
+            "_id": {"$in": [ObjectId(source_id) for source_id in source_ids]},
+            # a claim outlives its promotion only when the worker died, it is taken over after a while
+            "$or": [
+                {"claim": {"$exists": False}},
+                {"claim.at": {"$lt": now - timedelta(seconds=DISCOVER_PROMOTE_CLAIM_SECONDS)}}
+            ]
+        },
+        {"$set": {"claim": claim}}
+    )
+    selected = [
+        source async for source in db[STAGING_COLLECTION].find(
+            {**batch_filter, "claim.id": claim["id"]},
+            {"staged_at": 0, "claim": 0}
+        )
+    ]
+    try:
+        # another batch, or an earlier attempt at this one that failed half way, may have added the url already
+        existing = await existing_urls(workspace_id, [source["url"] for source in selected])
+        sources = [source for source in selected if source["url"] not in existing]
+        for source in sources:
+            source["created_at"] = datetime.utcnow()
+        await insert_sources(sources, "discovered")
+    except Exception:
+        await db[STAGING_COLLECTION].update_many({**batch_filter, "claim.id": claim["id"]}, {"$unset": {"claim": ""}})
+        raise
+    # sources another finalize of the batch is still promoting are left to it
+    await db[STAGING_COLLECTION].delete_many(
+        {**batch_filter, "$or": [{"claim": {"$exists": False}}, {"claim.id": claim["id"]}]}
+    )
+    return sources
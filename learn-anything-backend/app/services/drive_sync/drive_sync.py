@@ -0,0 +1,330 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ...core.config import DRIVE_SYNC_LOCK_SECONDS
+from ...core.registry import GOOGLE_DRIVE_PROCESSOR
+from ...db.connection import db
+from ...models.source import Source, Subtype
+from ...processors.google_drive_processor import GoogleDriveProcessor, FOLDER_MIME_TYPE, FILE_FIELDS
+from ..ingest.ingest import new_source, insert_sources, delete_sources, item_result, log_source_timing, storage_bytes
+from ..logging.logger import logger
+from ..resilience.resilience import get_guard
+
+# one document per user and workspace: the imported roots, the folders below them (with their parents), the
+# changes feed token and every imported file with the fingerprint it had when it was parsed. Files whose last
+# parse failed keep their previous entry plus the `failed` fingerprint, so they are parsed again on the next sync.
+# `lock` is set while a sync of the workspace runs
+DRIVE_SYNC_COLLECTION = "DriveSyncState"
+CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+CHANGES_PAGE_SIZE = 1000
+
+
+class SyncInProgress(Exception):
+    pass
+
+
+async def ensure_drive_sync_indexes():
+    await db[DRIVE_SYNC_COLLECTION].create_index(
+        [("user_id", 1), ("workspace_id", 1)],
+        name="user_workspace",
+        unique=True
+    )
+
+
+def fingerprint(file_metadata: Dict) -> Dict:
+    return {
+        "name": file_metadata["name"],
+        "mimeType": file_metadata["mimeType"],
+        "md5Checksum": file_metadata.get("md5Checksum"),
+        "modifiedTime": file_metadata.get("modifiedTime"),
+        "parents": file_metadata.get("parents", [])
+    }
+
+
+def size_in_mb(file_metadata: Dict) -> float:
+    # rounded like uploads, storage quota is consumed and released from the source size
+    return round(int(file_metadata.get("size") or 0) / (1024 * 1024), 2)
+
+
+def is_unchanged(tracked: Dict, file_metadata: Dict) -> bool:
+    if tracked.get("failed"):
+        return False
+    # google docs / sheets have no md5, their modifiedTime is the only thing to go by
+    if tracked.get("md5Checksum") and file_metadata.get("md5Checksum"):
+        return tracked["md5Checksum"] == file_metadata["md5Checksum"] and tracked["name"] == file_metadata["name"]
+    return tracked.get("modifiedTime") == file_metadata.get("modifiedTime")
+
+
+class DriveSyncer:
+    """
+    Works out what to download for one sync. It does not touch the database: it takes the tracked files of the
+    previous sync and returns the new sync state together with the parsed files and the removed file ids.
+    """
+    def __init__(self, service, processor: GoogleDriveProcessor = GOOGLE_DRIVE_PROCESSOR):
+        self.service = service
+        self.processor = processor
+        self.drive = get_guard("google_drive")
+
+    async def start_page_token(self) -> str:
+        response = await self.drive.call(self.service.changes().getStartPageToken().execute)
+        return response["startPageToken"]
+
+    async def parse(self, file_metadata: Dict) -> Dict:
+        started = time.perf_counter()
+        try:
+            processing_result = await self.processor.parse_file(self.service, file_metadata)
+        except Exception as e:
+            processing_result = {"filename": file_metadata["name"], "error": f"Failed to process Google Drive file: {str(e)}"}
+        log_source_timing(file_metadata["name"], Subtype.drive.value, started, processing_result, sync=True)
+        return processing_result
+
+    async def full_sync(self, root_ids: List[str], tracked: Optional[Dict] = None) -> Dict:
+        """
+        Walk the whole tree. Files that are already tracked and unchanged are not downloaded again.
+        """
+        tracked = tracked or {}
+        # taken before the walk so that edits made while it runs show up in the next sync
+        token = await self.start_page_token()
+        files, folders = await self.processor.list_tree(self.service, root_ids)
+        listed = {file_metadata["id"]: file_metadata for file_metadata in files}
+        parsed = []
+        for file_id, file_metadata in listed.items():
+            if file_id not in tracked or not is_unchanged(tracked[file_id], file_metadata):
+                parsed.append((file_metadata, await self.parse(file_metadata)))
+        return {
+            "root_ids": list(root_ids),
+            "folders": folders,
+            "start_page_token": token,
+            "listed": listed,
+            "parsed": parsed,
+            "removed": [file_id for file_id in tracked if file_id not in listed]
+        }
+
+    async def changed_files(self, token: str):
+        changed = {}
+        while True:
+            page = await self.drive.call(
+                self.service.changes().list(
+                    pageToken=token,
+                    fields=CHANGE_FIELDS,
+                    includeRemoved=True,
+                    spaces="drive",
+                    pageSize=CHANGES_PAGE_SIZE
+                ).execute
+            )
+            # a file can change several times between syncs, only its latest state matters
+            for change in page.get("changes", []):
+                changed[change["fileId"]] = None if change.get("removed") else change.get("file")
+            if "newStartPageToken" in page:
+                return changed, page["newStartPageToken"]
+            token = page["nextPageToken"]
+
+    async def incremental_sync(self, state: Dict) -> Dict:
+        tracked = state["files"]
+        roots = set(state["root_ids"])
+        changed, token = await self.changed_files(state["start_page_token"])
+
+        def alive(file_metadata: Optional[Dict]) -> bool:
+            return bool(file_metadata) and not file_metadata.get("trashed")
+
+        # apply folder changes, then keep the folders still connected to a root. Descendants of a trashed
+        # or moved folder get no change of their own, they fall out here
+        folders = dict(state["folders"])
+        changed_folders = set()
+        for file_id, file_metadata in changed.items():
+            if file_id in folders or (file_metadata and file_metadata["mimeType"] == FOLDER_MIME_TYPE):
+                changed_folders.add(file_id)
+                if alive(file_metadata):
+                    folders[file_id] = file_metadata.get("parents", [])
+                else:
+                    folders.pop(file_id, None)
+        scope = {folder_id for folder_id in roots if folder_id in folders}
+        while True:
+            reached = {
+                folder_id for folder_id, parents in folders.items()
+                if folder_id not in scope and set(parents) & scope
+            }
+            if not reached:
+                break
+            scope |= reached
+        folders = {folder_id: parents for folder_id, parents in folders.items() if folder_id in scope}
+        new_folders = scope - set(state["folders"])
+
+        candidates = {
+            file_id: file_metadata for file_id, file_metadata in changed.items() if file_id not in changed_folders
+        }
+        # files that failed to parse last time get no change of their own either
+        for file_id, tracked_file in tracked.items():
+            if tracked_file.get("failed"):
+                candidates.setdefault(file_id, {"id": file_id, **tracked_file["failed"]})
+        # a folder moved into the tree brings files that have no change of their own
+        if new_folders:
+            files, _ = await self.processor.list_tree(self.service, sorted(new_folders))
+            for file_metadata in files:
+                candidates.setdefault(file_metadata["id"], file_metadata)
+
+        def in_scope(file_id: str, file_metadata: Optional[Dict]) -> bool:
+            return alive(file_metadata) and (file_id in roots or bool(set(file_metadata.get("parents", [])) & scope))
+
+        listed = {}
+        parsed = []
+        removed = []
+        for file_id, file_metadata in candidates.items():
+            if not in_scope(file_id, file_metadata):
+                if file_id in tracked:
+                    removed.append(file_id)
+                continue
+            listed[file_id] = file_metadata
+            if file_id not in tracked or not is_unchanged(tracked[file_id], file_metadata):
+                parsed.append((file_metadata, await self.parse(file_metadata)))
+        # files of a folder that was trashed or moved out of the tree
+        for file_id, tracked_file in tracked.items():
+            if file_id not in candidates and file_id not in roots and not set(tracked_file["parents"]) & scope:
+                removed.append(file_id)
+
+        return {
+            "root_ids": state["root_ids"],
+            "folders": folders,
+            "start_page_token": token,
+            "listed": listed,
+            "parsed": parsed,
+            "removed": removed
+        }
+
+
+async def sync_drive(
+        user_id: str,
+        workspace_id: str,
+        root_ids: List[str],
+        credentials_json: str,
+        include_pages: bool = False,
+        processor: GoogleDriveProcessor = GOOGLE_DRIVE_PROCESSOR
+) -> Dict:
+    """
+    First sync of a set of roots imports everything, later syncs only apply what the changes feed reports.
+    Edited files replace their source, files that are gone take their source with them. The outcome has the
+    number of files parsed and the storage the new sources take, which is what the sync is charged.
+    """
+    lock_id = str(ObjectId())
+    state = await claim_sync(user_id, workspace_id, lock_id)
+    try:
+        return await run_sync(user_id, workspace_id, root_ids, credentials_json, include_pages, processor, state)
+    finally:
+        await db[DRIVE_SYNC_COLLECTION].update_one(
+            {"user_id": user_id, "workspace_id": workspace_id, "lock.id": lock_id},
+            {"$unset": {"lock": ""}}
+        )
+
+
+async def claim_sync(user_id: str, workspace_id: str, lock_id: str) -> Optional[Dict]:
+    """
+    Mark the workspace's sync state as taken and return it as it was, raises SyncInProgress when another sync
+    of the workspace holds it.
+    """
+    now = datetime.utcnow()
+    try:
+        return await db[DRIVE_SYNC_COLLECTION].find_one_and_update(
+            {
+                "user_id": user_id,
+                "workspace_id": workspace_id,
+                "$or": [{"lock": {"$exists": False}}, {"lock.until": {"$lt": now}}]
+            },
+            {"$set": {"lock": {"id": lock_id, "until": now + timedelta(seconds=DRIVE_SYNC_LOCK_SECONDS)}}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # the document exists and is locked, the upsert ran into the unique index
+        raise SyncInProgress(f"A Google Drive sync of workspace {workspace_id} is already running")
+
+
+async def run_sync(
+        user_id: str,
+        workspace_id: str,
+        root_ids: List[str],
+        credentials_json: str,
+        include_pages: bool,
+        processor: GoogleDriveProcessor,
+        state: Optional[Dict]
+) -> Dict:
+    syncer = DriveSyncer(processor.build_service(credentials_json), processor)
+    # a first claim leaves a document with the lock only
+    if state is not None and "root_ids" not in state:
+        state = None
+    full = state is None or sorted(state["root_ids"]) != sorted(root_ids)
+    if full:
+        outcome = await syncer.full_sync(root_ids, state["files"] if state else None)
+    else:
+        outcome = await syncer.incremental_sync(state)
+
+    tracked = dict(state["files"]) if state else {}
+    parsed_ids = {file_metadata["id"] for file_metadata, _ in outcome["parsed"]}
+    stale_source_ids = []
+    sources = []
+    results = []
+    for file_metadata, processing_result in outcome["parsed"]:
+        file_id = file_metadata["id"]
+        if "error" in processing_result:
+            # download and provider errors are often transient: the previous source stays and the file is
+            # retried next time. A file that never parsed is tracked without fingerprint so that it is retried too
+            results.append(item_result((file_metadata["name"], None, processing_result)))
+            previous = tracked.get(file_id) or {
+                **fingerprint(file_metadata), "md5Checksum": None, "modifiedTime": None, "source_id": None
+            }
+            tracked[file_id] = {**previous, "failed": fingerprint(file_metadata)}
+            continue
+        if tracked.get(file_id, {}).get("source_id"):
+            stale_source_ids.append(tracked[file_id]["source_id"])
+        source = new_source(Source.document(
+            user_id=user_id,
+            workspace_id=workspace_id,
+            name=file_metadata["name"],
+            type=Subtype.drive,
+            size=size_in_mb(file_metadata),
+            page_count=processing_result.get("page_count", 0),
+            pages=processing_result.get("pages", []),
+            created_at=datetime.utcnow()
+        ), processing_result)
+        sources.append(source)
+        results.append(item_result((file_metadata["name"], source, processing_result), include_pages))
+        tracked[file_id] = {**fingerprint(file_metadata), "source_id": str(source["_id"])}
+    for file_id in outcome["removed"]:
+        removed_file = tracked.pop(file_id, None)
+        if removed_file and removed_file.get("source_id"):
+            stale_source_ids.append(removed_file["source_id"])
+    # unchanged files whose name or location changed keep their source, only the fingerprint moves on
+    for file_id, file_metadata in outcome["listed"].items():
+        if file_id in tracked and file_id not in parsed_ids:
+            tracked[file_id] = {**fingerprint(file_metadata), "source_id": tracked[file_id].get("source_id")}
+
+    # new sources go in before the old ones are removed, a reader never sees the file missing
+    await insert_sources(sources, "Google Drive sync")
+    await delete_sources(workspace_id, stale_source_ids)
+    await db[DRIVE_SYNC_COLLECTION].update_one(
+        {"user_id": user_id, "workspace_id": workspace_id},
+        {"$set": {
+            "root_ids": outcome["root_ids"],
+            "folders": outcome["folders"],
+            "start_page_token": outcome["start_page_token"],
+            "files": tracked,
+            "synced_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+    logger.info(
+        "Drive %s sync for workspace %s: %d parsed, %d removed, %d tracked",
+        "full" if full else "incremental", workspace_id, len(parsed_ids), len(outcome["removed"]), len(tracked)
+    )
+    return {
+        "full_sync": full,
+        "parsed": len(parsed_ids),
+        "removed": len(outcome["removed"]),
+        "tracked": len(tracked),
+        "storage_bytes": sum(storage_bytes(source["size"]) for source in sources),
+        "results": results
+    }
@@ -0,0 +1,358 @@
+import time
+import asyncio
+import mimetypes
+from io import BytesIO
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import UploadFile
+from pymongo import InsertOne
+
+from ...core.config import MIME_TYPE_MAP
+from ...core.registry import PROCESSOR_REGISTRY, URL_PROCESSOR, IMAGE_PROCESSOR, GOOGLE_DRIVE_PROCESSOR
+from ...db.connection import db
+from ...models.source import Source, Subtype
+from ..auth.credential_manager import CREDENTIAL_MANAGER
+from ..quota.quota import QUOTAS
+from ..logging.logger import logger
+from ..profiling.profiling import span
+from ..search.search_index import index_sources, remove_sources
+from ..retrieval.retrieval import embed_sources, remove_source_vectors
+from ..dedup.dedup import find_duplicates, save_signatures, remove_signatures
+from ..blobs.blob_store import store_originals, delete_source_blobs
+
+# every ingest step yields (name, source, processing_result), source is None when the item failed and the
+# processing result then only holds its "error"
+IngestItem = Tuple[str, Optional[Dict], Dict]
+MAX_UPLOAD_MB = 20
+
+
+def new_source(source: Dict, processing_result: Optional[Dict] = None) -> Dict:
+    # ids are assigned up front so that upload results can point at their source before it is inserted. Files
+    # whose images are extracted on demand (lazy pdfs) carry their original until insert_sources stores it
+    source["_id"] = ObjectId()
+    if processing_result and processing_result.get("original") is not None:
+        source["original"] = processing_result.pop("original")
+    return source
+
+
+def upload_result(source: Dict, processing_result: Dict, include_pages: bool = False) -> Dict:
+    # the upload response only carries what the source list needs, pages / tables / images are opt-in
+    result = {
+        "source_id": str(source["_id"]),
+        "name": source["name"],
+        "type": source["type"],
+        "page_count": source["page_count"],
+        "errors": [processing_result["error"]] if processing_result.get("error") else []
+    }
+    if include_pages:
+        result["pages"] = source["pages"]
+    return result
+
+
+def storage_bytes(size_in_mb: float) -> int:
+    # sources keep their size in rounded MB, storage quota is consumed and released from that same number
+    return int(size_in_mb * 1024 * 1024)
+
+
+def upload_size_mb(file: UploadFile) -> float:
+    return round(file.size / (1024 * 1024), 2)
+
+
+def upload_storage_bytes(files: List[UploadFile]) -> int:
+    """
+    Storage the uploaded files take once ingested. The upload endpoints consume it before anything is parsed,
+    so that an upload over the quota is answered with a 429, and ingest_files gives back the share of every
+    file it does not keep.
+    """
+    return sum(
+        storage_bytes(size_in_mb) for size_in_mb in map(upload_size_mb, files) if size_in_mb <= MAX_UPLOAD_MB
+    )
+
+
+def failed_result(name: str, error: str) -> Dict:
+    return {"source_id": None, "name": name, "type": None, "page_count": 0, "errors": [error]}
+
+
+def item_result(item: IngestItem, include_pages: bool = False) -> Dict:
+    name, source, processing_result = item
+    if source is None:
+        return failed_result(name, processing_result["error"])
+    return upload_result(source, processing_result, include_pages)
+
+
+def log_source_timing(name: str, kind: str, started: float, processing_result: Dict, size_bytes: int = 0, **fields):
+    # one line per parsed source with the fields latency analysis groups by
+    logger.info("source processed", extra={
+        "source_name": name,
+        "source_kind": kind,
+        "status": "error" if processing_result.get("error") else "ok",
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "size_bytes": size_bytes,
+        "page_count": processing_result.get("page_count", 0),
+        **({"image_stats": processing_result["image_stats"]} if "image_stats" in processing_result else {}),
+        **fields
+    })
+
+
+async def insert_sources(sources: List[Dict], label: str):
+    # every source written to the workspace also goes into the search and vector indexes, pages that repeat
+    # a page already in the workspace are linked to it with `duplicate_of`
+    if not sources:
+        return
+    for source in sources:
+        source.setdefault("_id", ObjectId())
+    logger.info("Inserting %d %s sources into the database", len(sources), label)
+    with span("dedup"):
+        signatures = await find_duplicates(sources)
+    with span("originals"):
+        await store_originals(sources)
+    with span("bulk_write"):
+        await db["Sources"].bulk_write([InsertOne(source) for source in sources])
+        await save_signatures(signatures)
+    with span("search_index"):
+        await index_sources(sources)
+    with span("embed"):
+        await embed_sources(sources)
+
+
+async def delete_sources(workspace_id: str, source_ids: List[str]) -> int:
+    # takes the sources out of the search and vector indexes again and gives their storage quota back
+    if not source_ids:
+        return 0
+    source_filter = {"workspace_id": workspace_id, "_id": {"$in": [ObjectId(source_id) for source_id in source_ids]}}
+    released = {}
+    async for source in db["Sources"].find(source_filter, {"user_id": 1, "size": 1}):
+        released[source["user_id"]] = released.get(source["user_id"], 0) + storage_bytes(source.get("size") or 0)
+    deleted = await db["Sources"].delete_many(source_filter)
+    await remove_sources(source_ids)
+    await remove_source_vectors(workspace_id, source_ids)
+    await remove_signatures(workspace_id, source_ids)
+    await delete_source_blobs(source_ids)
+    for user_id, size in released.items():
+        await QUOTAS.release(user_id, "storage_bytes", size)
+    return deleted.deleted_count
+
+
+async def drive_credentials(user_id: str) -> str:
+    credentials = await CREDENTIAL_MANAGER.get(user_id)
+    return credentials.to_json()
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    contents = BytesIO()
+    while chunk := await file.read(1024 * 1024):  # 1MB chunks
+        contents.write(chunk)
+    return contents.getvalue()
+
+
+def upload_file_type(mime_type: str, filename: str) -> str:
+    file_type = mime_type.split("/")[-1]
+    if file_type in MIME_TYPE_MAP:
+        if file_type == "vnd.ms-excel":
+            return MIME_TYPE_MAP[file_type][1] if filename.endswith(".csv") else MIME_TYPE_MAP[file_type][0]
+        return MIME_TYPE_MAP[file_type][0]
+    return file_type
+
+
+class StorageReservation:
+    """
+    The storage_bytes an upload consumed up front (upload_storage_bytes), per file. A file that is kept or failed
+    settles its share, release_unsettled gives back the share of every file that was never reached.
+    """
+    def __init__(self, user_id: str, files: List[UploadFile]):
+        self.user_id = user_id
+        self.shares = {
+            id(file): storage_bytes(size_in_mb) for file, size_in_mb in zip(files, map(upload_size_mb, files))
+            if size_in_mb <= MAX_UPLOAD_MB
+        }
+
+    def settle(self, file: UploadFile) -> int:
+        return self.shares.pop(id(file), 0)
+
+    async def release(self, file: UploadFile):
+        await QUOTAS.release(self.user_id, "storage_bytes", self.settle(file))
+
+    async def release_unsettled(self):
+        amount = sum(self.shares.values())
+        self.shares.clear()
+        await QUOTAS.release(self.user_id, "storage_bytes", amount)
+
+
+async def ingest_files(
+        user_id: str,
+        workspace_id: str,
+        files: List[UploadFile],
+        storage: Optional[StorageReservation] = None
+) -> AsyncIterator[IngestItem]:
+    """
+    Parse uploaded files one by one. Images are analysed together after the other files so that they share
+    gemini requests. The storage reserved for a file that fails, or that is never reached because the caller
+    stops early, is released.
+    """
+    storage = storage or StorageReservation(user_id, files)
+    image_files = []
+    try:
+        for file in files:
+            started = time.perf_counter()
+            try:
+                file_size_in_mb = upload_size_mb(file)
+                if file_size_in_mb > MAX_UPLOAD_MB:
+                    raise ValueError(f"File size exceeds {MAX_UPLOAD_MB}MB limit")
+                with span("read"):
+                    content = await read_upload(file)
+                mime_type, _ = mimetypes.guess_type(file.filename)
+                processor = PROCESSOR_REGISTRY.get(mime_type)
+                if not processor:
+                    raise ValueError("Unsupported file type")
+                file_type = upload_file_type(mime_type, file.filename)
+
+                if processor is IMAGE_PROCESSOR:
+                    image_files.append((file, content, file_type, file_size_in_mb))
+                    continue
+                with span(f"parse.{file_type}"):
+                    processing_result = await processor.process(content, file.filename)
+                log_source_timing(file.filename, file_type, started, processing_result, len(content))
+                with span("validate"):
+                    source = new_source(Source.document(
+                        user_id=user_id,
+                        workspace_id=workspace_id,
+                        name=file.filename,
+                        type=file_type,
+                        size=file_size_in_mb,
+                        page_count=processing_result.get("page_count", 0),
+                        pages=processing_result.get("pages", []),
+                        created_at=datetime.utcnow()
+                    ), processing_result)
+                storage.settle(file)
+                yield file.filename, source, processing_result
+            except Exception as e:
+                await storage.release(file)
+                processing_result = {"error": f"Processing failed: {str(e)}"}
+                log_source_timing(file.filename, "file", started, processing_result)
+                yield file.filename, None, processing_result
+            finally:
+                await file.close()
+
+        if image_files:
+            started = time.perf_counter()
+            with span("parse.images"):
+                processing_results = await IMAGE_PROCESSOR.process_batch(
+                    [(content, file.filename) for file, content, _, _ in image_files]
+                )
+            for (file, content, file_type, file_size_in_mb), processing_result in zip(image_files, processing_results):
+                # images share their gemini requests, the duration is the one of the whole batch
+                log_source_timing(
+                    file.filename, file_type, started, processing_result, len(content), batch_size=len(image_files)
+                )
+                source = new_source(Source.document(
+                    user_id=user_id,
+                    workspace_id=workspace_id,
+                    name=file.filename,
+                    type=file_type,
+                    size=file_size_in_mb,
+                    page_count=processing_result.get("page_count", 0),
+                    pages=processing_result.get("pages", []),
+                    created_at=datetime.utcnow()
+                ))
+                storage.settle(file)
+                yield file.filename, source, processing_result
+    finally:
+        await storage.release_unsettled()
+
+
+async def ingest_urls(user_id: str, workspace_id: str, urls: List[str]) -> AsyncIterator[IngestItem]:
+    for url in urls:
+        url = str(url)
+        started = time.perf_counter()
+        with span("parse.url"):
+            processing_result = await URL_PROCESSOR.process(url, url)
+        log_source_timing(url, Subtype.url.value, started, processing_result)
+        source = new_source(Source.document(
+            user_id=user_id,
+            workspace_id=workspace_id,
+            name=url,
+            type=Subtype.url,
+            url=url,
+            size=0,
+            page_count=processing_result.get("page_count", 0),
+            pages=processing_result.get("pages", []),
+            created_at=datetime.utcnow()
+        ))
+        yield url, source, processing_result
+
+
+async def ingest_drive_files(user_id: str, workspace_id: str, drive_file_ids: List[str]) -> AsyncIterator[IngestItem]:
+    if not drive_file_ids:
+        return
+    try:
+        credentials_json = await drive_credentials(user_id)
+        service = GOOGLE_DRIVE_PROCESSOR.build_service(credentials_json)
+        drive_files, _ = await GOOGLE_DRIVE_PROCESSOR.list_tree(service, drive_file_ids)
+    except Exception as e:
+        yield "google_drive_files", None, {"error": f"Processing failed: {str(e)}"}
+        return
+
+    # parsed one at a time so that every file is timed and streamed as soon as it is ready
+    for file_metadata in drive_files:
+        started = time.perf_counter()
+        try:
+            with span("parse.drive"):
+                result = await GOOGLE_DRIVE_PROCESSOR.parse_file(service, file_metadata)
+        except Exception as e:
+            result = {"filename": file_metadata["name"], "error": f"Failed to process Google Drive file: {str(e)}"}
+        log_source_timing(file_metadata["name"], Subtype.drive.value, started, result)
+        if "error" in result:
+            yield file_metadata["name"], None, result
+            continue
+        source = new_source(Source.document(
+            user_id=user_id,
+            workspace_id=workspace_id,
+            name=file_metadata["name"],
+            type=Subtype.drive,
+            size=0,
+            page_count=result.get("page_count", 0),
+            pages=result.get("pages", []),
+            created_at=datetime.utcnow()
+        ), result)
+        yield file_metadata["name"], source, result
+
+
+def ingest_steps(
+        user_id: str,
+        workspace_id: str,
+        files: List[UploadFile],
+        urls: List[str],
+        drive_file_ids: List[str],
+        storage: Optional[StorageReservation] = None
+):
+    # (label, items) in the order the upload endpoints have always processed them
+    return [
+        ("file", ingest_files(user_id, workspace_id, files, storage)),
+        ("URL", ingest_urls(user_id, workspace_id, urls)),
+        ("Google Drive", ingest_drive_files(user_id, workspace_id, drive_file_ids)),
+    ]
+
+
+async def with_heartbeats(items: AsyncIterator, interval: float) -> AsyncIterator[Optional[IngestItem]]:
+    """
+    Re-yields `items`, and yields None whenever the next item takes longer than `interval` seconds.
+    """
+    iterator = items.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            yield item
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        # the client went away mid source, stop parsing it
+        pending.cancel()
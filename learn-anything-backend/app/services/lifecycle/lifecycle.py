@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, Optional, Tuple
+
+from ...core.config import READINESS_TIMEOUT_SECONDS, PROCESSOR_REGISTRY
+from ...db.connection import client
+from ...utils.image_pipeline import IMAGE_PIPELINE
+from ...utils.ocr import OCR
+from ..auth.credential_manager import CREDENTIAL_MANAGER
+from ..logging.logger import logger
+
+
+def executor_state(pool: Optional[Executor]) -> str:
+    # pools are created on first use, "idle" is as healthy as "ok"
+    if pool is None:
+        return "idle"
+    if getattr(pool, "_broken", False):
+        return "broken"
+    if getattr(pool, "_shutdown", False) or getattr(pool, "_shutdown_thread", False):
+        return "shutdown"
+    return "ok"
+
+
+def worker_pools() -> Dict[str, Executor]:
+    pools = {"image_pipeline": IMAGE_PIPELINE.pool, "ocr": OCR.pool}
+    # one processor instance is registered for several mime types
+    for processor in {id(processor): processor for processor in PROCESSOR_REGISTRY.values()}.values():
+        if hasattr(processor, "get_pool"):
+            pools[type(processor).__name__] = processor.pool
+    return pools
+
+
+async def check_mongo() -> str:
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READINESS_TIMEOUT_SECONDS)
+        return "ok"
+    except Exception as e:
+        return f"unavailable: {type(e).__name__}: {str(e)[:200]}"
+
+
+async def readiness() -> Tuple[bool, Dict]:
+    """
+    Whether this worker can take traffic: mongo answers, no worker pool is broken or shut down and the
+    credential refresher runs.
+    """
+    pools = {name: executor_state(pool) for name, pool in worker_pools().items()}
+    task = CREDENTIAL_MANAGER.task
+    checks = {
+        "mongo": await check_mongo(),
+        "pools": pools,
+        "credential_refresher": "ok" if task is not None and not task.done() else "stopped"
+    }
+    ready = (
+        checks["mongo"] == "ok"
+        and all(state in ("idle", "ok") for state in pools.values())
+        and checks["credential_refresher"] == "ok"
+    )
+    return ready, checks
+
+
+def shutdown_pools():
+    # runs after the server stopped serving, nothing is waiting on the pools any more
+    for name, pool in worker_pools().items():
+        if pool is not None:
+            logger.info(f"Shutting down {name} pool")
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -1,22 +1,145 @@
+import sys
+import queue
+import atexit
 import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
-# Create a custom logging
-logger = logging.getLogger("fastapi_app")
-logger.setLevel(logging.DEBUG)  # Capture everything from DEBUG and up
+import orjson
+
+from ...core.config import LOG_LEVEL, LOG_FORMAT, LOG_LEVELS
+
+# attributes every LogRecord has, anything else was passed with extra={...} and goes into the json line
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# request_id / user_id of the request being served. One mutable dict per request, so that the user id set
+# by the auth dependency is visible to the middleware that created it
+log_context: ContextVar[Optional[Dict]] = ContextVar("log_context", default=None)
+
+
+def bind_log_context(**fields):
+    context = log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+class ContextFilter(logging.Filter):
+    # runs on the queue handler, in the thread / task that logged, before the record is handed to the listener
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context:
+            for key, value in context.items():
+                setattr(record, key, value)
+        return True
+
+
+def extra_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        line.update(extra_fields(record))
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exc_info"] = record.exc_text
+        return orjson.dumps(line, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    # the previous console format, with the extra fields appended as key=value
+    def __init__(self):
+        super().__init__("%(asctime)s | %(levelname)s | %(name)s | %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in extra_fields(record).items() if value is not None)
+        return f"{line} | {fields}" if fields else line
 
-# Create handlers
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
 
-# Create formatter and add it to the handlers
-formatter = logging.Formatter(
-    "%(asctime)s | %(levelname)s | %(name)s | %(message)s", "%Y-%m-%d %H:%M:%S"
-)
-console_handler.setFormatter(formatter)
+def build_formatter() -> logging.Formatter:
+    return JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
 
-# Add handlers to the logging
-if not logger.handlers:  # Prevent duplicate handlers
-    logger.addHandler(console_handler)
 
-# Make sure the logging propagates messages
-logger.propagate = True
\ No newline at end of file
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the stdlib version formats the message here, leave that to the listener thread. Arguments are
+        # merged into the message (they may not be safe to read from another thread) and the traceback
+        # rendered, the record is otherwise handed over as it is
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """
+    Records are put on a queue by the logging call and written to stdout by a listener thread, so that the
+    event loop never blocks on the stream.
+    """
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.handler = ContextQueueHandler(self.queue)
+        self.handler.addFilter(ContextFilter())
+        self.stream_handler = logging.StreamHandler(sys.stdout)
+        self.stream_handler.setFormatter(build_formatter())
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self):
+        if self.listener is None:
+            self.listener = logging.handlers.QueueListener(
+                self.queue, self.stream_handler, respect_handler_level=True
+            )
+            self.listener.start()
+
+    def stop(self):
+        # flushes whatever is still queued
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart(self):
+        # the listener thread does not survive a fork, forked workers start their own
+        self.listener = None
+        self.start()
+
+
+def route_to_pipeline(target: logging.Logger):
+    # lines are written by our own handler only, a root handler (uvicorn, pytest) would print them again
+    if LOG_PIPELINE.handler not in target.handlers:
+        target.addHandler(LOG_PIPELINE.handler)
+    target.propagate = False
+
+
+def configure_levels(default: str, overrides: str):
+    """
+    Sets the app logger to `default` and every "name=LEVEL" of `overrides` (pymongo=WARNING,...). Overridden
+    loggers are routed through the pipeline as well, so their lines are formatted and written like ours.
+    """
+    logger.setLevel(default.upper())
+    for override in filter(None, (item.strip() for item in overrides.split(","))):
+        name, _, level = override.partition("=")
+        overridden = logging.getLogger(name.strip())
+        overridden.setLevel(level.strip().upper())
+        route_to_pipeline(overridden)
+
+
+LOG_PIPELINE = LogPipeline()
+
+logger = logging.getLogger("fastapi_app")
+route_to_pipeline(logger)
+configure_levels(LOG_LEVEL, LOG_LEVELS)
+
+LOG_PIPELINE.start()
+atexit.register(LOG_PIPELINE.stop)
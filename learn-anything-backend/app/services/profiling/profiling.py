@@ -0,0 +1,248 @@
+import os
+import re
+import time
+import uuid
+import pstats
+import cProfile
+import tracemalloc
+from io import StringIO
+from datetime import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import orjson
+
+from ...core.config import PROFILE_DIR, PROFILE_KEEP, PROFILE_TRACE_MEMORY
+from ..logging.logger import logger
+
+try:
+    # optional, a sampling profiler that follows awaits. Without it requests are profiled with cProfile
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+TOP_FUNCTIONS = 40
+
+# the profile of the request being served, None for the (unprofiled) rest
+current_profile: ContextVar[Optional["Profile"]] = ContextVar("current_profile", default=None)
+
+# the interpreter has one profiler hook per thread and one tracemalloc, profiles that overlap share them
+profiler_busy = False
+memory_profiles = set()
+
+
+class Span:
+    __slots__ = ("name", "started", "base", "peak")
+
+    def __init__(self, name: str, base: int):
+        self.name = name
+        self.started = time.perf_counter()
+        self.base = base
+        self.peak = base
+
+
+class Profile:
+    """
+    Span timings (and, with PROFILE_TRACE_MEMORY, the peak traced memory of each span) of one request, plus a
+    sampling / deterministic profile of the whole request when no other request is being profiled. Spans with
+    the same path are aggregated, so a span inside a per page loop is one entry with a count.
+
+    The traced peak is process wide: memory is only measured while a single profile traces it, and profiles that
+    overlapped another one report `memory_overlapped` (their peaks include the other request, or stop short).
+    """
+    def __init__(self, meta: Dict, trace_memory: bool = PROFILE_TRACE_MEMORY):
+        self.id = uuid.uuid4().hex
+        self.meta = meta
+        self.trace_memory = trace_memory
+        self.spans: Dict[str, Dict] = {}
+        self.stack: List[Span] = []
+        self.profiler = None
+        self.profiler_name = None
+        self.started = 0.0
+        self.duration_ms = 0.0
+        self.memory_overlapped = False
+
+    def start(self):
+        global profiler_busy
+        if self.trace_memory:
+            if not memory_profiles and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if memory_profiles:
+                self.memory_overlapped = True
+                for profile in memory_profiles:
+                    profile.memory_overlapped = True
+            memory_profiles.add(self)
+        if not profiler_busy:
+            profiler_busy = True
+            if SamplingProfiler is not None:
+                self.profiler, self.profiler_name = SamplingProfiler(async_mode="enabled"), "pyinstrument"
+            else:
+                # cProfile sees every task on the loop thread, not just this request
+                self.profiler, self.profiler_name = cProfile.Profile(), "cprofile"
+            if self.profiler_name == "cprofile":
+                self.profiler.enable()
+            else:
+                self.profiler.start()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        global profiler_busy
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        if self.profiler is not None:
+            if self.profiler_name == "cprofile":
+                self.profiler.disable()
+            else:
+                self.profiler.stop()
+            profiler_busy = False
+        if self.trace_memory:
+            memory_profiles.discard(self)
+            if not memory_profiles:
+                tracemalloc.stop()
+
+    def measures_memory(self) -> bool:
+        # reset_peak() would wipe the peak of another request's span
+        return self.trace_memory and len(memory_profiles) == 1 and tracemalloc.is_tracing()
+
+    def enter(self, name: str) -> Span:
+        base = 0
+        if self.measures_memory():
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for the new span, the enclosing one keeps what it reached so far
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            base = current
+        span = Span("/".join([*(parent.name for parent in self.stack[-1:]), name]), base)
+        self.stack.append(span)
+        return span
+
+    def exit(self, span: Span):
+        elapsed_ms = (time.perf_counter() - span.started) * 1000
+        if self.stack and self.stack[-1] is span:
+            self.stack.pop()
+        # a span entered while another profile was tracing has no base to measure from
+        if self.measures_memory() and span.base:
+            span.peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, span.peak)
+        entry = self.spans.setdefault(span.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "peak_kb": 0})
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["peak_kb"] = max(entry["peak_kb"], (span.peak - span.base) // 1024)
+
+    def report(self) -> Dict:
+        report = {
+            "id": self.id,
+            **self.meta,
+            "duration_ms": self.duration_ms,
+            "profiler": self.profiler_name,
+            "trace_memory": self.trace_memory,
+            "memory_overlapped": self.memory_overlapped,
+            "spans": [
+                {"name": name, **entry, "total_ms": round(entry["total_ms"], 2), "max_ms": round(entry["max_ms"], 2)}
+                for name, entry in self.spans.items()
+            ]
+        }
+        if self.profiler_name == "cprofile":
+            stats = pstats.Stats(self.profiler, stream=StringIO()).sort_stats("cumulative")
+            report["top_functions"] = [
+                {
+                    "function": f"{filename}:{line}({function})",
+                    "calls": calls,
+                    "own_ms": round(own * 1000, 2),
+                    "cumulative_ms": round(cumulative * 1000, 2)
+                }
+                for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[:TOP_FUNCTIONS]
+            ]
+        return report
+
+
+@contextmanager
+def span(name: str):
+    """
+    Times the block (and its peak traced memory) into the current request's profile, a no-op otherwise.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    entry = profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit(entry)
+
+
+class ProfileStore:
+    """
+    Profiles on local disk: `<id>.json` with the span report, and the profiler output next to it, `<id>.html`
+    (pyinstrument) or `<id>.pstats` (cProfile, for snakeviz / flameprof). Only the latest `keep` are kept.
+    """
+    ARTIFACTS = {"pyinstrument": "html", "cprofile": "pstats"}
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def path(self, profile_id: str, extension: str) -> Optional[str]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.{extension}")
+        return path if os.path.exists(path) else None
+
+    def save(self, profile: Profile):
+        os.makedirs(self.directory, exist_ok=True)
+        report = profile.report()
+        if profile.profiler_name == "pyinstrument":
+            with open(os.path.join(self.directory, f"{profile.id}.html"), "w") as html_file:
+                html_file.write(profile.profiler.output_html())
+        elif profile.profiler_name == "cprofile":
+            profile.profiler.dump_stats(os.path.join(self.directory, f"{profile.id}.pstats"))
+        with open(os.path.join(self.directory, f"{profile.id}.json"), "wb") as json_file:
+            json_file.write(orjson.dumps(report, default=str, option=orjson.OPT_INDENT_2))
+        self.prune()
+        logger.info("profile saved", extra={"profile_id": profile.id, "duration_ms": profile.duration_ms})
+
+    def prune(self):
+        reports = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in reports[:-self.keep]:
+            profile_id = entry.name[:-len(".json")]
+            for extension in ("json", *self.ARTIFACTS.values()):
+                path = os.path.join(self.directory, f"{profile_id}.{extension}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list(self) -> List[Dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime, reverse=True):
+            if entry.name.endswith(".json"):
+                with open(entry.path, "rb") as json_file:
+                    report = orjson.loads(json_file.read())
+                profiles.append({key: report.get(key) for key in (
+                    "id", "created_at", "method", "path", "status", "trigger", "duration_ms", "profiler"
+                )})
+        return profiles
+
+
+PROFILE_STORE = ProfileStore()
+
+
+def new_profile(scope: Dict, trigger: str, request_id: Optional[str]) -> Profile:
+    return Profile({
+        "created_at": datetime.utcnow(),
+        "method": scope["method"],
+        "path": scope["path"],
+        "request_id": request_id,
+        "trigger": trigger,
+        "status": None
+    })
@@ -0,0 +1,192 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ...core.config import QUOTA_LIMITS, QUOTA_CACHE_SECONDS, QUOTA_CACHE_MAX_ENTRIES
+from ...db.connection import db
+from ..resilience.resilience import TokenBucket
+
+# one counter document per user, quota and window. Windowed counters expire a day after their window ends
+QUOTA_COLLECTION = "Quotas"
+EXPIRED_WINDOW_GRACE_SECONDS = 24 * 60 * 60
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, name: str, limit: int, used: Optional[int] = None, retry_after: Optional[float] = None):
+        self.name = name
+        self.limit = limit
+        self.used = used
+        self.retry_after = retry_after
+        super().__init__(f"{name} quota of {limit} exceeded")
+
+
+async def ensure_quota_indexes():
+    await db[QUOTA_COLLECTION].create_index(
+        [("user_id", 1), ("name", 1), ("window_start", 1)],
+        name="user_quota_window",
+        unique=True
+    )
+    await db[QUOTA_COLLECTION].create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+
+
+class QuotaService:
+    """
+    Consumes quota with a single conditional find_one_and_update: the counter is only incremented while there is
+    room left, and when there is not the upsert hits the unique index instead of creating a second counter.
+    Usage seen by this process is cached, so requests over a limit are rejected without a round trip, and
+    quotas with a `rate` are throttled by an in-process token bucket before the counter is touched.
+    """
+    def __init__(self, limits: Dict[str, Dict] = QUOTA_LIMITS, cache_seconds: float = QUOTA_CACHE_SECONDS,
+                 max_entries: int = QUOTA_CACHE_MAX_ENTRIES, clock: Callable[[], float] = time.time):
+        self.limits = limits
+        self.cache_seconds = cache_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        # (user_id, name, window_start) -> (used, seen_at)
+        self.usage: "OrderedDict[Tuple, Tuple[int, float]]" = OrderedDict()
+        self.buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.stats = {"checks": 0, "cache_rejections": 0, "throttled": 0, "mongo_updates": 0}
+
+    def window(self, name: str) -> Tuple[int, Optional[int]]:
+        window_seconds = self.limits[name].get("window_seconds")
+        if not window_seconds:
+            return 0, None
+        window_start = int(self.clock() // window_seconds * window_seconds)
+        return window_start, window_start + window_seconds
+
+    def remember(self, key: Tuple, used: int):
+        self.usage[key] = (used, self.clock())
+        self.usage.move_to_end(key)
+        while len(self.usage) > self.max_entries:
+            self.usage.popitem(last=False)
+
+    def cached_usage(self, key: Tuple) -> Optional[int]:
+        cached = self.usage.get(key)
+        if cached is None:
+            return None
+        used, seen_at = cached
+        # any counter can shrink in another process (release), a cached rejection is only trusted for a while
+        if self.clock() - seen_at > self.cache_seconds:
+            return None
+        return used
+
+    def throttle(self, user_id: str, name: str, amount: int) -> Optional[Tuple[TokenBucket, float]]:
+        # returns the bucket and the tokens taken from it, to give them back if the counter turns the request down
+        quota = self.limits[name]
+        if "rate" not in quota:
+            return None
+        key = (user_id, name)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(quota["rate"], quota.get("burst", quota["rate"]), clock=self.clock)
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(key)
+        tokens = min(amount, bucket.capacity)
+        wait = bucket.try_acquire(tokens)
+        if wait > 0:
+            self.stats["throttled"] += 1
+            raise QuotaExceeded(name, quota["limit"], retry_after=wait)
+        return bucket, tokens
+
+    @staticmethod
+    def counter_update(amount: int, window_end: Optional[int]) -> Dict:
+        update = {"$inc": {"used": amount}}
+        if window_end:
+            update["$setOnInsert"] = {
+                "expires_at": datetime.fromtimestamp(window_end + EXPIRED_WINDOW_GRACE_SECONDS, timezone.utc)
+            }
+        return update
+
+    async def consume(self, user_id: str, name: str, amount: int = 1) -> int:
+        """
+        Take `amount` from the user's quota, raises QuotaExceeded when it does not fit. Returns the usage after.
+        """
+        self.stats["checks"] += 1
+        limit = self.limits[name]["limit"]
+        window_start, window_end = self.window(name)
+        retry_after = window_end - self.clock() if window_end else None
+        if amount > limit:
+            raise QuotaExceeded(name, limit, retry_after=retry_after)
+        key = (user_id, name, window_start)
+        cached = self.cached_usage(key)
+        if cached is not None and cached + amount > limit:
+            self.stats["cache_rejections"] += 1
+            raise QuotaExceeded(name, limit, cached, retry_after)
+        taken = self.throttle(user_id, name, amount)
+
+        counter = {"user_id": user_id, "name": name, "window_start": window_start}
+        update = self.counter_update(amount, window_end)
+        self.stats["mongo_updates"] += 1
+        try:
+            document = await db[QUOTA_COLLECTION].find_one_and_update(
+                {**counter, "used": {"$lte": limit - amount}},
+                update,
+                upsert=True,
+                projection={"used": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # the counter exists but has no room for `amount`, a rejected request does not use up the rate
+            if taken:
+                taken[0].give_back(taken[1])
+            document = await db[QUOTA_COLLECTION].find_one(counter, {"used": 1})
+            used = document["used"] if document else limit
+            self.remember(key, used)
+            raise QuotaExceeded(name, limit, used, retry_after)
+        self.remember(key, document["used"])
+        return document["used"]
+
+    async def charge(self, user_id: str, name: str, amount: int) -> int:
+        """
+        Add usage that already happened and could not be known up front (the files a drive folder turned out to
+        hold), even past the limit. Returns the usage after, the next consume is rejected when it is over.
+        """
+        if amount <= 0:
+            return 0
+        window_start, window_end = self.window(name)
+        self.stats["mongo_updates"] += 1
+        document = await db[QUOTA_COLLECTION].find_one_and_update(
+            {"user_id": user_id, "name": name, "window_start": window_start},
+            self.counter_update(amount, window_end),
+            upsert=True,
+            projection={"used": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self.remember((user_id, name, window_start), document["used"])
+        return document["used"]
+
+    async def release(self, user_id: str, name: str, amount: int):
+        # give back quota that was consumed for something that no longer exists, never below zero
+        if amount <= 0:
+            return
+        window_start, _ = self.window(name)
+        document = await db[QUOTA_COLLECTION].find_one_and_update(
+            {"user_id": user_id, "name": name, "window_start": window_start},
+            [{"$set": {"used": {"$max": [0, {"$subtract": ["$used", amount]}]}}}],
+            projection={"used": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if document:
+            self.remember((user_id, name, window_start), document["used"])
+
+    async def usage_of(self, user_id: str) -> Dict[str, Dict]:
+        usage = {}
+        for name, quota in self.limits.items():
+            window_start, window_end = self.window(name)
+            document = await db[QUOTA_COLLECTION].find_one(
+                {"user_id": user_id, "name": name, "window_start": window_start}, {"used": 1}
+            )
+            usage[name] = {
+                "used": document["used"] if document else 0,
+                "limit": quota["limit"],
+                "resets_at": datetime.fromtimestamp(window_end, timezone.utc) if window_end else None
+            }
+        return usage
+
+
+QUOTAS = QuotaService()
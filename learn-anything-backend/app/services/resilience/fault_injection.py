@@ -0,0 +1,47 @@
+import random
+import asyncio
+from typing import Callable, Dict, Optional
+
+
+class InjectedFault(Exception):
+    """
+    Looks like an HTTP error coming from a provider SDK, so it goes through the same retry classification.
+    """
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Injected fault with status {status_code}")
+        self.status_code = status_code
+        self.headers: Dict[str, str] = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+
+
+class FaultInjector:
+    """
+    Local stand-in for a provider call. Adds latency and fails a configurable share of calls (or the first
+    `fail_first` calls) so that ProviderGuard retries, rate limits and circuit breakers can be exercised offline.
+    """
+    def __init__(self, func: Optional[Callable] = None, error_rate: float = 0.0, latency: float = 0.0,
+                 status_code: int = 503, retry_after: Optional[float] = None, fail_first: int = 0,
+                 seed: Optional[int] = None):
+        self.func = func
+        self.error_rate = error_rate
+        self.latency = latency
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.fail_first = fail_first
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def should_fail(self) -> bool:
+        self.calls += 1
+        return self.calls <= self.fail_first or self.random.random() < self.error_rate
+
+    async def __call__(self, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.should_fail():
+            raise InjectedFault(self.status_code, self.retry_after)
+        if self.func is None:
+            return None
+        result = self.func(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
@@ -0,0 +1,281 @@
+import time
+import random
+import asyncio
+import functools
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Union
+
+import aiohttp
+
+from ...core.config import PROVIDER_LIMITS, PER_HOST_PROVIDERS, HOST_GUARDS_MAX, RETRY_BASE_DELAY_SECONDS, \
+    RETRY_MAX_DELAY_SECONDS
+from ..logging.logger import logger
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# network failures without a status code. genai and elevenlabs call through httpx, exa through requests, neither
+# raises the builtin exceptions
+TRANSIENT_ERRORS = (asyncio.TimeoutError, TimeoutError, ConnectionError, aiohttp.ClientConnectionError)
+try:
+    import httpx
+
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+try:
+    import requests
+
+    TRANSIENT_ERRORS += (requests.ConnectionError, requests.Timeout)
+except ImportError:
+    pass
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} is unavailable, retry in {round(retry_in, 1)}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    # every SDK names it differently: genai -> code, elevenlabs -> status_code, aiohttp -> status, googleapiclient -> resp.status
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    resp = getattr(error, "resp", None)
+    if resp is not None and getattr(resp, "status", None) is not None:
+        return int(resp.status)
+    response = getattr(error, "response", None)
+    if response is not None and isinstance(getattr(response, "status_code", None), int):
+        return response.status_code
+    return None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    if headers is None:
+        headers = getattr(error, "resp", None)
+    if not headers:
+        return None
+
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    except Exception:
+        return None
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take `tokens` from the bucket if they are available. Returns 0 on success, otherwise the number of
+        seconds to wait before enough tokens will have been refilled.
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1, sleep=asyncio.sleep):
+        while (wait := self.try_acquire(tokens)) > 0:
+            await sleep(wait)
+
+    def give_back(self, tokens: float = 1):
+        # tokens taken for work that did not happen
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def retry_in(self) -> float:
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0)
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.retry_in() == 0:
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self.trial_in_flight:
+            # let exactly one request through to find out whether the provider recovered
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def release_trial(self):
+        # the trial request ended without telling anything about the provider (cancelled, or rejected as bad),
+        # the next request becomes the trial
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            if self.state != self.OPEN:
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit for {self.name} changed from {self.state} to {state}")
+        self.state = state
+
+
+class ProviderGuard:
+    """
+    Wraps every call made to an external provider with rate limiting, retries with jittered exponential
+    backoff (honouring Retry-After) and a circuit breaker. Blocking callables are run in the default executor.
+    """
+    def __init__(self, name: str, rate: float, burst: float, max_retries: int, failure_threshold: int,
+                 reset_timeout: float, base_delay: float = RETRY_BASE_DELAY_SECONDS,
+                 max_delay: float = RETRY_MAX_DELAY_SECONDS, clock: Callable[[], float] = time.monotonic,
+                 sleep=asyncio.sleep, rng: Callable[[], float] = random.random):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng
+        self.bucket = TokenBucket(rate, burst, clock=clock)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout, clock=clock)
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0}
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter
+        return self.rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+
+    async def call(self, func: Callable, *args, **kwargs):
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.breaker.retry_in())
+            holds_trial = self.breaker.state == CircuitBreaker.HALF_OPEN
+
+            try:
+                await self.bucket.acquire(sleep=self.sleep)
+                self.stats["calls"] += 1
+                if asyncio.iscoroutinefunction(func) or asyncio.iscoroutinefunction(getattr(func, "__call__", None)):
+                    result = await func(*args, **kwargs)
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+            except asyncio.CancelledError:
+                if holds_trial:
+                    self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # the provider answered, the request itself was bad. Neither a failure nor proof of recovery
+                    if holds_trial:
+                        self.breaker.release_trial()
+                    raise
+                self.stats["failures"] += 1
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"{self.name} call failed ({str(e)}), retry {attempt}/{self.max_retries} in {round(delay, 2)}s")
+                await self.sleep(delay)
+            else:
+                self.stats["successes"] += 1
+                self.breaker.record_success()
+                return result
+
+    def state(self) -> Dict[str, Union[str, int, float]]:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_in": round(self.breaker.retry_in(), 2) if self.breaker.state != CircuitBreaker.CLOSED else 0,
+            "available_tokens": round(min(self.bucket.capacity, self.bucket.tokens), 2),
+            **self.stats
+        }
+
+
+PROVIDER_GUARDS: Dict[str, ProviderGuard] = {
+    name: ProviderGuard(name, **limits) for name, limits in PROVIDER_LIMITS.items() if name not in PER_HOST_PROVIDERS
+}
+# guards of arbitrary hosts ("web:example.com"), made on first use with the limits of their kind so that one
+# broken site only opens its own circuit. The least recently used are dropped past HOST_GUARDS_MAX
+HOST_GUARDS: "OrderedDict[str, ProviderGuard]" = OrderedDict()
+
+
+def get_guard(name: str) -> ProviderGuard:
+    if name in PROVIDER_GUARDS:
+        return PROVIDER_GUARDS[name]
+    kind, _, host = name.partition(":")
+    if kind not in PER_HOST_PROVIDERS or not host:
+        raise KeyError(f"No provider guard named {name}")
+    guard = HOST_GUARDS.get(name)
+    if guard is None:
+        guard = HOST_GUARDS[name] = ProviderGuard(name, **PROVIDER_LIMITS[kind])
+        while len(HOST_GUARDS) > HOST_GUARDS_MAX:
+            HOST_GUARDS.popitem(last=False)
+    HOST_GUARDS.move_to_end(name)
+    return guard
+
+
+def provider_states() -> Dict[str, Dict]:
+    # per host guards are only listed while their circuit is not closed
+    return {
+        **{name: guard.state() for name, guard in PROVIDER_GUARDS.items()},
+        **{name: guard.state() for name, guard in HOST_GUARDS.items() if guard.breaker.state != CircuitBreaker.CLOSED}
+    }
@@ -0,0 +1,67 @@
+import re
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+
+from ...core.config import EMBEDDER, EMBEDDING_MODEL, HASHING_EMBEDDING_DIMENSION
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class Embedder(ABC):
+    dimension: int
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns an L2 normalised float32 matrix of shape (len(texts), dimension).
+        """
+        pass
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Feature hashing of word unigrams and bigrams. Deterministic across processes and machines and needs no
+    model, which makes it the embedder for tests and offline benchmarks. It only captures lexical overlap.
+    """
+    def __init__(self, dimension: int = HASHING_EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def features(self, text: str) -> List[str]:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                # the lowest bit picks the sign so that collisions cancel out instead of piling up
+                vectors[row, (digest >> 1) % self.dimension] += 1.0 if digest & 1 else -1.0
+        return normalize(vectors)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+
+def get_embedder() -> Embedder:
+    if EMBEDDER == "sentence-transformers":
+        return SentenceTransformerEmbedder()
+    return HashingEmbedder()
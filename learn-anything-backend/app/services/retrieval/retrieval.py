@@ -0,0 +1,171 @@
+import os
+import fcntl
+import asyncio
+from contextlib import contextmanager
+from collections import defaultdict, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from ...core.config import (
+    VECTOR_INDEX_DIR, VECTOR_INDEX_CACHE_SIZE, EMBEDDING_BATCH_SIZE, RETRIEVAL_CHUNK_TOKENS,
+    RETRIEVAL_CHUNK_OVERLAP_CHARS, RETRIEVAL_DEFAULT_K
+)
+from ...utils.text_chunker import TextChunker
+from ..search.search_index import page_search_text
+from .embedders import get_embedder
+from .vector_index import VectorIndex
+
+
+class VectorIndexStore:
+    """
+    Keeps the VectorIndex of the most recently used workspaces in memory, loaded lazily from and written back to
+    `directory`. The files are shared by every worker process: a cached index is reloaded once its file changed
+    on disk, and updates hold an exclusive lock on the file from reading it to replacing it. Embedding and index
+    updates are CPU bound and run in the default executor, one at a time per workspace within a process.
+    """
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, max_indexes: int = VECTOR_INDEX_CACHE_SIZE):
+        self.directory = directory
+        self.max_indexes = max_indexes
+        self.embedder = None
+        # workspace id -> (index, version of the file it was loaded from or last saved to, None if never saved)
+        self.indexes: "OrderedDict[str, Tuple[VectorIndex, Optional[Tuple]]]" = OrderedDict()
+        self.locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.chunker = TextChunker(target_tokens=RETRIEVAL_CHUNK_TOKENS, overlap_chars=RETRIEVAL_CHUNK_OVERLAP_CHARS)
+
+    def get_embedder(self):
+        # sentence-transformers loads a model, only pay for it once something is actually embedded
+        if self.embedder is None:
+            self.embedder = get_embedder()
+        return self.embedder
+
+    def path(self, workspace_id: str) -> str:
+        # the id ends up in a file name, anything but an object id could point outside the directory
+        if not ObjectId.is_valid(workspace_id):
+            raise ValueError(f"Invalid workspace id: {workspace_id!r}")
+        return os.path.join(self.directory, f"{workspace_id}.npz")
+
+    @staticmethod
+    def version(path: str) -> Optional[Tuple]:
+        # every save replaces the file, so a new inode tells saves apart even within the mtime resolution
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def file_lock(self, workspace_id: str):
+        # advisory lock shared with the other workers, held from reading the index to replacing its file
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self.path(workspace_id)}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_index(self, workspace_id: str) -> VectorIndex:
+        path = self.path(workspace_id)
+        version = self.version(path)
+        cached = self.indexes.get(workspace_id)
+        # another worker may have saved the index since it was loaded here
+        if cached is not None and (version is None or cached[1] == version):
+            self.indexes.move_to_end(workspace_id)
+            return cached[0]
+
+        dimension = self.get_embedder().dimension
+        index = VectorIndex.load(path) if version is not None else VectorIndex(dimension)
+        if index.dimension != dimension:
+            raise ValueError(
+                f"Vector index of workspace {workspace_id} has dimension {index.dimension}, "
+                f"the configured embedder produces {dimension}. Rebuild the index after switching embedders."
+            )
+        self.remember(workspace_id, index, version)
+        return index
+
+    def remember(self, workspace_id: str, index: VectorIndex, version: Optional[Tuple]):
+        self.indexes[workspace_id] = (index, version)
+        self.indexes.move_to_end(workspace_id)
+        while len(self.indexes) > self.max_indexes:
+            self.indexes.popitem(last=False)
+
+    def save(self, workspace_id: str, index: VectorIndex):
+        path = self.path(workspace_id)
+        index.save(path)
+        self.remember(workspace_id, index, self.version(path))
+
+    def source_chunks(self, source: Dict) -> List[Dict]:
+        chunks = []
+        for page in source.get("pages") or []:
+            for text in self.chunker.split(page_search_text(page)):
+                if text.strip():
+                    chunks.append({
+                        "source_id": str(source["_id"]),
+                        "source_name": source["name"],
+                        "page_number": page.get("page_number"),
+                        "text": text
+                    })
+        return chunks
+
+    def add_chunks(self, workspace_id: str, chunks: List[Dict]):
+        embedder = self.get_embedder()
+        # embedding is the slow part and needs no lock, only the read-modify-write of the file does
+        vectors = [
+            (embedder.embed([chunk["text"] for chunk in batch]), batch)
+            for batch in (chunks[start:start + EMBEDDING_BATCH_SIZE]
+                          for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE))
+        ]
+        with self.file_lock(workspace_id):
+            index = self.get_index(workspace_id)
+            try:
+                for batch_vectors, batch in vectors:
+                    index.add(batch_vectors, batch)
+                self.save(workspace_id, index)
+            except Exception:
+                # the cached index no longer matches its file, load it again next time
+                self.indexes.pop(workspace_id, None)
+                raise
+
+    def delete_sources(self, workspace_id: str, source_ids: List[str]):
+        with self.file_lock(workspace_id):
+            index = self.get_index(workspace_id)
+            if index.delete_sources(source_ids):
+                self.save(workspace_id, index)
+
+    def search(self, workspace_id: str, query: str, k: int, source_ids: Optional[List[str]]) -> List[Dict]:
+        index = self.get_index(workspace_id)
+        return index.search(self.get_embedder().embed([query]), k, source_ids=source_ids)[0]
+
+    async def run(self, workspace_id: str, func, *args):
+        async with self.locks[workspace_id]:
+            return await asyncio.get_running_loop().run_in_executor(None, func, workspace_id, *args)
+
+
+VECTOR_STORE = VectorIndexStore()
+
+
+async def embed_sources(sources: List[Dict]):
+    """
+    Chunk, embed and add the pages of freshly inserted sources (with their `_id`) to their workspace index.
+    """
+    by_workspace = defaultdict(list)
+    for source in sources:
+        by_workspace[source["workspace_id"]].extend(VECTOR_STORE.source_chunks(source))
+    for workspace_id, chunks in by_workspace.items():
+        if chunks:
+            await VECTOR_STORE.run(workspace_id, VECTOR_STORE.add_chunks, chunks)
+
+
+async def remove_source_vectors(workspace_id: str, source_ids: List[str]):
+    if source_ids:
+        await VECTOR_STORE.run(workspace_id, VECTOR_STORE.delete_sources, source_ids)
+
+
+async def retrieve(
+        workspace_id: str,
+        query: str,
+        k: int = RETRIEVAL_DEFAULT_K,
+        source_ids: Optional[List[str]] = None
+) -> List[Dict]:
+    return await VECTOR_STORE.run(workspace_id, VECTOR_STORE.search, query, k, source_ids)
@@ -0,0 +1,258 @@
+import os
+import json
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ...core.config import VECTOR_DTYPE, IVF_MIN_VECTORS, IVF_PROBES
+
+SEARCH_BLOCK_ROWS = 65_536  # rows scored per matmul, bounds the temporary float32 copy of the vectors
+COMPACT_DEAD_FRACTION = 0.3
+MIN_CAPACITY = 1024
+
+
+class VectorIndex:
+    """
+    Append-only matrix of quantized, L2 normalised vectors with one metadata dict per row. Deletes only mark
+    rows dead and the matrix is compacted once enough of it is dead. Scores are cosine similarities.
+
+    int8 rows keep one float32 scale each (row = int8 * scale), float16 rows are stored as is.
+    """
+    def __init__(self, dimension: int, dtype: str = VECTOR_DTYPE):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.dimension = dimension
+        self.dtype = dtype
+        self.size = 0
+        self.vectors = np.zeros((0, dimension), dtype=np.int8 if dtype == "int8" else np.float16)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        # sources are stored as integer codes so that filtering and deleting stay vectorised
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.source_codes: Dict[str, int] = {}
+        self.metadata: List[Dict] = []
+        # ivf state, `lists` holds the partition of every row and `postings` the rows of every partition
+        self.centroids: Optional[np.ndarray] = None
+        self.lists = np.zeros(0, dtype=np.int32)
+        self.postings: List[List[int]] = []
+
+    def __len__(self) -> int:
+        return int(self.alive[:self.size].sum())
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors[:self.size].nbytes + self.scales[:self.size].nbytes
+
+    def reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self.vectors):
+            return
+        capacity = max(needed, len(self.vectors) * 2, MIN_CAPACITY)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            return grown
+
+        self.vectors = grow(self.vectors)
+        self.scales = grow(self.scales)
+        self.alive = grow(self.alive)
+        self.sources = grow(self.sources)
+        self.lists = grow(self.lists)
+
+    def quantize(self, vectors: np.ndarray):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    def dequantize(self, rows: np.ndarray) -> np.ndarray:
+        return self.vectors[rows].astype(np.float32) * self.scales[rows][:, None]
+
+    def add(self, vectors: np.ndarray, metadata: List[Dict]):
+        """
+        `vectors` are L2 normalised float32 rows, every metadata dict needs a `source_id`.
+        """
+        if len(vectors) != len(metadata):
+            raise ValueError("Every vector needs exactly one metadata entry")
+        if not len(vectors):
+            return
+        self.reserve(len(vectors))
+        start, end = self.size, self.size + len(vectors)
+        self.vectors[start:end], self.scales[start:end] = self.quantize(vectors)
+        self.alive[start:end] = True
+        self.sources[start:end] = [
+            self.source_codes.setdefault(entry["source_id"], len(self.source_codes)) for entry in metadata
+        ]
+        self.metadata.extend(metadata)
+        self.size = end
+
+        if self.centroids is not None:
+            self.assign(np.arange(start, end))
+        elif len(self) >= IVF_MIN_VECTORS:
+            self.train_ivf()
+
+    def delete_sources(self, source_ids: Iterable[str]) -> int:
+        codes = [self.source_codes[source_id] for source_id in source_ids if source_id in self.source_codes]
+        if not codes:
+            return 0
+        rows = np.isin(self.sources[:self.size], codes) & self.alive[:self.size]
+        self.alive[:self.size][rows] = False
+        deleted = int(rows.sum())
+        if self.size and 1 - len(self) / self.size >= COMPACT_DEAD_FRACTION:
+            self.compact()
+        return deleted
+
+    def compact(self):
+        keep = np.flatnonzero(self.alive[:self.size])
+        self.vectors = self.vectors[keep]
+        self.scales = self.scales[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.metadata = [self.metadata[row] for row in keep]
+        self.source_codes = {}
+        self.sources = np.array(
+            [self.source_codes.setdefault(entry["source_id"], len(self.source_codes)) for entry in self.metadata],
+            dtype=np.int32
+        )
+        self.size = len(keep)
+        self.lists = np.zeros(self.size, dtype=np.int32)
+        if self.centroids is not None:
+            if self.size < IVF_MIN_VECTORS // 2:
+                self.centroids = None
+                self.postings = []
+            else:
+                self.assign(np.arange(self.size), reset=True)
+
+    def train_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        """
+        Spherical k-means on a sample of the live rows, every row is then assigned to its closest centroid.
+        """
+        live = np.flatnonzero(self.alive[:self.size])
+        n_lists = min(n_lists or max(int(np.sqrt(len(live))), 1), len(live))
+        rng = np.random.default_rng(seed)
+        sample = self.dequantize(rng.choice(live, size=min(len(live), n_lists * 64), replace=False))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # empty partitions keep their previous centroid
+            centroids[counts > 0] = sums[counts > 0]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids.astype(np.float32)
+        self.assign(np.arange(self.size), reset=True)
+
+    def assign(self, rows: np.ndarray, reset: bool = False):
+        if reset:
+            self.postings = [[] for _ in range(len(self.centroids))]
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            lists = np.argmax(self.dequantize(block) @ self.centroids.T, axis=1)
+            self.lists[block] = lists
+            for row, partition in zip(block.tolist(), lists.tolist()):
+                self.postings[partition].append(row)
+
+    def top_k(self, rows: np.ndarray, queries: np.ndarray, k: int):
+        """
+        Block wise scoring of `rows` against all queries at once, keeping only the running top k per query.
+        """
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            scores = (queries @ self.vectors[block].astype(np.float32).T) * self.scales[block]
+            scores = np.concatenate([best_scores, scores], axis=1)
+            block_rows = np.concatenate([best_rows, np.broadcast_to(block, (len(queries), len(block)))], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                block_rows = np.take_along_axis(block_rows, keep, axis=1)
+            best_scores, best_rows = scores, block_rows
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def search(
+            self,
+            queries: np.ndarray,
+            k: int,
+            source_ids: Optional[Iterable[str]] = None,
+            probes: int = IVF_PROBES
+    ) -> List[List[Dict]]:
+        """
+        Returns the k best rows per query as their metadata plus a `score`, optionally limited to some sources.
+        """
+        queries = np.atleast_2d(queries).astype(np.float32)
+        mask = self.alive[:self.size].copy()
+        if source_ids is not None:
+            codes = [self.source_codes[source_id] for source_id in source_ids if source_id in self.source_codes]
+            mask &= np.isin(self.sources[:self.size], codes)
+        if k <= 0 or not mask.any():
+            return [[] for _ in queries]
+
+        if self.centroids is None:
+            batches = [(np.arange(len(queries)), np.flatnonzero(mask))]
+        else:
+            # each query scans only the rows of its `probes` closest partitions
+            probes = min(probes, len(self.centroids))
+            closest = np.argpartition(-(queries @ self.centroids.T), probes - 1, axis=1)[:, :probes]
+            batches = []
+            for query, partitions in enumerate(closest):
+                rows = np.fromiter(
+                    (row for partition in partitions for row in self.postings[partition]), dtype=np.int64
+                )
+                batches.append((np.array([query]), rows[mask[rows]]))
+
+        results: List[List[Dict]] = [[] for _ in queries]
+        for query_rows, rows in batches:
+            if not len(rows):
+                continue
+            scores, best = self.top_k(rows, queries[query_rows], k)
+            for query, query_scores, query_best in zip(query_rows, scores, best):
+                results[query] = [
+                    {**self.metadata[row], "score": round(float(score), 4)}
+                    for score, row in zip(query_scores.tolist(), query_best.tolist())
+                ]
+        return results
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as index_file:
+            np.savez(
+                index_file,
+                dimension=np.array(self.dimension),
+                dtype=np.array(self.dtype),
+                vectors=self.vectors[:self.size],
+                scales=self.scales[:self.size],
+                alive=self.alive[:self.size],
+                centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dimension), np.float32),
+                lists=self.lists[:self.size],
+                # metadata is plain json, kept out of pickled object arrays
+                metadata=np.frombuffer(json.dumps(self.metadata).encode("utf-8"), dtype=np.uint8)
+            )
+        # replace in one step so that a crash mid write never leaves a truncated index behind
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        with np.load(path) as data:
+            index = cls(int(data["dimension"]), str(data["dtype"]))
+            index.vectors = data["vectors"]
+            index.scales = data["scales"]
+            index.alive = data["alive"]
+            index.lists = data["lists"]
+            index.metadata = json.loads(data["metadata"].tobytes().decode("utf-8"))
+            centroids = data["centroids"]
+        index.size = len(index.vectors)
+        index.sources = np.array(
+            [index.source_codes.setdefault(entry["source_id"], len(index.source_codes)) for entry in index.metadata],
+            dtype=np.int32
+        )
+        if len(centroids):
+            index.centroids = centroids
+            index.postings = [[] for _ in range(len(centroids))]
+            for row, partition in enumerate(index.lists.tolist()):
+                index.postings[partition].append(row)
+        return index
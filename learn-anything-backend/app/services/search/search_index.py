@@ -0,0 +1,96 @@
+import re
+from typing import Dict, List
+
+from pymongo import InsertOne
+
+from ...core.config import SEARCH_MAX_PAGE_CHARS, SEARCH_SNIPPET_CHARS, SEARCH_DEFAULT_LIMIT
+from ...db.connection import db
+
+# one document per source page, the compound text index is prefixed by workspace_id so that a query only
+# touches the index entries of its own workspace
+SEARCH_COLLECTION = "SourcePages"
+PAGE_TEXT_FIELDS = ("text", "description", "transcript", "summary")
+
+
+async def ensure_search_indexes():
+    await db[SEARCH_COLLECTION].create_index(
+        [("workspace_id", 1), ("text", "text")],
+        name="workspace_text",
+        default_language="english"
+    )
+    await db[SEARCH_COLLECTION].create_index([("source_id", 1)], name="source_id")
+
+
+def page_search_text(page: Dict) -> str:
+    parts = [page[field] for field in PAGE_TEXT_FIELDS if isinstance(page.get(field), str) and page[field]]
+    size = sum(len(part) for part in parts)
+    for table in page.get("tables") or []:
+        if size >= SEARCH_MAX_PAGE_CHARS:
+            break
+        # pdf / docx / pptx tables are lists of rows, csv / xlsx tables are {"columns": [...], "rows": [{...}]}
+        rows = table.get("rows", []) if isinstance(table, dict) else table
+        for row in rows:
+            cells = row.values() if isinstance(row, dict) else row
+            line = " ".join(str(cell) for cell in cells if cell not in (None, ""))
+            parts.append(line)
+            size += len(line)
+            if size >= SEARCH_MAX_PAGE_CHARS:
+                break
+    return "\n".join(parts)[:SEARCH_MAX_PAGE_CHARS]
+
+
+async def index_sources(sources: List[Dict]):
+    """
+    Add the pages of freshly inserted sources (with their `_id`) to the search index.
+    """
+    operations = []
+    for source in sources:
+        for page in source.get("pages") or []:
+            text = page_search_text(page)
+            if not text.strip():
+                continue
+            operations.append(InsertOne({
+                "workspace_id": source["workspace_id"],
+                "user_id": source["user_id"],
+                "source_id": str(source["_id"]),
+                "source_name": source["name"],
+                "page_number": page.get("page_number"),
+                "text": text
+            }))
+    if operations:
+        await db[SEARCH_COLLECTION].bulk_write(operations, ordered=False)
+
+
+async def remove_sources(source_ids: List[str]):
+    if source_ids:
+        await db[SEARCH_COLLECTION].delete_many({"source_id": {"$in": source_ids}})
+
+
+def build_snippet(text: str, terms: List[str]) -> str:
+    match = None
+    if terms:
+        match = re.search("|".join(re.escape(term) for term in terms), text, re.IGNORECASE)
+    if not match:
+        return text[:SEARCH_SNIPPET_CHARS].strip()
+    start = max(match.start() - SEARCH_SNIPPET_CHARS // 2, 0)
+    end = min(start + SEARCH_SNIPPET_CHARS, len(text))
+    snippet = text[start:end].strip()
+    return f"{'...' if start else ''}{snippet}{'...' if end < len(text) else ''}"
+
+
+async def search_pages(user_id: str, workspace_id: str, query: str, limit: int = SEARCH_DEFAULT_LIMIT) -> List[Dict]:
+    terms = [term for term in re.findall(r"\w+", query) if len(term) > 1]
+    hits = []
+    cursor = db[SEARCH_COLLECTION].find(
+        {"workspace_id": workspace_id, "user_id": user_id, "$text": {"$search": query}},
+        {"_id": 0, "source_id": 1, "source_name": 1, "page_number": 1, "text": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    async for page in cursor:
+        hits.append({
+            "source_id": page["source_id"],
+            "source_name": page["source_name"],
+            "page_number": page["page_number"],
+            "score": round(page["score"], 4),
+            "snippet": build_snippet(page["text"], terms)
+        })
+    return hits
@@ -0,0 +1,138 @@
+"""
+In-memory stand-in for the parts of the Drive v3 client used by GoogleDriveProcessor and drive sync: files
+get / list / get_media and the changes feed. Every mutation is appended to a change log the same way Drive
+records it, and downloads are counted so that a sync can be checked for what it actually fetched.
+
+    drive = FakeDrive()
+    folder = drive.add_folder("notes")
+    drive.add_file("week1.txt", b"...", "text/plain", parents=[folder])
+    processor = GoogleDriveProcessor(service_factory=lambda credentials: drive)
+"""
+import re
+import hashlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from ...processors.google_drive_processor import FOLDER_MIME_TYPE
+
+PARENT_QUERY = re.compile(r"'([^']+)' in parents")
+EPOCH = datetime(2024, 1, 1)
+
+
+class FakeRequest:
+    def __init__(self, func: Callable):
+        self.func = func
+
+    def execute(self):
+        return self.func()
+
+
+class FakeFiles:
+    def __init__(self, drive: "FakeDrive"):
+        self.drive = drive
+
+    def get(self, fileId: str, fields: str = None) -> FakeRequest:
+        return FakeRequest(lambda: self.drive.metadata(fileId))
+
+    def list(self, q: str, fields: str = None, pageToken: Optional[str] = None, pageSize: int = 100) -> FakeRequest:
+        def execute():
+            parent_id = PARENT_QUERY.search(q).group(1)
+            children = [
+                self.drive.metadata(file_id) for file_id, file in self.drive.items.items()
+                if parent_id in file["parents"] and not file["trashed"]
+            ]
+            start = int(pageToken or 0)
+            page = {"files": children[start:start + pageSize]}
+            if start + pageSize < len(children):
+                page["nextPageToken"] = str(start + pageSize)
+            return page
+        return FakeRequest(execute)
+
+    def get_media(self, fileId: str) -> FakeRequest:
+        def execute():
+            self.drive.downloads += 1
+            return self.drive.items[fileId]["content"]
+        return FakeRequest(execute)
+
+
+class FakeChanges:
+    def __init__(self, drive: "FakeDrive"):
+        self.drive = drive
+
+    def getStartPageToken(self) -> FakeRequest:
+        return FakeRequest(lambda: {"startPageToken": str(len(self.drive.change_log))})
+
+    def list(self, pageToken: str, fields: str = None, pageSize: int = 100, **kwargs) -> FakeRequest:
+        def execute():
+            start = int(pageToken)
+            end = min(start + pageSize, len(self.drive.change_log))
+            changes = []
+            for file_id in self.drive.change_log[start:end]:
+                file = self.drive.items.get(file_id)
+                removed = file is None
+                changes.append({
+                    "fileId": file_id,
+                    "removed": removed,
+                    **({} if removed else {"file": self.drive.metadata(file_id)})
+                })
+            page = {"changes": changes}
+            if end < len(self.drive.change_log):
+                page["nextPageToken"] = str(end)
+            else:
+                page["newStartPageToken"] = str(end)
+            return page
+        return FakeRequest(execute)
+
+
+class FakeDrive:
+    def __init__(self):
+        self.items: Dict[str, Dict] = {}
+        self.change_log: List[str] = []
+        self.downloads = 0
+        self.clock = EPOCH
+
+    def next_time(self) -> str:
+        self.clock += timedelta(seconds=1)
+        return self.clock.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def record(self, file_id: str):
+        self.change_log.append(file_id)
+
+    def add_folder(self, name: str, parents: Optional[List[str]] = None) -> str:
+        return self.add_file(name, b"", FOLDER_MIME_TYPE, parents)
+
+    def add_file(self, name: str, content: bytes, mime_type: str, parents: Optional[List[str]] = None) -> str:
+        file_id = f"fake{len(self.change_log)}"
+        self.items[file_id] = {
+            "id": file_id, "name": name, "mimeType": mime_type, "parents": parents or [], "trashed": False,
+            "content": content, "modifiedTime": self.next_time()
+        }
+        self.record(file_id)
+        return file_id
+
+    def update_file(self, file_id: str, content: bytes):
+        self.items[file_id].update(content=content, modifiedTime=self.next_time())
+        self.record(file_id)
+
+    def trash_file(self, file_id: str):
+        self.items[file_id].update(trashed=True, modifiedTime=self.next_time())
+        self.record(file_id)
+
+    def delete_file(self, file_id: str):
+        del self.items[file_id]
+        self.record(file_id)
+
+    def metadata(self, file_id: str) -> Dict:
+        file = self.items[file_id]
+        metadata = {key: value for key, value in file.items() if key != "content"}
+        if file["mimeType"] != FOLDER_MIME_TYPE:
+            metadata["md5Checksum"] = hashlib.md5(file["content"]).hexdigest()
+            metadata["size"] = str(len(file["content"]))
+        return metadata
+
+    # the drive client is `service.files()` / `service.changes()`
+    def files(self) -> FakeFiles:
+        return FakeFiles(self)
+
+    def changes(self) -> FakeChanges:
+        return FakeChanges(self)
@@ -0,0 +1,265 @@
+"""
+Local stand-ins for every external provider the onboarding endpoints talk to: Supabase auth, Exa search, Gemini,
+ElevenLabs, Google OAuth and Drive. Each fake answers after a configurable latency and fails a configurable share
+of calls with an InjectedFault, so that load tests exercise the same retry / circuit breaker paths as production.
+
+    fakes = install_fakes(app, latency={"gemini": 2.0}, error_rates={"exa": 0.05})
+    ...
+    fakes.uninstall()
+
+Requests are authenticated with `Bearer load-test-<n>`, which the fake Supabase turns into user `load-test-<n>`.
+The provider calls are blocking, like the SDKs they replace, and run where the real calls run (Supabase on the
+event loop, the others in the guard's executor).
+"""
+import time
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from ...api.dependencies import get_supabase
+from ...core.config import PROCESSOR_REGISTRY
+from ...core.registry import IMAGE_PROCESSOR, GOOGLE_DRIVE_PROCESSOR
+from ...processors.audio_processor import AudioProcessor
+from ...processors.image_processor import ImageResponse, BatchImageResponse
+from ...processors.video_processor import VideoProcessor, VideoResponse
+from ..auth.credential_manager import CREDENTIAL_MANAGER
+from ..discover import discover_sources
+from ..resilience.fault_injection import FaultInjector, InjectedFault
+from .fake_drive import FakeDrive
+
+LOAD_TEST_TOKEN_PREFIX = "load-test-"
+
+# seconds per call, roughly what the real providers take
+DEFAULT_LATENCY = {
+    "supabase": 0.05,
+    "exa": 1.0,
+    "gemini": 2.0,
+    "elevenlabs": 1.5,
+    "google_oauth": 0.2,
+    "google_drive": 0.05,
+}
+
+FAKE_DRIVE_FILES = 5
+
+
+def parse_rates(rates: str) -> Dict[str, float]:
+    # "gemini=0.1,exa=0.05", the same format as LOG_LEVELS
+    parsed = {}
+    for item in filter(None, (item.strip() for item in rates.split(","))):
+        name, _, value = item.partition("=")
+        parsed[name.strip()] = float(value)
+    return parsed
+
+
+def inject(faults: FaultInjector):
+    # the blocking counterpart of FaultInjector.__call__, for fakes of synchronous SDK calls
+    if faults.latency:
+        time.sleep(faults.latency)
+    if faults.should_fail():
+        raise InjectedFault(faults.status_code, faults.retry_after)
+
+
+class FakeUser:
+    def __init__(self, user_id: str):
+        self.id = user_id
+        self.email = f"{user_id}@example.com"
+        self.user_metadata = {"full_name": user_id}
+        self.created_at = datetime.utcnow()
+
+    def model_dump(self) -> Dict:
+        return {"id": self.id, "email": self.email, "user_metadata": self.user_metadata, "created_at": self.created_at}
+
+
+class FakeSupabaseAuth:
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+
+    def get_user(self, token: str):
+        inject(self.faults)
+        if not token.startswith(LOAD_TEST_TOKEN_PREFIX):
+            return SimpleNamespace(user=None)
+        return SimpleNamespace(user=FakeUser(token))
+
+
+class FakeSupabase:
+    def __init__(self, faults: FaultInjector):
+        self.auth = FakeSupabaseAuth(faults)
+
+
+class FakeExa:
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+
+    def search_and_contents(self, query: str, num_results: int = 10, **kwargs):
+        inject(self.faults)
+        # a few urls per query so that staging sees repeats across calls and categories
+        results = [
+            {
+                "url": f"https://example.com/{abs(hash(query)) % 7}/{number}",
+                "title": f"{query} ({number})",
+                "text": f"Fake search result {number} for {query}. " * 20,
+                "author": "Load Test"
+            }
+            for number in range(num_results)
+        ]
+        return SimpleNamespace(results=results, cost_dollars={"total": 0.005})
+
+
+class FakeGeminiModels:
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+
+    def generate_content(self, model, contents, config):
+        inject(self.faults)
+        image = ImageResponse(text="fake text", tables=[], description="fake description", type="document")
+        if config.response_schema is BatchImageResponse:
+            count = sum(1 for part in contents if not isinstance(part, str))
+            return SimpleNamespace(parsed=BatchImageResponse(images=[image] * count))
+        if config.response_schema is VideoResponse:
+            return SimpleNamespace(parsed=VideoResponse(
+                transcript="fake transcript", summary="fake summary", key_moments=[]
+            ))
+        return SimpleNamespace(parsed=image)
+
+
+class FakeGemini:
+    def __init__(self, faults: FaultInjector):
+        self.models = FakeGeminiModels(faults)
+
+
+class FakeSpeechToText:
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+
+    def convert(self, file, **kwargs):
+        inject(self.faults)
+        words = [
+            SimpleNamespace(text=f"{text} ", start=number * 0.5, end=number * 0.5 + 0.4, speaker_id="speaker_0")
+            for number, text in enumerate("this is a fake transcript".split())
+        ]
+        return SimpleNamespace(text="this is a fake transcript", words=words)
+
+
+class FakeElevenLabs:
+    def __init__(self, faults: FaultInjector):
+        self.speech_to_text = FakeSpeechToText(faults)
+
+
+class FakeGoogleOAuth:
+    """
+    Replaces CredentialManager's refresher: hands out an hour long fake token instead of calling google.
+    """
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+
+    def __call__(self, credentials):
+        inject(self.faults)
+        credentials.token = f"fake-{random.getrandbits(64):x}"
+        credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+        return credentials
+
+
+class FakeDriveService:
+    # FakeDrive with the latency and faults of the other fakes on every executed request
+    def __init__(self, drive: FakeDrive, faults: FaultInjector):
+        self.drive = drive
+        self.faults = faults
+
+    def wrap(self, request):
+        execute = request.execute
+
+        def faulty_execute():
+            inject(self.faults)
+            return execute()
+        request.execute = faulty_execute
+        return request
+
+    def files(self):
+        files = self.drive.files()
+        return SimpleNamespace(
+            get=lambda **kwargs: self.wrap(files.get(**kwargs)),
+            list=lambda **kwargs: self.wrap(files.list(**kwargs)),
+            get_media=lambda **kwargs: self.wrap(files.get_media(**kwargs))
+        )
+
+    def changes(self):
+        return self.drive.changes()
+
+
+def fake_credentials_info(user_id: str) -> Dict:
+    """
+    What the oauth callback would have stored in Tokens for the user, with an expired token so that the first
+    drive request goes through the (fake) refresh.
+    """
+    return {
+        "token": "expired",
+        "refresh_token": f"fake-refresh-{user_id}",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "fake-client",
+        "client_secret": "fake-secret",
+        "scopes": ["https://www.googleapis.com/auth/drive.readonly"],
+        "expiry": (datetime.utcnow() - timedelta(minutes=5)).isoformat() + "Z"
+    }
+
+
+def fake_drive_tree(file_count: int = FAKE_DRIVE_FILES) -> FakeDrive:
+    # one shared folder, its id is always "fake0"
+    drive = FakeDrive()
+    folder = drive.add_folder("load test")
+    for number in range(file_count):
+        drive.add_file(f"notes_{number}.txt", f"drive notes {number}\n".encode() * 200, "text/plain", [folder])
+    return drive
+
+
+class FakeProviders:
+    def __init__(self, latency: Optional[Dict[str, float]] = None, error_rates: Optional[Dict[str, float]] = None,
+                 seed: Optional[int] = None):
+        latency = {**DEFAULT_LATENCY, **(latency or {})}
+        error_rates = error_rates or {}
+        self.faults = {
+            name: FaultInjector(latency=latency[name], error_rate=error_rates.get(name, 0.0), seed=seed)
+            for name in DEFAULT_LATENCY
+        }
+        self.supabase = FakeSupabase(self.faults["supabase"])
+        self.exa = FakeExa(self.faults["exa"])
+        self.gemini = FakeGemini(self.faults["gemini"])
+        self.elevenlabs = FakeElevenLabs(self.faults["elevenlabs"])
+        self.google_oauth = FakeGoogleOAuth(self.faults["google_oauth"])
+        self.drive = fake_drive_tree()
+        self.restores: List = []
+
+    def swap(self, target, attribute: str, value):
+        self.restores.append((target, attribute, getattr(target, attribute)))
+        setattr(target, attribute, value)
+
+    def install(self, app):
+        app.dependency_overrides[get_supabase] = lambda: self.supabase
+        self.restores.append((app.dependency_overrides, get_supabase, None))
+        self.swap(discover_sources, "exa", self.exa)
+        self.swap(IMAGE_PROCESSOR, "client", self.gemini)
+        for processor in set(PROCESSOR_REGISTRY.values()):
+            if isinstance(processor, VideoProcessor):
+                self.swap(processor, "client", self.gemini)
+            elif isinstance(processor, AudioProcessor):
+                self.swap(processor, "client", self.elevenlabs)
+        self.swap(CREDENTIAL_MANAGER, "refresher", self.google_oauth)
+        self.swap(GOOGLE_DRIVE_PROCESSOR, "service_factory",
+                  lambda credentials: FakeDriveService(self.drive, self.faults["google_drive"]))
+        return self
+
+    def uninstall(self):
+        for target, attribute, value in reversed(self.restores):
+            if isinstance(target, dict):
+                target.pop(attribute, None)
+            else:
+                setattr(target, attribute, value)
+        self.restores = []
+
+    def stats(self) -> Dict[str, int]:
+        return {name: faults.calls for name, faults in self.faults.items()}
+
+
+def install_fakes(app, latency: Optional[Dict[str, float]] = None, error_rates: Optional[Dict[str, float]] = None,
+                  seed: Optional[int] = None) -> FakeProviders:
+    return FakeProviders(latency, error_rates, seed).install(app)
@@ -0,0 +1,129 @@
+import asyncio
+import statistics
+from io import BytesIO
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from ..core.config import OCR_WORKERS, OCR_LANGUAGE, OCR_MIN_WORDS, OCR_MIN_CONFIDENCE, OCR_TABLE_MIN_ROWS, \
+    OCR_TIMEOUT_SECONDS
+from ..services.logging.logger import logger
+from ..services.profiling.profiling import span
+
+try:
+    # optional, needs the tesseract binary as well. Without it every image goes to gemini
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+
+@lru_cache(maxsize=1)
+def ocr_available() -> bool:
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception as e:
+        logger.warning(f"pytesseract is installed but tesseract is not usable, images go to gemini: {str(e)}")
+        return False
+
+
+def column_count(words: List[Dict]) -> int:
+    # a gap wider than two word heights between neighbours starts a new column
+    height = statistics.median(word["height"] for word in words)
+    columns = 1
+    for previous, word in zip(words, words[1:]):
+        if word["left"] - (previous["left"] + previous["width"]) > 2 * height:
+            columns += 1
+    return columns
+
+
+def recognize_text(content: bytes) -> Dict:
+    """
+    Tesseract's words with their confidences. Returns the text (lines as tesseract found them), the mean word
+    confidence weighted by word length, the word count and how many lines look like table rows.
+    """
+    image = Image.open(BytesIO(content))
+    image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    data = pytesseract.image_to_data(
+        image, lang=OCR_LANGUAGE, output_type=pytesseract.Output.DICT, timeout=OCR_TIMEOUT_SECONDS
+    )
+    lines = defaultdict(list)
+    for position, text in enumerate(data["text"]):
+        confidence = float(data["conf"][position])
+        if confidence < 0 or not text.strip():
+            continue
+        key = (data["block_num"][position], data["par_num"][position], data["line_num"][position])
+        lines[key].append({
+            "text": text.strip(),
+            "confidence": confidence,
+            "left": data["left"][position],
+            "width": data["width"][position],
+            "height": data["height"][position]
+        })
+
+    words = [word for line in lines.values() for word in line]
+    characters = sum(len(word["text"]) for word in words)
+    return {
+        "text": "\n".join(" ".join(word["text"] for word in line) for line in lines.values()),
+        "confidence": round(sum(word["confidence"] * len(word["text"]) for word in words) / characters, 1)
+        if characters else 0.0,
+        "words": len(words),
+        "table_rows": sum(1 for line in lines.values() if len(line) > 1 and column_count(line) >= 3)
+    }
+
+
+def escalation_reason(result: Optional[Dict]) -> Optional[str]:
+    """
+    Why the ocr result is not good enough to keep, None when it is.
+    """
+    if result is None:
+        return "ocr_unavailable"
+    if result["words"] < OCR_MIN_WORDS:
+        return "scene"
+    if result["confidence"] < OCR_MIN_CONFIDENCE:
+        return "low_confidence"
+    if result["table_rows"] >= OCR_TABLE_MIN_ROWS:
+        return "tables"
+    return None
+
+
+class OcrPool:
+    """
+    Runs tesseract for many images at once. pytesseract starts one tesseract process per image, the threads
+    of the pool only wait on them.
+    """
+    def __init__(self, workers: int = OCR_WORKERS):
+        self.workers = workers
+        self.pool: Optional[ThreadPoolExecutor] = None
+
+    def get_pool(self) -> ThreadPoolExecutor:
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="ocr")
+        return self.pool
+
+    def run(self, content: bytes) -> Optional[Dict]:
+        try:
+            return recognize_text(content)
+        except Exception as e:
+            logger.warning(f"OCR failed, escalating the image: {str(e)}")
+            return None
+
+    async def recognize(self, images: List[bytes]) -> List[Optional[Dict]]:
+        # None for every image that could not be read locally
+        if not images or not ocr_available():
+            return [None] * len(images)
+        loop = asyncio.get_running_loop()
+        with span("ocr"):
+            return list(await asyncio.gather(*[
+                loop.run_in_executor(self.get_pool(), self.run, content) for content in images
+            ]))
+
+
+OCR = OcrPool()
@@ -0,0 +1,148 @@
+import re
+import codecs
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:  # detection falls back to utf-8 / cp1252
+    from_bytes = None
+
+from ..core.config import TEXT_CHUNK_CHARS, TEXT_CHUNK_OVERLAP_CHARS, CHARS_PER_TOKEN
+
+DETECTION_SAMPLE_BYTES = 64 * 1024
+DECODE_BLOCK_BYTES = 1024 * 1024
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+SENTENCE_BREAK = re.compile(r"[.!?。！？]+[\"'\)\]”]*\s+")
+
+
+def detect_encoding(sample: bytes, complete: bool = False) -> str:
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # unless the sample is the whole content, a multi-byte character cut at its end is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # statistical detection is unreliable on a few bytes
+    if from_bytes is not None and len(sample) >= 512:
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    return "cp1252"
+
+
+def iter_decoded(content: bytes, encoding: Optional[str] = None, block_size: int = DECODE_BLOCK_BYTES) -> Iterator[str]:
+    """
+    Decode `content` block by block. Undecodable bytes are replaced instead of failing the whole file.
+    """
+    encoding = encoding or detect_encoding(content[:DETECTION_SAMPLE_BYTES], len(content) <= DETECTION_SAMPLE_BYTES)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    view = memoryview(content)
+    for start in range(0, len(view), block_size):
+        text = decoder.decode(view[start:start + block_size], final=False)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def split_keep(text: str, pattern: re.Pattern) -> List[str]:
+    # like pattern.split but every piece keeps the separator that ended it
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        pieces.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+class TextChunker:
+    """
+    Streams text into chunks close to `target_chars` (or `target_tokens`, estimated with CHARS_PER_TOKEN).
+    Chunks end on paragraph boundaries where possible, then sentences, then whitespace, and only hard cut
+    text that has none of them. With `overlap_chars` every chunk starts with the tail of the previous one.
+    Every character is scanned a constant number of times, so the cost is linear in the input size.
+    """
+    def __init__(self, target_chars: Optional[int] = None, target_tokens: Optional[int] = None,
+                 overlap_chars: int = TEXT_CHUNK_OVERLAP_CHARS):
+        if target_tokens:
+            target_chars = target_tokens * CHARS_PER_TOKEN
+        self.target_chars = target_chars or TEXT_CHUNK_CHARS
+        self.overlap_chars = min(overlap_chars, self.target_chars // 2)
+        # an unfinished paragraph is carried between blocks, past this size it is flushed at a sentence boundary
+        self.max_pending = self.target_chars * 4
+
+    def split(self, text: str) -> List[str]:
+        return list(self.iter_chunks([text]))
+
+    def pieces(self, paragraph: str) -> Iterator[str]:
+        if len(paragraph) <= self.target_chars:
+            yield paragraph
+            return
+        for sentence in split_keep(paragraph, SENTENCE_BREAK):
+            if len(sentence) <= self.target_chars:
+                yield sentence
+                continue
+            start = 0
+            while len(sentence) - start > self.target_chars:
+                cut = sentence.rfind(" ", start, start + self.target_chars)
+                cut = cut + 1 if cut > start else start + self.target_chars
+                yield sentence[start:cut]
+                start = cut
+            yield sentence[start:]
+
+    def iter_chunks(self, blocks: Iterable[str]) -> Iterator[str]:
+        chunk: List[str] = []
+        chunk_size = 0
+        overlap_size = 0
+        pending = ""
+
+        def feed(paragraphs: List[str]) -> Iterator[str]:
+            nonlocal chunk, chunk_size, overlap_size
+            for paragraph in paragraphs:
+                for piece in self.pieces(paragraph):
+                    if chunk_size + len(piece) > self.target_chars and chunk_size > overlap_size:
+                        text = "".join(chunk).strip()
+                        if text:
+                            yield text
+                        chunk, chunk_size, overlap_size = self.overlap(text)
+                    chunk.append(piece)
+                    chunk_size += len(piece)
+
+        for block in blocks:
+            paragraphs = split_keep(pending + block, PARAGRAPH_BREAK)
+            pending = paragraphs.pop() if paragraphs else ""
+            if len(pending) > self.max_pending:
+                sentences = split_keep(pending, SENTENCE_BREAK)
+                pending = sentences.pop() if len(sentences) > 1 else ""
+                paragraphs.append("".join(sentences))
+            yield from feed(paragraphs)
+
+        yield from feed([pending])
+        text = "".join(chunk).strip()
+        if text and chunk_size > overlap_size:
+            yield text
+
+    def overlap(self, text: str):
+        if not self.overlap_chars:
+            return [], 0, 0
+        tail = text[-self.overlap_chars:]
+        space = tail.find(" ")
+        if 0 <= space < len(tail) - 1:
+            tail = tail[space + 1:]
+        tail += " "
+        return [tail], len(tail), len(tail)
@@ -0,0 +1,196 @@
+"""
+Reproducible synthetic documents for the processor benchmarks. Every generator is seeded, so the same
+name always produces byte-identical content for a given library version. Files are cached in CORPUS_DIR.
+"""
+import io
+import os
+import csv
+import random
+from typing import Callable, Dict
+
+import fitz  # PyMuPDF
+from docx import Document
+from docx.shared import Inches
+from openpyxl import Workbook
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches as PptxInches
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), ".corpus")
+
+WORDS = ("learning retrieval source workspace gradient lecture summary notes chapter theorem example "
+         "dataset model network feature vector search index page table image figure result").split()
+
+
+def sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int = 6) -> str:
+    return " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(sentences))
+
+
+def png_bytes(rng: random.Random, size=(320, 240)) -> bytes:
+    # noisy content so that images do not compress to nothing
+    image = Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def build_pdf(pages: int, tables: bool = False, images: bool = False, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    image = png_bytes(rng) if images else None
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 400), paragraph(rng, 12), fontsize=9)
+        if tables:
+            top, rows, cols, cell_w, cell_h = 420, 8, 5, 90, 18
+            for row in range(rows):
+                for col in range(cols):
+                    rect = fitz.Rect(50 + col * cell_w, top + row * cell_h, 50 + (col + 1) * cell_w, top + (row + 1) * cell_h)
+                    page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+                    page.insert_text((rect.x0 + 3, rect.y1 - 5), rng.choice(WORDS), fontsize=8)
+        if images and page_number % 2 == 0:
+            page.insert_image(fitz.Rect(350, 600, 550, 750), stream=image)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def build_docx(pages: int, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    doc = Document()
+    image = io.BytesIO(png_bytes(rng, (64, 64)))
+
+    # roughly one printed page: a heading, five paragraphs and every fifth page a table and an image
+    for page in range(pages):
+        doc.add_heading(f"Section {page + 1}", level=2)
+        for _ in range(5):
+            doc.add_paragraph(" ".join(rng.choice(WORDS) for _ in range(110)))
+        if page % 5 == 0:
+            table = doc.add_table(rows=6, cols=4)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rng.choice(WORDS)
+            image.seek(0)
+            doc.add_picture(image, width=Inches(1))
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def build_pptx(slides: int, seed: int = 3) -> bytes:
+    rng = random.Random(seed)
+    prs = Presentation()
+    logo = io.BytesIO(png_bytes(rng, (96, 48)))
+    figures = [png_bytes(rng, (320, 240)) for _ in range(10)]
+
+    for slide_number in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {slide_number + 1}: {sentence(rng, 5)}"
+        body = slide.shapes.add_textbox(PptxInches(0.5), PptxInches(1.5), PptxInches(9), PptxInches(2))
+        body.text_frame.text = paragraph(rng, 3)
+        logo.seek(0)
+        slide.shapes.add_picture(logo, PptxInches(8.5), PptxInches(0.2), PptxInches(1), PptxInches(0.5))
+        if slide_number % 3 == 0:
+            slide.shapes.add_picture(io.BytesIO(rng.choice(figures)), PptxInches(0.5), PptxInches(4), PptxInches(3))
+        if slide_number % 5 == 0:
+            # callouts grouped with the logo, only reachable by descending into the group
+            group = slide.shapes.add_group_shape()
+            group.shapes.add_textbox(PptxInches(6), PptxInches(6.5), PptxInches(3), PptxInches(0.5)).text_frame.text = sentence(rng, 6)
+            logo.seek(0)
+            group.shapes.add_picture(logo, PptxInches(9), PptxInches(6.5), PptxInches(0.5), PptxInches(0.25))
+        if slide_number % 4 == 0:
+            table = slide.shapes.add_table(4, 3, PptxInches(5), PptxInches(4), PptxInches(4), PptxInches(2)).table
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rng.choice(WORDS)
+        slide.notes_slide.notes_text_frame.text = sentence(rng)
+
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+def build_csv(rows: int, cols: int, seed: int = 5) -> bytes:
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f"column_{col}" for col in range(cols)])
+    for row in range(rows):
+        writer.writerow([row if col == 0 else (rng.random() if col % 2 else rng.choice(WORDS)) for col in range(cols)])
+    return buffer.getvalue().encode("utf-8")
+
+
+def build_xlsx(rows: int, cols: int, seed: int = 9) -> bytes:
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+    ws.append([f"column_{col}" for col in range(cols)])
+    for row in range(rows):
+        ws.append([row if col == 0 else (round(rng.random(), 6) if col % 2 else rng.choice(WORDS)) for col in range(cols)])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def build_txt(megabytes: int, seed: int = 11) -> bytes:
+    rng = random.Random(seed)
+    paragraphs = [paragraph(rng, rng.randint(2, 9)) for _ in range(500)]
+    block = "\n\n".join(paragraphs).encode("utf-8")
+    return (block * (megabytes * 1024 * 1024 // len(block) + 1))[:megabytes * 1024 * 1024]
+
+
+def build_html(sections: int, images: int = 5, seed: int = 13) -> bytes:
+    rng = random.Random(seed)
+    parts = ["<html><head><title>Benchmark</title><style>p {margin: 0}</style><script>var x = 1;</script></head><body>"]
+    for section in range(sections):
+        parts.append(f"<h2>Section {section}</h2><p>{paragraph(rng)}</p><p>{paragraph(rng)}</p>")
+        if section % 10 == 0:
+            rows = "".join(f"<tr>{''.join(f'<td>{rng.choice(WORDS)}</td>' for _ in range(4))}</tr>" for _ in range(10))
+            parts.append(f"<table>{rows}</table>")
+    for image in range(images):
+        parts.append(f'<img src="image_{image}.png" width="320" height="240">')
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+CORPUS: Dict[str, Callable[[], bytes]] = {
+    "text.pdf": lambda: build_pdf(100),
+    "tables.pdf": lambda: build_pdf(50, tables=True),
+    "images.pdf": lambda: build_pdf(50, images=True),
+    "large.docx": lambda: build_docx(300),
+    "large.pptx": lambda: build_pptx(300),
+    "tall.csv": lambda: build_csv(200_000, 8),
+    "wide.csv": lambda: build_csv(5_000, 200),
+    "tall.xlsx": lambda: build_xlsx(50_000, 8),
+    "wide.xlsx": lambda: build_xlsx(2_000, 150),
+    "large.txt": lambda: build_txt(20),
+    "page.html": lambda: build_html(400),
+}
+
+
+def get_file(name: str) -> str:
+    """
+    Path of a corpus file, generated on first use.
+    """
+    path = os.path.join(CORPUS_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        with open(path, "wb") as corpus_file:
+            corpus_file.write(CORPUS[name]())
+    return path
+
+
+def ensure_html_assets() -> str:
+    page_path = get_file("page.html")
+    rng = random.Random(17)
+    for image in range(5):
+        path = os.path.join(CORPUS_DIR, f"image_{image}.png")
+        if not os.path.exists(path):
+            with open(path, "wb") as image_file:
+                image_file.write(png_bytes(rng))
+    return page_path
@@ -0,0 +1,58 @@
+"""
+Compare the previous DOCX pagination (sum over the page after every paragraph, tables and images appended
+to the last page) with the single pass engine in DocxProcessor on a generated ~300 page document.
+
+    python -m benchmarks.docx_benchmark --pages 300
+"""
+import io
+import time
+import asyncio
+import argparse
+
+from docx import Document
+
+from app.processors.docx_processor import DocxProcessor
+from .corpus import build_docx
+
+
+def legacy_paginate(content: bytes) -> int:
+    doc = Document(io.BytesIO(content))
+    pages = []
+    current_page = {"text": [], "tables": [], "images": []}
+    for para in doc.paragraphs:
+        if para.text.strip():
+            current_page["text"].append(para.text)
+        if sum(len(t) for t in current_page["text"]) > 500:
+            pages.append(current_page)
+            current_page = {"text": [], "tables": [], "images": []}
+    for table in doc.tables:
+        current_page["tables"].append([[cell.text for cell in row.cells] for row in table.rows])
+    pages.append(current_page)
+    return len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = build_docx(args.pages)
+    print(f"generated {args.pages} page docx: {round(len(content) / (1024 * 1024), 2)} MB")
+
+    processor = DocxProcessor()
+    for name, run in (
+        ("legacy", lambda: legacy_paginate(content)),
+        ("engine", lambda: asyncio.run(processor.process(content, "benchmark.docx"))["page_count"]),
+    ):
+        timings = []
+        page_count = 0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            page_count = run()
+            timings.append(time.perf_counter() - started)
+        print(f"{name:>8}: best {round(min(timings) * 1000, 1)} ms, {page_count} pages")
+
+
+if __name__ == "__main__":
+    main()
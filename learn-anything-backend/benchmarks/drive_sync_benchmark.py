@@ -0,0 +1,83 @@
+"""
+Downloads and wall time of a Drive re-sync against an in-memory drive: a full sync of the tree, then a few edits,
+a delete and a trashed sub folder, then the incremental sync that only follows the changes feed.
+
+    python -m benchmarks.drive_sync_benchmark --files 500
+"""
+import time
+import asyncio
+import argparse
+
+from app.core.registry import GOOGLE_DRIVE_PROCESSOR
+from app.services.drive_sync.drive_sync import DriveSyncer, fingerprint
+from app.services.stubs.fake_drive import FakeDrive
+
+
+def next_state(state, outcome):
+    # the part of sync_drive that moves the tracked files on, without the database
+    files = dict(state["files"]) if state else {}
+    for file_id in outcome["removed"]:
+        files.pop(file_id, None)
+    for file_id, file_metadata in outcome["listed"].items():
+        files[file_id] = fingerprint(file_metadata)
+    return {
+        "root_ids": outcome["root_ids"],
+        "folders": outcome["folders"],
+        "start_page_token": outcome["start_page_token"],
+        "files": files
+    }
+
+
+async def timed_sync(drive: FakeDrive, sync):
+    downloads = drive.downloads
+    started = time.perf_counter()
+    outcome = await sync
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    return outcome, drive.downloads - downloads, elapsed
+
+
+async def run(file_count: int):
+    drive = FakeDrive()
+    root = drive.add_folder("course")
+    archive = drive.add_folder("archive", parents=[root])
+    file_ids = [
+        drive.add_file(f"notes_{number}.txt", f"lecture notes {number}".encode(), "text/plain", parents=[root])
+        for number in range(file_count)
+    ]
+    archived_ids = [
+        drive.add_file(f"old_{number}.txt", f"old notes {number}".encode(), "text/plain", parents=[archive])
+        for number in range(10)
+    ]
+    syncer = DriveSyncer(drive, GOOGLE_DRIVE_PROCESSOR)
+
+    outcome, downloads, elapsed = await timed_sync(drive, syncer.full_sync([root]))
+    state = next_state(None, outcome)
+    print(f"full sync:        {len(outcome['parsed'])} parsed, {downloads} downloads, {elapsed} ms")
+
+    for file_id in file_ids[:3]:
+        drive.update_file(file_id, b"edited lecture notes")
+    drive.delete_file(file_ids[3])
+    drive.trash_file(archive)
+    outcome, downloads, elapsed = await timed_sync(drive, syncer.incremental_sync(state))
+    state = next_state(state, outcome)
+    print(
+        f"incremental sync: {len(outcome['parsed'])} parsed, {len(outcome['removed'])} removed, "
+        f"{downloads} downloads, {elapsed} ms"
+    )
+    assert downloads == 3
+    assert set(outcome["removed"]) == {file_ids[3], *archived_ids}
+    assert len(state["files"]) == file_count - 1
+
+    outcome, downloads, elapsed = await timed_sync(drive, syncer.full_sync([root], state["files"]))
+    print(f"full re-walk:     {len(outcome['parsed'])} parsed, {downloads} downloads, {elapsed} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.files))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+The production app with every external provider replaced by the local fakes of app/services/stubs, for load tests
+against a real server (several workers, the production middlewares, a local mongo):
+
+    LOAD_FAKE_LATENCY="gemini=2.0" LOAD_FAKE_ERROR_RATES="gemini=0.1" \
+        python -m app.serve --app benchmarks.load_app:app --workers 4
+    python -m benchmarks.load_generator --url http://127.0.0.1:8000
+"""
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ELEVENLABS_API_KEY", "offline-benchmark")
+
+from app.main import app
+from app.services.stubs.fake_providers import install_fakes, parse_rates
+
+FAKES = install_fakes(
+    app,
+    latency=parse_rates(os.getenv("LOAD_FAKE_LATENCY", "")),
+    error_rates=parse_rates(os.getenv("LOAD_FAKE_ERROR_RATES", ""))
+)
@@ -0,0 +1,204 @@
+"""
+Load generator for the onboarding endpoints. Simulated users send a weighted mix of uploads (text, image, pdf and
+drive folder), discover calls, source listings and storage lookups from `--concurrency` clients for `--seconds`,
+then latency percentiles, throughput and error rates are reported per endpoint.
+
+    python -m benchmarks.load_generator                              # in process, fakes for every provider
+    python -m benchmarks.load_generator --mix upload=1,sources=4 --error-rates gemini=0.1,exa=0.05
+    python -m benchmarks.load_generator --url http://127.0.0.1:8000  # a server running benchmarks.load_app
+
+Auth, Exa, Gemini, ElevenLabs and Google are the fakes of app/services/stubs/fake_providers.py, mongo is the one
+MONGO_URI points at: the users' drive tokens are seeded there and their sources written there.
+"""
+import io
+import os
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ELEVENLABS_API_KEY", "offline-benchmark")
+
+import httpx
+from PIL import Image
+from pymongo import ReturnDocument
+
+from app.db.connection import db
+from app.services.stubs.fake_providers import LOAD_TEST_TOKEN_PREFIX, fake_credentials_info, parse_rates
+from .corpus import build_pdf
+
+DEFAULT_MIX = "upload=3,discover=1,sources=4,storage=2"
+UPLOAD_KINDS = ["text", "text", "image", "pdf", "drive"]
+# the folder of the fake drive tree
+DRIVE_FOLDER_ID = "fake0"
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def build_payloads() -> Dict[str, tuple]:
+    image = io.BytesIO()
+    Image.new("RGB", (800, 600), (200, 120, 40)).save(image, format="PNG")
+    return {
+        "text": ("notes.txt", b"lecture notes on load testing\n" * 400, "text/plain"),
+        "image": ("slide.png", image.getvalue(), "image/png"),
+        "pdf": ("chapter.pdf", build_pdf(5), "application/pdf"),
+    }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, users: int, mix: Dict[str, float], seed: int):
+        self.client = client
+        self.users = [f"{LOAD_TEST_TOKEN_PREFIX}{number}" for number in range(users)]
+        self.mix = mix
+        self.random = random.Random(seed)
+        self.payloads = build_payloads()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.workspaces: Dict[str, str] = {}
+
+    async def seed(self):
+        # what the google oauth callback would have stored, so that drive uploads find credentials, and a
+        # workspace per user since ingests are only accepted into workspaces the user owns
+        for user_id in self.users:
+            await db["Tokens"].update_one(
+                {"user_id": user_id},
+                {"$set": {"user_id": user_id, "credentials": fake_credentials_info(user_id)}},
+                upsert=True
+            )
+            workspace = await db["Workspaces"].find_one_and_update(
+                {"user_id": user_id, "name": "load test"},
+                {"$setOnInsert": {"user_id": user_id, "name": "load test", "created_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self.workspaces[user_id] = str(workspace["_id"])
+
+    def request_for(self, action: str, user_id: str) -> Dict:
+        workspace_id = self.workspaces[user_id]
+        if action == "upload":
+            kind = self.random.choice(UPLOAD_KINDS)
+            data = {"workspace_id": workspace_id}
+            if kind == "drive":
+                return {"method": "POST", "url": "/onboarding/upload-files",
+                        "data": {**data, "drive_file_ids": f'["{DRIVE_FOLDER_ID}"]'}}
+            return {"method": "POST", "url": "/onboarding/upload-files", "data": data,
+                    "files": [("files", self.payloads[kind])]}
+        if action == "discover":
+            return {"method": "POST", "url": "/onboarding/discover-sources",
+                    "params": {"workspace_id": workspace_id, "query": self.random.choice(["rust", "jazz", "go"])}}
+        if action == "sources":
+            return {"method": "GET", "url": "/onboarding/sources", "params": {"workspace_id": workspace_id}}
+        if action == "storage":
+            return {"method": "POST", "url": "/onboarding/get-storage-capacity",
+                    "params": {"workspace_id": workspace_id}}
+        raise ValueError(f"Unknown action: {action}")
+
+    async def send(self, action: str):
+        user_id = self.random.choice(self.users)
+        request = self.request_for(action, user_id)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(headers={"Authorization": f"Bearer {user_id}"}, **request)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies[action].append(time.perf_counter() - started)
+        self.statuses[action][status] += 1
+
+    async def worker(self, deadline: float):
+        actions, weights = zip(*self.mix.items())
+        while time.monotonic() < deadline:
+            await self.send(self.random.choices(actions, weights)[0])
+
+    async def run(self, concurrency: int, seconds: float) -> float:
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(deadline) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> Dict[str, Dict]:
+        report = {}
+        for action in self.mix:
+            latencies = sorted(self.latencies[action])
+            statuses = self.statuses[action]
+            total = sum(statuses.values())
+            errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+            report[action] = {
+                "requests": total,
+                "throughput_rps": round(total / elapsed, 2),
+                "error_rate": round(errors / total, 3) if total else 0.0,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                "statuses": dict(statuses)
+            }
+        return report
+
+
+async def run(args) -> Dict:
+    mix = parse_rates(args.mix)
+    fakes = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        lifespan = None
+    else:
+        from app.main import app
+        from app.services.stubs.fake_providers import install_fakes
+        fakes = install_fakes(app, parse_rates(args.latency), parse_rates(args.error_rates), seed=args.seed)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://load-test", timeout=args.timeout
+        )
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+    try:
+        load_test = LoadTest(client, args.users, mix, args.seed)
+        await load_test.seed()
+        elapsed = await load_test.run(args.concurrency, args.seconds)
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        if fakes is not None:
+            fakes.uninstall()
+
+    report = load_test.report(elapsed)
+    total = sum(entry["requests"] for entry in report.values())
+    return {
+        "elapsed_seconds": round(elapsed, 1),
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": report,
+        "provider_calls": fakes.stats() if fakes is not None else None
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="a running server, in process when left out")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--latency", default="", help='per provider seconds, e.g. "gemini=2.0,exa=0.5"')
+    parser.add_argument("--error-rates", default="", help='per provider share of failed calls, e.g. "gemini=0.1"')
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(f"{result['elapsed_seconds']}s, {result['throughput_rps']} requests/s overall")
+    for action, entry in result["endpoints"].items():
+        print(f"{action:>10}: {entry}")
+    if result["provider_calls"] is not None:
+        print(f"provider calls: {result['provider_calls']}")
+
+
+if __name__ == "__main__":
+    main()
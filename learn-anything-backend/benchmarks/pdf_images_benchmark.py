@@ -0,0 +1,56 @@
+"""
+Ingest time and stored page size of an image heavy pdf with eager image extraction against lazy mode (metadata
+only, the original kept aside), plus what extracting one image on demand costs.
+
+    python -m benchmarks.pdf_images_benchmark --pages 50
+"""
+import time
+import asyncio
+import argparse
+
+import bson
+
+from app.processors.pdf_processor import PDFProcessor, extract_image
+from .corpus import build_pdf
+
+
+async def ingest(mode: str, content: bytes, repeat: int):
+    processor = PDFProcessor(image_mode=mode)
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await processor.process(content, "images.pdf")
+        timings.append(time.perf_counter() - started)
+    original = result.pop("original", None)
+    return {
+        "seconds": round(min(timings), 3),
+        "pages_bytes": len(bson.encode({"pages": result["pages"]})),
+        "original_bytes": len(original) if original else 0,
+        "images": sum(len(page["images"]) for page in result["pages"])
+    }, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = build_pdf(args.pages, images=True)
+    eager, _ = asyncio.run(ingest("eager", content, args.repeat))
+    lazy, result = asyncio.run(ingest("lazy", content, args.repeat))
+    print(f"eager: {eager}")
+    print(f"lazy:  {lazy}")
+    print(f"ingest {round(eager['seconds'] / max(lazy['seconds'], 1e-6), 1)}x faster, "
+          f"pages {round(eager['pages_bytes'] / max(lazy['pages_bytes'], 1), 1)}x smaller")
+
+    xref = next(image["xref"] for page in result["pages"] for image in page["images"])
+    started = time.perf_counter()
+    image = extract_image(content, xref)
+    print(f"on demand extraction of one image: {round((time.perf_counter() - started) * 1000, 1)}ms, "
+          f"{len(image['image'])} bytes {image['format']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Cost of turning processor output into a BSON ready source document: `Source(...).model_dump()` validates
+and copies every page twice, `Source.document(...)` validates the metadata only.
+
+    python -m benchmarks.persistence_benchmark --pages 2000
+"""
+import time
+import random
+import argparse
+from datetime import datetime
+
+from app.models.source import Source
+from .corpus import paragraph, WORDS
+
+
+def csv_pages(rng: random.Random, pages: int, rows: int = 50, cols: int = 8):
+    columns = [f"column_{col}" for col in range(cols)]
+    return [{
+        "page_number": page_number,
+        "text": "",
+        "tables": [{"columns": columns, "rows": [
+            {column: rng.choice(WORDS) for column in columns} for _ in range(rows)
+        ]}],
+        "images": []
+    } for page_number in range(1, pages + 1)]
+
+
+def pdf_pages(rng: random.Random, pages: int):
+    return [{
+        "page_number": page_number,
+        "text": paragraph(rng, 12),
+        "tables": [[[rng.choice(WORDS) for _ in range(4)] for _ in range(6)]],
+        "images": [{"format": "webp", "data": "A" * 2048, "thumbnail": None, "width": 320, "height": 240}]
+    } for page_number in range(1, pages + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    metadata = {"user_id": "benchmark", "workspace_id": "benchmark", "name": "benchmark", "size": 1.0}
+    for name, file_type, pages in (
+        ("csv", "csv", csv_pages(rng, args.pages)),
+        ("pdf", "pdf", pdf_pages(rng, args.pages)),
+    ):
+        for variant, build in (
+            ("model_dump", lambda: Source(
+                type=file_type, page_count=len(pages), pages=pages, created_at=datetime.utcnow(), **metadata
+            ).model_dump()),
+            ("document", lambda: Source.document(
+                type=file_type, page_count=len(pages), pages=pages, created_at=datetime.utcnow(), **metadata
+            )),
+        ):
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                build()
+                timings.append(time.perf_counter() - started)
+            print(f"{name} {args.pages} pages {variant:>11}: best {round(min(timings) * 1000, 3)} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Compare the previous PPTX extraction (two passes over the top level shapes, every picture base64 encoded on
+every slide) with the single pass engine in PptxProcessor, sequential and over the process pool.
+
+    python -m benchmarks.pptx_benchmark --slides 300
+"""
+import io
+import time
+import base64
+import asyncio
+import argparse
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+from app.processors import pptx_processor
+from app.processors.pptx_processor import PptxProcessor, extract_slides
+from .corpus import build_pptx
+
+
+def legacy_extract(content: bytes) -> list:
+    prs = Presentation(io.BytesIO(content))
+    slides = []
+    for slide_num, slide in enumerate(prs.slides, 1):
+        text, tables, images = [], [], []
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text.append(shape.text)
+            if shape.shape_type == MSO_SHAPE_TYPE.TABLE:
+                tables.append([[cell.text for cell in row.cells] for row in shape.table.rows])
+        for shape in slide.shapes:
+            if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+                images.append({"format": shape.image.ext, "data": base64.b64encode(shape.image.blob).decode("utf-8")})
+        slides.append({"page_number": slide_num, "text": "\n".join(text), "tables": tables, "images": images})
+    return slides
+
+
+def summarize(slides: list) -> str:
+    images = [image for slide in slides for image in slide["images"]]
+    inlined = sum(len(image.get("data", "")) for image in images)
+    chars = sum(len(slide["text"]) + len(slide.get("notes", "")) for slide in slides)
+    return f"{len(slides)} slides, {len(images)} images, {round(inlined / 2 ** 20, 2)} MB inlined, {chars} text chars"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slides", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = build_pptx(args.slides)
+    print(f"generated {args.slides} slide pptx: {round(len(content) / (1024 * 1024), 2)} MB, "
+          f"{pptx_processor.PPTX_MAX_WORKERS} pool workers")
+
+    processor = PptxProcessor()
+    # start the pool outside the measurement, a server pays this once per process
+    pptx_processor.PPTX_PARALLEL_MIN_SLIDES = 1
+    asyncio.run(processor.process(build_pptx(8), "warmup.pptx"))
+
+    for name, run in (
+        ("legacy", lambda: legacy_extract(content)),
+        ("engine", lambda: extract_slides(content)),
+        ("parallel", lambda: asyncio.run(processor.process(content, "benchmark.pptx"))["pages"]),
+    ):
+        timings = []
+        slides = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            slides = run()
+            timings.append(time.perf_counter() - started)
+        print(f"{name:>9}: best {round(min(timings) * 1000, 1)} ms, {summarize(slides)}")
+    if processor.pool:
+        processor.pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Size and serialization time of the upload response: the previous contract (full processing result per item,
+fastapi's jsonable_encoder plus the stdlib encoder) against the slim default and include=pages over orjson.
+
+    python -m benchmarks.response_benchmark
+"""
+import gzip
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api.responses import APIResponse
+from app.services.ingest.ingest import new_source, upload_result
+from app.models.source import Source
+from .corpus import get_file
+from .run import make_processor
+
+# processor kind, corpus file, source type
+UPLOADS = [("pdf", "images.pdf", "pdf"), ("docx", "large.docx", "docx"), ("pptx", "large.pptx", "pptx")]
+
+
+def timed(func, repeat: int):
+    timings = []
+    output = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func()
+        timings.append(time.perf_counter() - started)
+    return output, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_items, sources, processing_results = [], [], []
+    for kind, corpus_file, file_type in UPLOADS:
+        with open(get_file(corpus_file), "rb") as corpus_fp:
+            processing_result = asyncio.run(make_processor(kind).process(corpus_fp.read(), corpus_file))
+        legacy_items.append({
+            "filename": corpus_file,
+            "page_count": processing_result.get("page_count", 0),
+            "processing_result": processing_result
+        })
+        sources.append(new_source(Source.document(
+            user_id="benchmark", workspace_id="benchmark", name=corpus_file, type=file_type, size=0,
+            page_count=processing_result.get("page_count", 0), pages=processing_result.get("pages", []),
+            created_at=datetime.utcnow()
+        )))
+        processing_results.append(processing_result)
+
+    variants = {
+        "legacy": lambda: json.dumps(jsonable_encoder({"message": "ok", "data": legacy_items})).encode("utf-8"),
+        "slim": lambda: APIResponse({"message": "ok", "data": [
+            upload_result(source, result) for source, result in zip(sources, processing_results)
+        ]}).body,
+        "include=pages": lambda: APIResponse({"message": "ok", "data": [
+            upload_result(source, result, include_pages=True) for source, result in zip(sources, processing_results)
+        ]}).body,
+    }
+    print(f"{'response':<15}{'serialize ms':>14}{'bytes':>14}{'gzip bytes':>14}")
+    for name, serialize in variants.items():
+        body, seconds = timed(serialize, args.repeat)
+        print(f"{name:<15}{round(seconds * 1000, 2):>14}{len(body):>14}{len(gzip.compress(body, 6)):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Latency and recall of the workspace vector index. Vectors are drawn around random cluster centres (closer
+to real embeddings than uniform noise), recall@k is measured against exact float32 search.
+
+    python -m benchmarks.retrieval_benchmark --vectors 100000 --queries 256 --k 10
+"""
+import time
+import random
+import argparse
+
+import numpy as np
+
+from app.services.retrieval.embedders import HashingEmbedder, normalize
+from app.services.retrieval.vector_index import VectorIndex
+from .corpus import paragraph
+
+
+def clustered_vectors(rng: np.random.Generator, count: int, dimension: int, clusters: int) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    noise = rng.standard_normal((count, dimension)).astype(np.float32) * 0.6
+    return normalize(centres[rng.integers(0, clusters, count)] + noise)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def recall(results, truth: np.ndarray) -> float:
+    hits = 0
+    for found, expected in zip(results, truth):
+        hits += len({entry["row"] for entry in found} & set(expected.tolist()))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", default="4,8,16")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vectors = clustered_vectors(rng, args.vectors, args.dimension, clusters=max(args.vectors // 500, 8))
+    queries = clustered_vectors(rng, args.queries, args.dimension, clusters=max(args.queries // 8, 1))
+    truth = exact_top_k(vectors, queries, args.k)
+    metadata = [{"source_id": f"source_{row // 200}", "row": row} for row in range(args.vectors)]
+    print(f"{args.vectors} x {args.dimension} vectors, {args.queries} queries, k={args.k}")
+    print(f"{'variant':<18}{'build s':>10}{'MB':>8}{'batch ms':>10}{'ms/query':>10}{'recall':>8}")
+
+    variants = [(dtype, None) for dtype in ("float16", "int8")]
+    variants += [("int8", int(probes)) for probes in args.probes.split(",")]
+    built = {}
+    for dtype, probes in variants:
+        ivf = probes is not None
+        if (dtype, ivf) not in built:
+            index = VectorIndex(args.dimension, dtype)
+            started = time.perf_counter()
+            for start in range(0, args.vectors, 10_000):
+                index.add(vectors[start:start + 10_000], metadata[start:start + 10_000])
+            if ivf and index.centroids is None:
+                index.train_ivf()
+            elif not ivf and index.centroids is not None:
+                # large runs cross IVF_MIN_VECTORS, the exact variants must stay brute force
+                index.centroids = None
+            built[(dtype, ivf)] = (index, time.perf_counter() - started)
+        index, build_seconds = built[(dtype, ivf)]
+
+        started = time.perf_counter()
+        results = index.search(queries, args.k, probes=probes or 0)
+        batch_ms = (time.perf_counter() - started) * 1000
+        name = f"{dtype}" + (f" ivf/{probes}" if ivf else "")
+        print(f"{name:<18}{round(build_seconds, 2):>10}{round(index.nbytes / 2 ** 20, 1):>8}"
+              f"{round(batch_ms, 1):>10}{round(batch_ms / args.queries, 3):>10}{round(recall(results, truth), 3):>8}")
+
+    # end to end cost of the default embedder at ingest
+    embedder = HashingEmbedder(args.dimension)
+    texts = [paragraph(random.Random(seed), 8) for seed in range(200)]
+    started = time.perf_counter()
+    embedder.embed(texts)
+    elapsed = time.perf_counter() - started
+    print(f"hashing embedder: {round(len(texts) / elapsed, 1)} chunks/s for paragraph sized chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Processor benchmark suite. Every case runs in a fresh process against a file of the synthetic corpus and
+reports wall time, pages/sec, MB/sec and peak RSS. Results are compared with a saved JSON baseline and the
+run fails when a case gets slower (or bigger) than the baseline by more than the threshold.
+
+    python -m benchmarks.run                      # run everything, compare with benchmarks/baseline.json
+    python -m benchmarks.run --cases pdf_tables,docx_large --repeat 5
+    python -m benchmarks.run --save-baseline      # record the current numbers as the new baseline
+
+Everything runs offline: URL cases are served from a local http server and LLM clients are stubbed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import threading
+import multiprocessing
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import Dict, List
+
+# the llm backed processors refuse to start without keys, the clients are replaced by stubs anyway
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ELEVENLABS_API_KEY", "offline-benchmark")
+
+from . import corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+COMPARED_METRICS = ("wall_seconds", "peak_rss_mb")
+
+# case name -> (processor, corpus file)
+CASES = {
+    "pdf_text": ("pdf", "text.pdf"),
+    "pdf_tables": ("pdf", "tables.pdf"),
+    "pdf_images": ("pdf", "images.pdf"),
+    "docx_large": ("docx", "large.docx"),
+    "pptx_large": ("pptx", "large.pptx"),
+    "csv_tall": ("csv", "tall.csv"),
+    "csv_wide": ("csv", "wide.csv"),
+    "xlsx_tall": ("xlsx", "tall.xlsx"),
+    "xlsx_wide": ("xlsx", "wide.xlsx"),
+    "txt_large": ("txt", "large.txt"),
+    "url_page": ("url", "page.html"),
+    "image_batch": ("image_batch", None),
+}
+
+
+def make_processor(kind: str):
+    if kind == "pdf":
+        from app.processors.pdf_processor import PDFProcessor
+        return PDFProcessor()
+    if kind == "docx":
+        from app.processors.docx_processor import DocxProcessor
+        return DocxProcessor()
+    if kind == "pptx":
+        from app.processors.pptx_processor import PptxProcessor
+        return PptxProcessor()
+    if kind == "csv":
+        from app.processors.csv_processor import CSVProcessor
+        return CSVProcessor()
+    if kind == "xlsx":
+        from app.processors.xlsx_processor import XLSXProcessor
+        return XLSXProcessor()
+    if kind == "txt":
+        from app.processors.text_processor import TextProcessor
+        return TextProcessor()
+    if kind == "url":
+        from app.processors.url_processor import URLProcessor
+        return URLProcessor()
+    if kind == "image_batch":
+        from app.processors.image_processor import ImageProcessor
+        from .stubs import StubGeminiClient
+        processor = ImageProcessor()
+        processor.client = StubGeminiClient()
+        return processor
+    raise ValueError(f"Unknown processor kind: {kind}")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def serve_corpus() -> ThreadingHTTPServer:
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=corpus.CORPUS_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_case(name: str) -> Dict:
+    """
+    Runs inside a fresh process so that peak RSS belongs to this case only.
+    """
+    kind, corpus_file = CASES[name]
+    processor = make_processor(kind)
+    server = None
+
+    if kind == "url":
+        server = serve_corpus()
+        url = f"http://127.0.0.1:{server.server_address[1]}/{corpus_file}"
+        size = os.path.getsize(corpus.get_file(corpus_file))
+        run = lambda: processor.process(url, url)
+    elif kind == "image_batch":
+        images = [(corpus.png_bytes(random.Random(seed), (1600, 1200)), f"note_{seed}.png") for seed in range(40)]
+        size = sum(len(content) for content, _ in images)
+        run = lambda: processor.process_batch(images)
+    else:
+        with open(corpus.get_file(corpus_file), "rb") as corpus_fp:
+            content = corpus_fp.read()
+        size = len(content)
+        run = lambda: processor.process(content, corpus_file)
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    result = asyncio.run(run())
+    wall = time.perf_counter() - started
+    if server:
+        server.shutdown()
+
+    results = result if isinstance(result, list) else [result]
+    errors = [item["error"] for item in results if "error" in item]
+    image_stats = [item["image_stats"] for item in results if item.get("image_stats")]
+    pages = sum(item.get("page_count", 0) for item in results)
+    return {
+        "wall_seconds": round(wall, 4),
+        "pages": pages,
+        "pages_per_second": round(pages / wall, 2) if wall else 0,
+        "input_mb": round(size / (1024 * 1024), 3),
+        "mb_per_second": round(size / (1024 * 1024) / wall, 3) if wall else 0,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_mb": rss_before,
+        "image_mb_in": round(sum(stats["bytes_in"] for stats in image_stats) / (1024 * 1024), 3),
+        "image_mb_out": round(sum(stats["bytes_out"] for stats in image_stats) / (1024 * 1024), 3),
+        "errors": errors
+    }
+
+
+def measure(name: str, repeat: int) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ctx.Pool(1) as pool:
+            runs.append(pool.apply(run_case, (name,)))
+    best = min(runs, key=lambda run: run["wall_seconds"])
+    best["peak_rss_mb"] = max(run["peak_rss_mb"] for run in runs)
+    return best
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in COMPARED_METRICS:
+            previous = baseline[name].get(metric)
+            if previous and result[metric] > previous * (1 + threshold):
+                regressions.append(
+                    f"{name}.{metric}: {result[metric]} vs baseline {previous} (+{round((result[metric] / previous - 1) * 100, 1)}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the file processors on a synthetic corpus")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma separated case names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="write the results of this run as json")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    # generate the corpus up front so that it is not part of any measurement
+    corpus.ensure_html_assets()
+    for name in names:
+        if CASES[name][1]:
+            corpus.get_file(CASES[name][1])
+
+    results = {}
+    print(f"{'case':<14}{'wall s':>10}{'pages':>8}{'pages/s':>10}{'MB/s':>10}{'peak MB':>10}{'img MB':>16}")
+    for name in names:
+        result = measure(name, args.repeat)
+        results[name] = result
+        print(f"{name:<14}{result['wall_seconds']:>10}{result['pages']:>8}{result['pages_per_second']:>10}"
+              f"{result['mb_per_second']:>10}{result['peak_rss_mb']:>10}"
+              f"{str(result['image_mb_in']) + ' -> ' + str(result['image_mb_out']):>16}")
+        for error in result["errors"]:
+            print(f"  error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline found, run with --save-baseline to record one")
+        return
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.threshold)
+    if regressions:
+        print("regressions over the allowed threshold:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+The production app with the database and auth taken out, for load tests of the serving setup: every request is
+the same test user, every workspace id is one of theirs, parsed sources are dropped instead of written and quotas
+always have room. Parsing, the middlewares and the response path are the real ones.
+
+    python -m app.serve --app benchmarks.serve_app:app --workers 4
+"""
+import os
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ELEVENLABS_API_KEY", "offline-benchmark")
+
+from app.main import app
+from app.api import dependencies
+from app.api.routers import onboarding
+from app.services.quota.quota import QUOTAS
+
+USER = {"id": "load-test-user", "email": "load-test@example.com"}
+
+
+async def current_user():
+    return USER
+
+
+async def drop_sources(sources, label):
+    return None
+
+
+async def unlimited(user_id, name, amount=1):
+    return 0
+
+
+async def any_workspace(user_id, workspace_id):
+    return None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # no indexes to create and no credentials to refresh
+    yield
+
+
+app.dependency_overrides[dependencies.get_current_user] = current_user
+app.router.lifespan_context = lifespan
+onboarding.insert_sources = drop_sources
+onboarding.require_workspace = any_workspace
+QUOTAS.consume = unlimited
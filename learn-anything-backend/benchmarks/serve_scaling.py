@@ -0,0 +1,113 @@
+"""
+Upload throughput of `python -m app.serve` with 1, 2, ... N workers. Each worker count gets its own server on a
+free port (benchmarks.serve_app, no database), is sent the same text upload from `--concurrency` clients for
+`--seconds` and is then stopped with SIGTERM. Any upload that is not answered with a 200 fails the benchmark.
+
+    python -m benchmarks.serve_scaling --max-workers 4 --seconds 10
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import subprocess
+
+import aiohttp
+
+from .corpus import get_file
+
+UPLOAD = "large.txt"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_live(session: aiohttp.ClientSession, base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/live") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not come up within {timeout}s")
+
+
+async def upload_loop(session: aiohttp.ClientSession, base_url: str, payload: bytes, deadline: float, stats):
+    while time.monotonic() < deadline:
+        form = aiohttp.FormData()
+        form.add_field("workspace_id", "load-test")
+        form.add_field("files", payload, filename=UPLOAD, content_type="text/plain")
+        started = time.perf_counter()
+        async with session.post(f"{base_url}/onboarding/upload-files", data=form) as response:
+            await response.read()
+            stats["latencies"].append(time.perf_counter() - started)
+            if response.status == 200:
+                stats["ok"] += 1
+            else:
+                stats["failed"][response.status] = stats["failed"].get(response.status, 0) + 1
+
+
+async def measure(base_url: str, payload: bytes, concurrency: int, seconds: float):
+    stats = {"ok": 0, "failed": {}, "latencies": []}
+    async with aiohttp.ClientSession() as session:
+        await wait_until_live(session, base_url)
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            upload_loop(session, base_url, payload, deadline, stats) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    latencies = sorted(stats["latencies"]) or [0.0]
+    return {
+        "requests_per_second": round(stats["ok"] / elapsed, 1),
+        "failed": stats["failed"],
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1)
+    }
+
+
+def run(workers: int, payload: bytes, concurrency: int, seconds: float):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--app", "benchmarks.serve_app:app",
+         "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        env={**os.environ, "LOG_LEVEL": "WARNING"}
+    )
+    try:
+        return asyncio.run(measure(f"http://127.0.0.1:{port}", payload, concurrency, seconds))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(get_file(UPLOAD), "rb") as upload_file:
+        payload = upload_file.read()
+    print(f"{os.cpu_count()} cores, {args.concurrency} concurrent clients, {args.seconds}s per run")
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        result = run(workers, payload, args.concurrency, args.seconds)
+        # a run with rejected uploads measures the error path, its throughput says nothing about the workers
+        if result["failed"] or not result["requests_per_second"]:
+            sys.exit(f"workers={workers} failed, non-200 responses by status: {result['failed']}")
+        baseline = baseline or result["requests_per_second"]
+        print(f"workers={workers} {result} speedup={round(result['requests_per_second'] / baseline, 2)}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Offline stand-ins for the LLM clients so the processors around them can be benchmarked without network access.
+"""
+import time
+from types import SimpleNamespace
+
+from app.processors.image_processor import ImageResponse, BatchImageResponse
+
+
+class StubGeminiModels:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config):
+        if self.latency:
+            time.sleep(self.latency)
+        image = ImageResponse(text="stub text", tables=[], description="stub description", type="document")
+        if config.response_schema is BatchImageResponse:
+            count = sum(1 for part in contents if not isinstance(part, str))
+            return SimpleNamespace(parsed=BatchImageResponse(images=[image] * count))
+        return SimpleNamespace(parsed=image)
+
+
+class StubGeminiClient:
+    def __init__(self, latency: float = 0.0):
+        self.models = StubGeminiModels(latency)
@@ -0,0 +1,5 @@
+import os
+
+# the provider clients are built at import time and refuse to start without a key, no request ever reaches them
+for key in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "GEMINI_API_KEY", "EXA_API_KEY", "ELEVENLABS_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "offline-test")
@@ -0,0 +1,265 @@
+"""
+In-memory stand-in for the motor database, with the subset of queries and updates the services use. Every call
+runs to completion before it returns, like a single document write in mongo, so concurrent tasks interleave
+between calls only. Unique indexes are enforced, an upsert that runs into one raises DuplicateKeyError.
+
+    db = FakeDatabase()
+    monkeypatch.setattr(quota, "db", db)
+"""
+import copy
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+MISSING = object()
+
+
+def get_field(document: Dict, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def set_field(document: Dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def unset_field(document: Dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def matches_condition(value, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        if isinstance(value, list) and not isinstance(condition, list):
+            return condition in value
+        return value is not MISSING and value == condition
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            if (value is not MISSING) != bool(operand):
+                return False
+        elif operator == "$in":
+            values = value if isinstance(value, list) else [value]
+            if not any(item in operand for item in values if item is not MISSING):
+                return False
+        elif operator == "$ne":
+            if value is not MISSING and value == operand:
+                return False
+        elif operator in ("$lt", "$lte", "$gt", "$gte"):
+            if value is MISSING or value is None:
+                return False
+            if not {"$lt": value < operand, "$lte": value <= operand,
+                    "$gt": value > operand, "$gte": value >= operand}[operator]:
+                return False
+        elif operator == "$type":
+            if operand != "string" or not isinstance(value, str):
+                return False
+        else:
+            raise NotImplementedError(operator)
+    return True
+
+
+def matches(document: Dict, query: Optional[Dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif not matches_condition(get_field(document, key), condition):
+            return False
+    return True
+
+
+def evaluate(document: Dict, expression):
+    # aggregation expressions of pipeline updates
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_field(document, expression[1:])
+        return None if value is MISSING else value
+    if isinstance(expression, dict):
+        (operator, operands), = expression.items()
+        values = [evaluate(document, operand) for operand in operands]
+        if operator == "$max":
+            return max(values)
+        if operator == "$subtract":
+            return values[0] - values[1]
+        raise NotImplementedError(operator)
+    return expression
+
+
+def apply_update(document: Dict, update, inserted: bool):
+    if isinstance(update, list):
+        for stage in update:
+            for path, expression in stage["$set"].items():
+                set_field(document, path, evaluate(document, expression))
+        return
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                set_field(document, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserted:
+                    set_field(document, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                unset_field(document, path)
+            elif operator == "$inc":
+                current = get_field(document, path)
+                set_field(document, path, (0 if current is MISSING else current) + value)
+            else:
+                raise NotImplementedError(operator)
+
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    if any(value for key, value in projection.items() if key != "_id"):
+        kept = {key: document[key] for key, value in projection.items() if value and key in document}
+        if projection.get("_id", 1) and "_id" in document:
+            kept["_id"] = document["_id"]
+        return kept
+    return {key: value for key, value in document.items() if projection.get(key, 1)}
+
+
+class FakeCursor:
+    def __init__(self, documents: List[Dict]):
+        self.documents = documents
+
+    def sort(self, key: str, direction: int = 1):
+        self.documents.sort(key=lambda document: get_field(document, key), reverse=direction < 0)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for document in self.documents:
+            yield document
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        return self.documents[:length] if length else list(self.documents)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents: List[Dict] = []
+        self.unique_keys: List[List[str]] = []
+
+    async def create_index(self, keys, unique: bool = False, **kwargs):
+        if unique:
+            self.unique_keys.append([key for key, _ in keys])
+
+    def check_unique(self, document: Dict, replaces: Optional[Dict] = None):
+        for keys in self.unique_keys:
+            values = [get_field(document, key) for key in keys]
+            for other in self.documents:
+                if other is not replaces and [get_field(other, key) for key in keys] == values:
+                    raise DuplicateKeyError(f"duplicate key {dict(zip(keys, values))}")
+
+    def insert(self, document: Dict) -> Dict:
+        document = copy.deepcopy(document)
+        document.setdefault("_id", ObjectId())
+        self.check_unique(document)
+        self.documents.append(document)
+        return document
+
+    def upsert(self, query: Dict, update) -> Dict:
+        document = {}
+        for key, condition in query.items():
+            if not key.startswith("$") and not (isinstance(condition, dict) and any(
+                    operator.startswith("$") for operator in condition)):
+                set_field(document, key, copy.deepcopy(condition))
+        apply_update(document, update, inserted=True)
+        return self.insert(document)
+
+    def update(self, document: Dict, update):
+        updated = copy.deepcopy(document)
+        apply_update(updated, update, inserted=False)
+        self.check_unique(updated, replaces=document)
+        document.clear()
+        document.update(updated)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        for document in self.documents:
+            if matches(document, query):
+                return project(document, projection)
+        return None
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> FakeCursor:
+        return FakeCursor([project(document, projection) for document in self.documents if matches(document, query)])
+
+    async def count_documents(self, query: Dict) -> int:
+        return sum(1 for document in self.documents if matches(document, query))
+
+    async def insert_one(self, document: Dict):
+        document.setdefault("_id", ObjectId())
+        self.insert(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def insert_many(self, documents: List[Dict], ordered: bool = True):
+        for document in documents:
+            await self.insert_one(document)
+
+    async def bulk_write(self, operations, ordered: bool = True):
+        for operation in operations:
+            await self.insert_one(operation._doc)
+
+    async def find_one_and_update(self, query: Dict, update, upsert: bool = False, projection: Optional[Dict] = None,
+                                  return_document=ReturnDocument.BEFORE) -> Optional[Dict]:
+        for document in self.documents:
+            if matches(document, query):
+                before = project(document, projection)
+                self.update(document, update)
+                return project(document, projection) if return_document == ReturnDocument.AFTER else before
+        if upsert:
+            document = self.upsert(query, update)
+            return project(document, projection) if return_document == ReturnDocument.AFTER else None
+        return None
+
+    async def update_one(self, query: Dict, update, upsert: bool = False):
+        for document in self.documents:
+            if matches(document, query):
+                self.update(document, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        if upsert:
+            self.upsert(query, update)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    async def update_many(self, query: Dict, update):
+        selected = [document for document in self.documents if matches(document, query)]
+        for document in selected:
+            self.update(document, update)
+        return SimpleNamespace(matched_count=len(selected), modified_count=len(selected))
+
+    async def delete_many(self, query: Dict):
+        kept = [document for document in self.documents if not matches(document, query)]
+        deleted = len(self.documents) - len(kept)
+        self.documents[:] = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
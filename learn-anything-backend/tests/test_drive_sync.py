@@ -0,0 +1,163 @@
+import json
+import asyncio
+
+import pytest
+
+from app.processors.google_drive_processor import GoogleDriveProcessor
+from app.services.drive_sync import drive_sync
+from app.services.drive_sync.drive_sync import DriveSyncer, SyncInProgress, sync_drive, claim_sync, \
+    ensure_drive_sync_indexes, DRIVE_SYNC_COLLECTION
+from app.services.resilience import resilience
+from app.services.resilience.resilience import ProviderGuard
+from app.services.stubs.fake_drive import FakeDrive
+from tests.fake_mongo import FakeDatabase
+
+USER_ID = "user"
+WORKSPACE_ID = "workspace"
+CREDENTIALS = json.dumps({"client_id": "id", "client_secret": "secret", "refresh_token": "token"})
+
+
+class Workspace:
+    """
+    A drive with a root folder of notes and an archive sub folder, the workspace they sync into and what the
+    syncs wrote and deleted.
+    """
+    def __init__(self, monkeypatch):
+        self.db = FakeDatabase()
+        self.inserted = []
+        self.deleted = []
+        self.failing = set()
+        monkeypatch.setattr(drive_sync, "db", self.db)
+        monkeypatch.setattr(drive_sync, "insert_sources", self.insert_sources)
+        monkeypatch.setattr(drive_sync, "delete_sources", self.delete_sources)
+        # the process wide drive guard would rate limit the requests of every test together
+        monkeypatch.setitem(resilience.PROVIDER_GUARDS, "google_drive", ProviderGuard(
+            "google_drive", rate=1000, burst=1000, max_retries=0, failure_threshold=100, reset_timeout=30
+        ))
+        asyncio.run(ensure_drive_sync_indexes())
+
+        self.drive = FakeDrive()
+        self.root = self.drive.add_folder("course")
+        self.archive = self.drive.add_folder("archive", parents=[self.root])
+        self.notes = [
+            self.drive.add_file(f"notes_{number}.txt", f"lecture notes {number}".encode(), "text/plain", [self.root])
+            for number in range(5)
+        ]
+        self.archived = [
+            self.drive.add_file(f"old_{number}.txt", f"old notes {number}".encode(), "text/plain", [self.archive])
+            for number in range(2)
+        ]
+        self.processor = GoogleDriveProcessor(service_factory=lambda credentials: self.drive)
+        parse_file = self.processor.parse_file
+
+        async def failing_parse_file(service, file_metadata):
+            if file_metadata["id"] in self.failing:
+                raise ConnectionError("download interrupted")
+            return await parse_file(service, file_metadata)
+
+        self.processor.parse_file = failing_parse_file
+
+    async def insert_sources(self, sources, label):
+        self.inserted.extend(sources)
+
+    async def delete_sources(self, workspace_id, source_ids):
+        self.deleted.extend(source_ids)
+
+    def sync(self):
+        downloads = self.drive.downloads
+        outcome = asyncio.run(sync_drive(USER_ID, WORKSPACE_ID, [self.root], CREDENTIALS, processor=self.processor))
+        return outcome, self.drive.downloads - downloads
+
+    def tracked(self):
+        return self.db[DRIVE_SYNC_COLLECTION].documents[0]["files"]
+
+
+@pytest.fixture
+def workspace(monkeypatch):
+    return Workspace(monkeypatch)
+
+
+def test_first_sync_imports_the_whole_tree(workspace):
+    outcome, downloads = workspace.sync()
+
+    assert outcome["full_sync"]
+    assert outcome["parsed"] == downloads == 7
+    assert set(workspace.tracked()) == {*workspace.notes, *workspace.archived}
+    assert "lock" not in workspace.db[DRIVE_SYNC_COLLECTION].documents[0]
+
+
+def test_edits_cost_one_download_each(workspace):
+    workspace.sync()
+    replaced = {workspace.tracked()[file_id]["source_id"] for file_id in workspace.notes[:3]}
+    for file_id in workspace.notes[:3]:
+        workspace.drive.update_file(file_id, b"edited lecture notes")
+
+    outcome, downloads = workspace.sync()
+
+    assert not outcome["full_sync"]
+    assert outcome["parsed"] == downloads == 3
+    assert set(workspace.deleted) == replaced
+    assert {workspace.tracked()[file_id]["source_id"] for file_id in workspace.notes[:3]}.isdisjoint(replaced)
+
+
+def test_deleted_file_and_trashed_folder_are_removed(workspace):
+    workspace.sync()
+    gone = [workspace.notes[0], *workspace.archived]
+    gone_sources = {workspace.tracked()[file_id]["source_id"] for file_id in gone}
+    workspace.drive.delete_file(workspace.notes[0])
+    workspace.drive.trash_file(workspace.archive)
+
+    outcome, downloads = workspace.sync()
+
+    assert downloads == 0
+    assert outcome["removed"] == 3
+    assert set(workspace.deleted) == gone_sources
+    assert set(workspace.tracked()) == set(workspace.notes[1:])
+
+
+def test_failed_reparse_keeps_the_source_and_is_retried(workspace):
+    workspace.sync()
+    file_id = workspace.notes[0]
+    previous_source = workspace.tracked()[file_id]["source_id"]
+    workspace.drive.update_file(file_id, b"edited lecture notes")
+    workspace.failing.add(file_id)
+
+    outcome, _ = workspace.sync()
+
+    assert outcome["parsed"] == 1
+    assert outcome["results"][0]["errors"]
+    assert workspace.deleted == []
+    assert workspace.tracked()[file_id]["source_id"] == previous_source
+    assert workspace.tracked()[file_id]["failed"]
+
+    # no change of its own in the feed, the failed fingerprint brings it back
+    workspace.failing.clear()
+    outcome, downloads = workspace.sync()
+
+    assert outcome["parsed"] == downloads == 1
+    assert workspace.deleted == [previous_source]
+    assert "failed" not in workspace.tracked()[file_id]
+    assert workspace.tracked()[file_id]["source_id"] != previous_source
+
+
+def test_full_rewalk_skips_unchanged_files(workspace):
+    workspace.sync()
+    downloads = workspace.drive.downloads
+    syncer = DriveSyncer(workspace.drive, workspace.processor)
+
+    outcome = asyncio.run(syncer.full_sync([workspace.root], workspace.tracked()))
+
+    assert outcome["parsed"] == []
+    assert outcome["removed"] == []
+    assert workspace.drive.downloads == downloads
+
+
+def test_concurrent_sync_is_rejected(workspace):
+    workspace.sync()
+    asyncio.run(claim_sync(USER_ID, WORKSPACE_ID, "other-sync"))
+
+    with pytest.raises(SyncInProgress):
+        workspace.sync()
+
+    # the rejected sync does not release the lock it never held
+    assert workspace.db[DRIVE_SYNC_COLLECTION].documents[0]["lock"]["id"] == "other-sync"
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from app.services.quota import quota
+from app.services.quota.quota import QuotaService, QuotaExceeded, ensure_quota_indexes
+from tests.fake_mongo import FakeDatabase
+
+LIMITS = {
+    "queries": {"limit": 3, "window_seconds": 60},
+    "storage": {"limit": 100},
+    "imports": {"limit": 1, "window_seconds": 3600, "rate": 0.001, "burst": 2},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(quota, "db", FakeDatabase())
+    asyncio.run(ensure_quota_indexes())
+    return FakeClock()
+
+
+def service(clock: FakeClock) -> QuotaService:
+    # one per process, they share the counters in mongo but not their caches and buckets
+    return QuotaService(LIMITS, cache_seconds=10, clock=clock)
+
+
+def test_rejects_at_the_limit(clock):
+    quotas = service(clock)
+
+    assert [asyncio.run(quotas.consume("user", "queries")) for _ in range(3)] == [1, 2, 3]
+    with pytest.raises(QuotaExceeded) as rejected:
+        asyncio.run(service(clock).consume("user", "queries"))
+    assert rejected.value.used == 3
+    assert 0 < rejected.value.retry_after <= 60
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.consume("other", "storage", 101))
+    assert asyncio.run(quotas.consume("other", "queries")) == 1
+
+
+def test_window_resets(clock):
+    quotas = service(clock)
+    for _ in range(3):
+        asyncio.run(quotas.consume("user", "queries"))
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.consume("user", "queries"))
+
+    clock.now += 60
+
+    assert asyncio.run(quotas.consume("user", "queries")) == 1
+
+
+def test_release_never_goes_below_zero(clock):
+    quotas = service(clock)
+    asyncio.run(quotas.consume("user", "storage", 30))
+
+    asyncio.run(quotas.release("user", "storage", 50))
+
+    assert asyncio.run(quotas.usage_of("user"))["storage"]["used"] == 0
+    assert asyncio.run(quotas.consume("user", "storage", 100)) == 100
+
+
+def test_cached_rejection_expires(clock):
+    quotas, other_process = service(clock), service(clock)
+    asyncio.run(quotas.consume("user", "storage", 100))
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.consume("user", "storage", 10))
+    asyncio.run(other_process.release("user", "storage", 50))
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.consume("user", "storage", 10))
+    assert quotas.stats["cache_rejections"] == 2
+
+    clock.now += 11
+
+    assert asyncio.run(quotas.consume("user", "storage", 10)) == 60
+
+
+def test_rejected_requests_do_not_use_up_the_rate(clock):
+    quotas, other_process = service(clock), service(clock)
+    asyncio.run(other_process.consume("user", "imports"))
+    # past the cache, every attempt reaches the counter and is turned down there
+    for _ in range(3):
+        with pytest.raises(QuotaExceeded):
+            asyncio.run(quotas.consume("user", "imports"))
+        clock.now += 11
+    asyncio.run(other_process.release("user", "imports", 1))
+
+    assert asyncio.run(quotas.consume("user", "imports")) == 1
+    assert quotas.stats["throttled"] == 0
+
+
+def test_charge_goes_past_the_limit(clock):
+    quotas = service(clock)
+    asyncio.run(quotas.consume("user", "queries"))
+
+    assert asyncio.run(quotas.charge("user", "queries", 5)) == 6
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.consume("user", "queries"))
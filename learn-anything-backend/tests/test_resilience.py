@@ -0,0 +1,199 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from app.services.resilience import resilience
+from app.services.resilience.resilience import ProviderGuard, CircuitBreaker, CircuitOpenError, get_guard, \
+    is_retryable
+from app.services.resilience.fault_injection import FaultInjector, InjectedFault
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_guard(clock: FakeClock, max_retries: int = 3, failure_threshold: int = 3, reset_timeout: float = 30):
+    return ProviderGuard(
+        "test", rate=1000, burst=1000, max_retries=max_retries, failure_threshold=failure_threshold,
+        reset_timeout=reset_timeout, base_delay=1, max_delay=10, clock=clock, sleep=clock.sleep, rng=lambda: 1.0
+    )
+
+
+def test_retries_transient_failures_with_backoff():
+    clock = FakeClock()
+    guard = make_guard(clock, failure_threshold=10)
+    provider = FaultInjector(lambda: "ok", fail_first=2)
+
+    assert asyncio.run(guard.call(provider)) == "ok"
+    assert provider.calls == 3
+    assert clock.sleeps == [1, 2]
+    assert guard.stats["retries"] == 2
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_honours_retry_after():
+    clock = FakeClock()
+    guard = make_guard(clock, failure_threshold=10)
+    provider = FaultInjector(lambda: "ok", fail_first=1, status_code=429, retry_after=7)
+
+    assert asyncio.run(guard.call(provider)) == "ok"
+    assert clock.sleeps == [7]
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    guard = make_guard(clock, max_retries=2, failure_threshold=10)
+    provider = FaultInjector(error_rate=1.0)
+
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(provider))
+    assert provider.calls == 3
+
+
+def test_does_not_retry_client_errors():
+    clock = FakeClock()
+    guard = make_guard(clock, failure_threshold=1)
+    provider = FaultInjector(error_rate=1.0, status_code=400)
+
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(provider))
+    assert provider.calls == 1
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("connection refused"),
+    httpx.ReadTimeout("timed out"),
+    requests.ConnectionError("connection reset"),
+    requests.Timeout("timed out"),
+])
+def test_sdk_network_errors_are_retried(error):
+    clock = FakeClock()
+    guard = make_guard(clock, failure_threshold=10)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return "ok"
+
+    assert is_retryable(error)
+    assert asyncio.run(guard.call(flaky)) == "ok"
+    assert len(calls) == 2
+
+
+def test_opens_after_consecutive_failures_and_rejects():
+    clock = FakeClock()
+    guard = make_guard(clock, max_retries=5, failure_threshold=3)
+    provider = FaultInjector(error_rate=1.0)
+
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(provider))
+    assert provider.calls == 3
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(guard.call(provider))
+    assert provider.calls == 3
+
+
+def open_guard(clock: FakeClock) -> ProviderGuard:
+    guard = make_guard(clock, max_retries=0, failure_threshold=1, reset_timeout=30)
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(FaultInjector(error_rate=1.0)))
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    clock.now += 30
+    return guard
+
+
+def test_half_open_success_closes():
+    clock = FakeClock()
+    guard = open_guard(clock)
+
+    assert asyncio.run(guard.call(FaultInjector(lambda: "ok"))) == "ok"
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_failure_reopens():
+    clock = FakeClock()
+    guard = open_guard(clock)
+
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(FaultInjector(error_rate=1.0)))
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(guard.call(FaultInjector(lambda: "ok")))
+
+
+def test_half_open_allows_a_single_trial():
+    clock = FakeClock()
+    guard = open_guard(clock)
+
+    async def concurrent_calls():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        trial = asyncio.ensure_future(guard.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await guard.call(FaultInjector(lambda: "ok"))
+        release.set()
+        return await trial
+
+    assert asyncio.run(concurrent_calls()) == "ok"
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_error_in_half_open_releases_the_trial_without_closing():
+    clock = FakeClock()
+    guard = open_guard(clock)
+
+    with pytest.raises(InjectedFault):
+        asyncio.run(guard.call(FaultInjector(error_rate=1.0, status_code=404)))
+    assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+    assert asyncio.run(guard.call(FaultInjector(lambda: "ok"))) == "ok"
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_trial_releases_the_slot():
+    clock = FakeClock()
+    guard = open_guard(clock)
+
+    async def cancel_trial():
+        trial = asyncio.ensure_future(guard.call(asyncio.Event().wait))
+        await asyncio.sleep(0)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_trial())
+    assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+    assert asyncio.run(guard.call(FaultInjector(lambda: "ok"))) == "ok"
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_web_guards_are_per_host(monkeypatch):
+    monkeypatch.setattr(resilience, "HOST_GUARDS", resilience.OrderedDict())
+    monkeypatch.setattr(resilience, "HOST_GUARDS_MAX", 2)
+
+    first = get_guard("web:a.example")
+    assert get_guard("web:a.example") is first
+    assert get_guard("web:b.example") is not first
+    get_guard("web:c.example")
+    assert "web:a.example" not in resilience.HOST_GUARDS
+    with pytest.raises(KeyError):
+        get_guard("web")
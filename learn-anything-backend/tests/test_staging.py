@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.services.discover import staging
+from app.services.discover.staging import stage_discovered, promote_staged, STAGING_COLLECTION
+from tests.fake_mongo import FakeDatabase
+
+USER_ID = "user"
+WORKSPACE_ID = "workspace"
+
+
+def discovered(*urls):
+    # one discover category, the way discover_additional_web_sources returns them
+    sources = [{"url": url, "title": url, "text": f"text of {url}"} for url in urls]
+    return [{"usage": {"queries": 1}, "sources": sources}]
+
+
+class Workspace:
+    def __init__(self, monkeypatch):
+        self.db = FakeDatabase()
+        monkeypatch.setattr(staging, "db", self.db)
+        monkeypatch.setattr(staging, "insert_sources", self.insert_sources)
+
+    async def insert_sources(self, sources, label):
+        # a real insert awaits mongo several times, let a concurrent finalize run in between
+        await asyncio.sleep(0)
+        await self.db["Sources"].insert_many([dict(source) for source in sources])
+
+    def stage(self, *urls):
+        return asyncio.run(stage_discovered(USER_ID, WORKSPACE_ID, discovered(*urls)))
+
+    def staged_urls(self):
+        return sorted(document["url"] for document in self.db[STAGING_COLLECTION].documents)
+
+    def source_urls(self):
+        return sorted(document["url"] for document in self.db["Sources"].documents)
+
+
+@pytest.fixture
+def workspace(monkeypatch):
+    return Workspace(monkeypatch)
+
+
+def ids_of(staged, *urls):
+    return [source_id for pair in staged for source_id, url in pair.items() if url in urls]
+
+
+def test_promotes_only_the_selected_sources_and_drops_the_batch(workspace):
+    batch_id, staged = workspace.stage("https://a.example", "https://b.example", "https://c.example")
+
+    promoted = asyncio.run(promote_staged(
+        USER_ID, WORKSPACE_ID, batch_id, ids_of(staged, "https://a.example", "https://c.example")
+    ))
+
+    assert sorted(source["url"] for source in promoted) == ["https://a.example", "https://c.example"]
+    assert workspace.source_urls() == ["https://a.example", "https://c.example"]
+    assert workspace.staged_urls() == []
+
+
+def test_skips_urls_already_in_the_workspace(workspace):
+    asyncio.run(workspace.db["Sources"].insert_one({"workspace_id": WORKSPACE_ID, "url": "https://a.example"}))
+    batch_id, staged = workspace.stage("https://a.example", "https://b.example", "https://b.example")
+    assert [url for pair in staged for url in pair.values()] == ["https://b.example"]
+
+    # added by another batch between discover and finalize
+    asyncio.run(workspace.db["Sources"].insert_one({"workspace_id": WORKSPACE_ID, "url": "https://b.example"}))
+    promoted = asyncio.run(promote_staged(USER_ID, WORKSPACE_ID, batch_id, ids_of(staged, "https://b.example")))
+
+    assert promoted == []
+    assert workspace.source_urls() == ["https://a.example", "https://b.example"]
+
+
+def test_concurrent_finalize_promotes_once(workspace):
+    batch_id, staged = workspace.stage("https://a.example", "https://b.example")
+    source_ids = ids_of(staged, "https://a.example", "https://b.example")
+
+    async def finalize_twice():
+        return await asyncio.gather(
+            promote_staged(USER_ID, WORKSPACE_ID, batch_id, source_ids),
+            promote_staged(USER_ID, WORKSPACE_ID, batch_id, source_ids)
+        )
+
+    first, second = asyncio.run(finalize_twice())
+
+    assert sorted(source["url"] for source in first + second) == ["https://a.example", "https://b.example"]
+    assert workspace.source_urls() == ["https://a.example", "https://b.example"]
+    assert workspace.staged_urls() == []
+
+
+def test_failed_promotion_can_be_retried(workspace, monkeypatch):
+    batch_id, staged = workspace.stage("https://a.example")
+    source_ids = ids_of(staged, "https://a.example")
+
+    async def failing_insert(sources, label):
+        raise ConnectionError("mongo went away")
+
+    monkeypatch.setattr(staging, "insert_sources", failing_insert)
+    with pytest.raises(ConnectionError):
+        asyncio.run(promote_staged(USER_ID, WORKSPACE_ID, batch_id, source_ids))
+    monkeypatch.setattr(staging, "insert_sources", workspace.insert_sources)
+
+    assert workspace.staged_urls() == ["https://a.example"]
+    assert len(asyncio.run(promote_staged(USER_ID, WORKSPACE_ID, batch_id, source_ids))) == 1
+    assert workspace.source_urls() == ["https://a.example"]